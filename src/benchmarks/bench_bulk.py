@@ -0,0 +1,134 @@
+# Compares building a diagram one command at a time with the bulk API
+#
+# Usage (from the root folder):
+#   python src/benchmarks/bench_bulk.py [class counts...]
+#
+# The per-item path runs a command for every class, field, method and
+# relationship and pushes each one, the way the CLI and GUI do. The bulk path
+# runs a single CommandBulkAdd. A subscriber stands in for the GUI: it builds
+# the texts of every box and line that changed, the way the canvas redraws
+# them, without needing a display. Each path is timed REPEATS times and the
+# fastest run is reported.
+import os
+import sys
+import gc
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from model.editor_model import Editor
+from model.event_model import Change
+from model.relationship_model import Type
+from model.command_model import *
+from controller.editor_controller import EditorController
+from view.ui_interface import UI
+
+FIELDS_PER_CLASS = 5
+METHODS_PER_CLASS = 3
+PARAMS_PER_METHOD = 2
+REPEATS = 5
+
+def specs(count):
+    classes = []
+    for i in range(count):
+        fields = [f'field{j}' for j in range(FIELDS_PER_CLASS)]
+        methods = [(f'method{j}', [f'param{k}' for k in range(PARAMS_PER_METHOD)]) for j in range(METHODS_PER_CLASS)]
+        classes.append((f'Class{i}', fields, methods))
+    relationships = [(f'Class{i}', f'Class{i + 1}', Type.Aggregate) for i in range(count - 1)]
+    return classes, relationships
+
+# Redraws the texts of the boxes and lines named by each list of events
+class Canvas:
+    def __init__(self, editor):
+        self.editor = editor
+        self.boxes = {}
+        self.lines = {}
+        self.refreshes = 0
+
+    def __len__(self):
+        return self.refreshes
+
+    def onEditorChanges(self, events):
+        self.refreshes += 1
+        classes = self.editor.classes
+        relationships = self.editor.relationships
+        # After a Reset, everything is redrawn from the model
+        if events[0].kind == Change.Reset:
+            self.boxes = {clazz.id: self.boxTexts(clazz) for clazz in classes.values()}
+            self.lines = {key: str(relationships.byIds(*key)) for key in relationships.idKeys()}
+            return
+        for event in events:
+            if event.other_id is not None:
+                rel = relationships.byIds(event.class_id, event.other_id)
+                if rel is not None:
+                    self.lines[(event.class_id, event.other_id)] = str(rel)
+                continue
+            clazz = classes.byId(event.class_id)
+            if clazz is not None:
+                self.boxes[event.class_id] = self.boxTexts(clazz)
+
+    def boxTexts(self, clazz):
+        texts = [clazz.name]
+        texts += [f'Field: {field.name}' for field in clazz.fields]
+        texts += [f'Method: {method.name}({", ".join(method.params)})' for method in clazz.methods]
+        return texts
+
+def controller():
+    ctrl = EditorController(UI(), Editor())
+    canvas = Canvas(ctrl.editor)
+    ctrl.editor.subscribe(canvas.onEditorChanges)
+    return ctrl, canvas
+
+# Runs and pushes a command, and returns how many commands ran
+def run(ctrl, cmd):
+    if cmd.execute(ctrl):
+        ctrl.pushCmd(cmd)
+        return 1
+    return 0
+
+def perItem(classes, relationships):
+    ctrl, refreshes = controller()
+    commands = 0
+    start = time.perf_counter()
+    for name, fields, methods in classes:
+        commands += run(ctrl, CommandClassAdd(name))
+        for field in fields:
+            commands += run(ctrl, CommandFieldAdd(name, field))
+        for method, params in methods:
+            commands += run(ctrl, CommandMethodAdd(name, method, params))
+    for src, dst, typ in relationships:
+        commands += run(ctrl, CommandRelationshipAdd(src, dst, typ))
+    return time.perf_counter() - start, ctrl, refreshes, commands
+
+def bulk(classes, relationships):
+    ctrl, refreshes = controller()
+    start = time.perf_counter()
+    commands = run(ctrl, CommandBulkAdd(classes, relationships))
+    return time.perf_counter() - start, ctrl, refreshes, commands
+
+# Runs a path REPEATS times, each from a clean heap, and keeps the fastest
+# time, as timeit does, so a slow run caused by the machine does not count
+def best(path, classes, relationships):
+    times = []
+    for _ in range(REPEATS):
+        gc.collect()
+        elapsed, ctrl, canvas, commands = path(classes, relationships)
+        times.append(elapsed)
+        counts = (ctrl.editor.classCount(), len(canvas), commands)
+        del ctrl, canvas
+    gc.collect()
+    return min(times), counts
+
+def main(counts):
+    print(f'{"classes":>10} {"per item":>12} {"bulk":>12} {"speedup":>8} {"refreshes":>16} {"commands":>14}')
+    for count in counts:
+        classes, relationships = specs(count)
+        slow, slow_counts = best(perItem, classes, relationships)
+        fast, fast_counts = best(bulk, classes, relationships)
+        assert slow_counts[0] == fast_counts[0] == count
+        print(f'{count:>10} {slow:>11.3f}s {fast:>11.3f}s {slow / fast:>7.1f}x '
+              f'{slow_counts[1]:>7} -> {fast_counts[1]:<6} '
+              f'{slow_counts[2]:>6} -> {fast_counts[2]:<5}')
+
+if __name__ == '__main__':
+    main([int(arg) for arg in sys.argv[1:]] or [1_000, 10_000])
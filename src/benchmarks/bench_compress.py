@@ -0,0 +1,76 @@
+# Compares the size of a diagram saved plain and compressed, and how fast
+# each one saves and loads
+#
+# Usage (from the root folder):
+#   python src/benchmarks/bench_compress.py [class count]
+#
+# Every format is saved with writeDiagram and loaded with loadFile, the paths
+# the controller uses. Throughput is the size of the uncompressed file divided
+# by the time taken, so the rows compare directly, and the ratio is against
+# indented JSON. The load peak is measured on its own run with tracemalloc,
+# which slows loading down. Generated diagrams repeat the same member names,
+# so they compress better than real ones.
+import os
+import sys
+import gc
+import tempfile
+import time
+import tracemalloc
+import unittest.mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from model.editor_model import Editor
+from controller.editor_controller import EditorController
+from controller.loader import loadFile
+from controller.serializer import writeDiagram
+from view.ui_interface import UI
+from bench_bulk import specs
+
+FORMATS = [
+    ('json', False), ('json', True), ('json.gz', False), ('json.bz2', False), ('json.xz', False),
+    ('json.gz', True), ('umlb', False), ('umlb.gz', False), ('umlb.xz', False),
+]
+
+def load(path):
+    editor = Editor()
+    loadFile(editor, path)
+    return editor
+
+def main(count):
+    ctrl = EditorController(UI(), Editor())
+    ctrl.bulkAdd(*specs(count))
+    editor = ctrl.editor
+    print(f'{"format":>16} {"size":>10} {"ratio":>7} {"save":>9} {"save MB/s":>10} {"load":>9} {"load MB/s":>10} {"load peak":>10}')
+    # The load cache goes to the temporary folder too, not the user's cache
+    with tempfile.TemporaryDirectory() as folder, \
+         unittest.mock.patch('controller.model_cache.CACHE_DIR', os.path.join(folder, 'cache')):
+        plain = {}
+        for extension, compact in FORMATS:
+            path = os.path.join(folder, f'diagram.{extension}')
+            gc.collect()
+            start = time.perf_counter()
+            writeDiagram(editor, path, compact)
+            save = time.perf_counter() - start
+            size = os.path.getsize(path)
+            # The uncompressed size of the same data, for the ratio and throughput
+            kind = (extension.split('.')[0], compact)
+            plain.setdefault(kind, size)
+            gc.collect()
+            start = time.perf_counter()
+            loaded = load(path)
+            seconds = time.perf_counter() - start
+            assert loaded.classCount() == count
+            del loaded
+            gc.collect()
+            tracemalloc.start()
+            load(path)
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            megabytes = plain[kind] / 1024 / 1024
+            name = extension + (' compact' if compact else '')
+            print(f'{name:>16} {size / 1024 / 1024:>8.2f}MB {plain["json", False] / size:>6.1f}x {save:>8.3f}s '
+                  f'{megabytes / save:>10.1f} {seconds:>8.3f}s {megabytes / seconds:>10.1f} {peak / 1024 / 1024:>8.1f}MB')
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20_000)
@@ -0,0 +1,82 @@
+# Compares loading a save file by replaying it through the controller with
+# the loader that builds the model directly
+#
+# Usage (from the root folder):
+#   python src/benchmarks/bench_load.py [class counts...]
+#
+# The replay path reads the whole file, then calls classAdd, addField,
+# addMethod and relationshipAdd for every item, the way loading used to work.
+# The direct path is EditorController.load, which streams the file into
+# ModelLoader, and the binary path loads the same diagram saved as .umlb. All
+# of them feed the same Canvas stand-in as bench_bulk.py, so the
+# refresh count shows how often the GUI would redraw.
+import os
+import sys
+import gc
+import json
+import tempfile
+import time
+import unittest.mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from model.editor_model import EditorEncoder
+from controller.binary_format import writeBinary
+from model.relationship_model import Type
+from bench_bulk import controller, specs
+
+def saveFiles(count, path, binary_path):
+    ctrl, _ = controller()
+    ctrl.bulkAdd(*specs(count))
+    with open(path, 'w') as f:
+        json.dump(ctrl.editor, f, cls=EditorEncoder, indent=4)
+    with open(binary_path, 'wb') as f:
+        writeBinary(f, ctrl.editor.classes.values(), ctrl.editor.relationships.values())
+
+def replay(path):
+    ctrl, canvas = controller()
+    start = time.perf_counter()
+    with open(path, 'r') as f:
+        obj = json.loads(f.read())
+    for clazz in obj['classes']:
+        ctrl.classAdd(clazz['name'])
+        for attr in clazz['fields']:
+            ctrl.addField(clazz['name'], attr['name'])
+        for method in clazz['methods']:
+            ctrl.addMethod(clazz['name'], method['name'], [p['name'] for p in method['params']])
+    for rel in obj['relationships']:
+        ctrl.relationshipAdd(rel['source'], rel['destination'], Type.make(rel['type'].lower()))
+    return time.perf_counter() - start, ctrl, canvas
+
+def direct(path):
+    ctrl, canvas = controller()
+    start = time.perf_counter()
+    with unittest.mock.patch.object(ctrl.ui, 'uiChooseLoadLocation', lambda: path):
+        ctrl.load()
+    return time.perf_counter() - start, ctrl, canvas
+
+def main(counts):
+    print(f'{"classes":>10} {"replay":>12} {"direct":>12} {"binary":>12} {"speedup":>8} {"file size":>20} {"refreshes":>16}')
+    # The load cache goes to the temporary folder too, not the user's cache
+    with tempfile.TemporaryDirectory() as folder, \
+         unittest.mock.patch('controller.model_cache.CACHE_DIR', os.path.join(folder, 'cache')):
+        for count in counts:
+            path = os.path.join(folder, f'diagram{count}.json')
+            binary_path = os.path.join(folder, f'diagram{count}.umlb')
+            saveFiles(count, path, binary_path)
+            gc.collect()
+            # Each path starts from a clean heap
+            results = []
+            for load, file in ((replay, path), (direct, path), (direct, binary_path)):
+                seconds, ctrl, canvas = load(file)
+                assert ctrl.editor.classCount() == count
+                results.append((seconds, len(canvas)))
+                del ctrl, canvas
+                gc.collect()
+            (slow, slow_refreshes), (fast, fast_refreshes), (binary, _) = results
+            sizes = f'{os.path.getsize(path) // 1024}k -> {os.path.getsize(binary_path) // 1024}k'
+            print(f'{count:>10} {slow:>11.3f}s {fast:>11.3f}s {binary:>11.3f}s {slow / fast:>7.1f}x '
+                  f'{sizes:>20} {slow_refreshes:>7} -> {fast_refreshes:<6}')
+
+if __name__ == '__main__':
+    main([int(arg) for arg in sys.argv[1:]] or [1_000, 10_000])
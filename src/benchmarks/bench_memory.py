@@ -0,0 +1,62 @@
+# Reports the memory cost of the editor model per class, field and method
+#
+# Usage (from the root folder):
+#   python src/benchmarks/bench_memory.py [class counts...]
+#
+# Each run builds a diagram three times with tracemalloc on: classes only,
+# classes with fields, and classes with fields and methods. The differences
+# give the bytes spent on each kind of object.
+import os
+import sys
+import gc
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from model.editor_model import Editor
+from model.class_model import Class, Field, Method
+
+FIELDS_PER_CLASS = 5
+METHODS_PER_CLASS = 3
+PARAMS_PER_METHOD = 2
+
+# Builds a diagram the way loading a file would, with names created at runtime
+def build(count, fields, methods):
+    editor = Editor()
+    for i in range(count):
+        clazz = Class(f'Class{i}')
+        for j in range(fields):
+            clazz.fields.add(Field(f'field{j}'))
+        for j in range(methods):
+            params = [f'param{k}' for k in range(PARAMS_PER_METHOD)]
+            clazz.methods.add(Method(f'method{j}', params))
+        editor.classes[clazz.name] = clazz
+    return editor
+
+def measure(count, fields, methods):
+    gc.collect()
+    tracemalloc.start()
+    editor = build(count, fields, methods)
+    gc.collect()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del editor
+    return size
+
+def run(count):
+    classes = measure(count, 0, 0)
+    with_fields = measure(count, FIELDS_PER_CLASS, 0)
+    full = measure(count, FIELDS_PER_CLASS, METHODS_PER_CLASS)
+
+    per_class = classes / count
+    per_field = (with_fields - classes) / (count * FIELDS_PER_CLASS)
+    per_method = (full - with_fields) / (count * METHODS_PER_CLASS)
+    print(f'{count:>8} classes: {per_class:8.1f} B/class  {per_field:8.1f} B/field  '
+          f'{per_method:8.1f} B/method  ({full / 2**20:.1f} MiB total)')
+
+if __name__ == '__main__':
+    counts = [int(arg) for arg in sys.argv[1:]] or [10_000, 100_000]
+    print(f'{FIELDS_PER_CLASS} fields and {METHODS_PER_CLASS} methods '
+          f'with {PARAMS_PER_METHOD} parameters per class')
+    for count in counts:
+        run(count)
@@ -0,0 +1,72 @@
+# Compares loading a binary diagram in full with opening it lazily and
+# reading only a few of its classes
+#
+# Usage (from the root folder):
+#   python src/benchmarks/bench_open.py [class counts...]
+#
+# Time is measured on its own, then memory is measured with tracemalloc, which
+# slows both paths down.
+import os
+import sys
+import gc
+import tempfile
+import time
+import tracemalloc
+import unittest.mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from model.editor_model import Editor
+from controller.binary_format import writeBinary
+from controller.editor_controller import EditorController
+from view.ui_interface import UI
+from bench_bulk import specs
+
+# Classes read after opening, as a user looking at a few of them would
+TOUCHED = 10
+
+def saveFile(count, path):
+    ctrl = EditorController(UI(), Editor())
+    ctrl.bulkAdd(*specs(count))
+    with open(path, 'wb') as f:
+        writeBinary(f, ctrl.editor.classes.values(), ctrl.editor.relationships.values())
+
+def run(path, method):
+    ctrl = EditorController(UI(), Editor())
+    with unittest.mock.patch.object(ctrl.ui, 'uiChooseLoadLocation', lambda: path):
+        getattr(ctrl, method)()
+    classes = ctrl.editor.classes
+    for i in range(0, len(classes), max(len(classes) // TOUCHED, 1)):
+        len(classes[f'Class{i}'].fields)
+    return ctrl
+
+def measure(path, method):
+    gc.collect()
+    start = time.perf_counter()
+    ctrl = run(path, method)
+    seconds = time.perf_counter() - start
+    assert ctrl.editor.classCount() > 0
+    del ctrl
+    gc.collect()
+    tracemalloc.start()
+    ctrl = run(path, method)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    del ctrl
+    return seconds, peak / 1024 / 1024
+
+def main(counts):
+    print(f'{"classes":>10} {"load":>12} {"open":>12} {"speedup":>8} {"load peak":>12} {"open peak":>12}')
+    # The load cache goes to the temporary folder too, not the user's cache
+    with tempfile.TemporaryDirectory() as folder, \
+         unittest.mock.patch('controller.model_cache.CACHE_DIR', os.path.join(folder, 'cache')):
+        for count in counts:
+            path = os.path.join(folder, f'diagram{count}.umlb')
+            saveFile(count, path)
+            slow, slow_peak = measure(path, 'load')
+            fast, fast_peak = measure(path, 'open')
+            print(f'{count:>10} {slow:>11.3f}s {fast:>11.3f}s {slow / fast:>7.1f}x '
+                  f'{slow_peak:>10.1f}MB {fast_peak:>10.1f}MB')
+
+if __name__ == '__main__':
+    main([int(arg) for arg in sys.argv[1:]] or [10_000, 200_000])
@@ -0,0 +1,79 @@
+import threading
+import time
+from controller.serializer import writeDiagram
+
+# Seconds between autosaves, by default
+AUTOSAVE_SECONDS = 30
+
+# Saves the editor in the background while it has unsaved changes
+#
+# Everything but the write runs on the UI thread, which calls due, start and
+# finish, see EditorController.autosave. Starting takes a snapshot of the
+# editor, which is O(1), and a worker thread writes it with writeDiagram.
+# The UI keeps running during the write, and the file is renamed into place
+# once it is complete, so it is never seen half written.
+#
+# The editor copies a class before it changes one a snapshot shares, so the
+# worker reads a consistent model without locking it. Nothing is written
+# while the editor is clean, and only one write runs at a time
+class Autosave:
+    def __init__(self, editor, interval=AUTOSAVE_SECONDS, clock=time.monotonic, texts=None):
+        self.editor = editor
+        # DiagramTexts of the editor, see writeDiagram
+        self.texts = texts
+        # Whether files are written in canonical form, see writeDiagram
+        self.canonical = False
+        # Seconds between writes, or None to turn autosave off
+        self.interval = interval
+        self.clock = clock
+        self.last = clock()
+        self.thread = None
+        # Set by the worker: (filename, compact, generation, canonical) of a
+        # write that succeeded, or the exception of one that failed
+        self.written = None
+        self.error = None
+
+    # Whether there are changes to write, and it is time to write them
+    def due(self) -> bool:
+        return (self.interval is not None and self.thread is None and self.editor.isDirty()
+                and self.clock() - self.last >= self.interval)
+
+    # Starts writing the editor as it is now to `filename`
+    def start(self, filename, compact=False):
+        generation = self.editor.events.generation
+        snapshot = self.editor.snapshot()
+        self.last = self.clock()
+        self.thread = threading.Thread(target=self._write, name='autosave',
+                                       args=(snapshot, filename, compact, generation, self.canonical))
+        self.thread.start()
+
+    def _write(self, snapshot, filename, compact, generation, canonical):
+        try:
+            writeDiagram(snapshot, filename, compact, self.texts, canonical)
+            self.written = (filename, compact, generation, canonical)
+        except Exception as e:
+            self.error = e
+
+    # Runs `save` now, in place of a background write, for a save that only
+    # writes what changed, see Project.save
+    def run(self, save):
+        self.last = self.clock()
+        save()
+
+    def busy(self) -> bool:
+        return self.thread is not None
+
+    # Collects a write that is over, or waits for it with `wait`
+    # Returns (filename, compact, generation, canonical) for a write that succeeded, and
+    # None if there was none or it is still running. The exception of a write
+    # that failed is raised here, on the UI thread
+    def finish(self, wait=False):
+        if self.thread is None or (self.thread.is_alive() and not wait):
+            return None
+        self.thread.join()
+        self.thread = None
+        written, error = self.written, self.error
+        self.written = self.error = None
+        if error is not None:
+            raise error
+        return written
@@ -0,0 +1,325 @@
+from controller.autosave import Autosave
+from controller.journal import Journal
+from controller.project import Project, isProjectName, projectPath
+from controller.serializer import DiagramTexts, writeDiagram
+from controller.sqlite_store import DiagramStore, isStore, isStoreName
+from controller.storage import fileStamp
+
+# Where the editor's diagram is kept between saves
+#
+# The editor is attached to at most one backend, for the file it was last
+# saved to, loaded from or opened from:
+#   FileBackend     a JSON or binary file and its journal, which saves and
+#                   autosave write again in full, see controller/journal.py
+#   StoreBackend    a SQLite store, which follows every change as it happens,
+#                   see controller/sqlite_store.py
+#   ProjectBackend  a project directory, whose saves and autosaves only write
+#                   the shards that changed, see controller/project.py
+# Storage picks the backend for a file, and the controller goes through it
+# for everything that is saved. Saving to another file while a store or a
+# project is attached exports the diagram and stays attached
+class Backend:
+    # Whether the backend follows every change to the editor, so it still
+    # holds the editor once another file is loaded into it
+    live = False
+
+    def __init__(self, storage, filename):
+        self.storage = storage
+        self.editor = storage.editor
+        self.filename = filename
+
+    # Whether saving to `filename` saves to this backend
+    def holds(self, filename) -> bool:
+        return self.filename is not None and filename == self.filename
+
+    def attach(self):
+        pass
+
+    def close(self):
+        pass
+
+    # Saves the editor to the backend. GUI saves keep no journal
+    def save(self, compact, journal=True):
+        pass
+
+    # What a save to another file writes
+    def model(self):
+        return self.editor
+
+    # Called after a command is done or undone
+    def record(self, step, cmd):
+        pass
+
+    # Called regularly by the UI, see EditorController.autosave
+    def autosave(self):
+        pass
+
+    # Called once an autosave of the backend's file is over
+    def autosaved(self, compact, generation, canonical):
+        pass
+
+    # Names of the classes with a field or a method called `name`
+    def classesWithField(self, name):
+        return [clazz.name for clazz in self.editor.classes.values() if name in clazz.fields]
+
+    def classesWithMethod(self, name):
+        return [clazz.name for clazz in self.editor.classes.values() if name in clazz.methods]
+
+class FileBackend(Backend):
+    def __init__(self, storage, filename, compact=False, journal=True):
+        super().__init__(storage, filename)
+        self.compact = compact
+        # The journal of the file, started by save or resumed by the
+        # controller. In the GUI, boxes are moved without commands, so GUI
+        # saves and loads keep none
+        self.journal = Journal(filename) if journal else None
+        # (compact, generation, file stamp) as of the last time the file was
+        # written or loaded, see current
+        self.stamp = None
+        # Whether the file was written in canonical form. A loaded file is
+        # taken not to be, so a canonical save writes it in full
+        self.canonical = False
+        # Steps in the journal when the running autosave started
+        self.autosave_steps = 0
+
+    def close(self):
+        self.stopJournal()
+
+    def stopJournal(self):
+        if self.journal is not None:
+            self.journal.close()
+            self.journal = None
+
+    def save(self, compact, journal=True):
+        if not journal:
+            self.stopJournal()
+        self.compact = compact
+        # Nothing changed since the file was saved or loaded
+        if self.current(compact):
+            self.editor.markSaved()
+            return
+        # Every step since the file was last written is in its journal
+        # already, so a small journal only has to be synced
+        if self.covered(compact):
+            self.journal.sync()
+            self.editor.markSaved()
+            return
+
+        # Names ending in .umlb are saved in the binary format, see writeDiagram
+        writeDiagram(self.editor, self.filename, compact, self.storage.texts, self.storage.canonical)
+        self.canonical = self.storage.canonical
+        if journal:
+            if self.journal is None:
+                self.journal = Journal(self.filename)
+            self.journal.start()
+            self.journal.synced = self.editor.events.generation
+            self.journal.compact = compact
+        self.editor.markSaved()
+        self.wrote(compact)
+
+    def record(self, step, cmd):
+        if self.journal is not None:
+            self.journal.record(step, cmd)
+            self.journal.synced = self.editor.events.generation
+
+    # Each call syncs the steps written to the journal since the last one,
+    # and the file is written in the background while the editor has
+    # changes that are not in it or its journal
+    def autosave(self):
+        if self.journal is not None:
+            self.journal.sync()
+        autosaver = self.storage.autosaver
+        if not autosaver.due():
+            return
+        if self.covered(self.compact):
+            self.editor.markSaved()
+            return
+        # Steps written from here on are not in the snapshot being written
+        self.autosave_steps = len(self.journal.lines) if self.journal is not None else 0
+        autosaver.start(self.filename, self.compact)
+
+    # The file now holds every change up to the snapshot it was written from,
+    # and was replaced, so its journal starts again with the steps taken
+    # during the write
+    def autosaved(self, compact, generation, canonical):
+        self.canonical = canonical
+        self.wrote(compact, generation)
+        if self.journal is not None:
+            self.journal.restart(len(self.journal.lines) - self.autosave_steps)
+            self.journal.compact = compact
+            if generation == self.editor.events.generation:
+                self.journal.synced = generation
+
+    # Records that the file holds the editor as of `generation`, the current
+    # one by default
+    def wrote(self, compact, generation=None):
+        try:
+            stamp = fileStamp(self.filename)
+        except OSError:
+            self.stamp = None
+            return
+        self.stamp = (compact, self.editor.events.generation if generation is None else generation, stamp)
+
+    # Whether saving would write what the file holds already: nothing
+    # changed since it was saved or loaded, nothing else wrote to it since,
+    # and it is in canonical form if saves are
+    def current(self, compact) -> bool:
+        if (self.stamp is None or self.stamp[:2] != (compact, self.editor.events.generation)
+                or self.canonical != self.storage.canonical):
+            return False
+        try:
+            return fileStamp(self.filename) == self.stamp[2]
+        except OSError:
+            return False
+
+    # Whether the file and its journal hold every change to the editor, and
+    # the file is in canonical form if saves are
+    def covered(self, compact) -> bool:
+        journal = self.journal
+        return (journal is not None and journal.compact == compact and self.canonical == self.storage.canonical
+                and journal.synced == self.editor.events.generation and not journal.full() and journal.follows())
+
+# Every change is written to the store as it happens, which leaves nothing
+# for saves, the journal or autosave to do. Other saves are exported from it
+class StoreBackend(Backend):
+    live = True
+
+    def __init__(self, storage, filename):
+        super().__init__(storage, filename)
+        self.store = None
+
+    def attach(self):
+        self.store = DiagramStore(self.filename)
+        self.store.attach(self.editor)
+
+    def close(self):
+        if self.store is not None:
+            self.store.close()
+            self.store = None
+
+    def model(self):
+        # The store hears about changes when their events are delivered
+        self.editor.events.flush()
+        return self.store.diagram()
+
+    # An attached store finds them through its indexes
+    def classesWithField(self, name):
+        self.editor.events.flush()
+        return self.store.classesWithField(name)
+
+    def classesWithMethod(self, name):
+        self.editor.events.flush()
+        return self.store.classesWithMethod(name)
+
+# Saves and autosaves only write the shards whose classes changed, which is
+# quick enough to do on the UI thread. The journal is not used
+class ProjectBackend(Backend):
+    live = True
+
+    def __init__(self, storage, path):
+        super().__init__(storage, path)
+        self.project = Project(path)
+
+    def attach(self):
+        self.project.attach(self.editor)
+
+    def close(self):
+        self.project.detach()
+
+    def save(self, compact, journal=True):
+        self.project.save()
+
+    def autosave(self):
+        if self.storage.autosaver.due():
+            self.storage.autosaver.run(self.project.save)
+
+class Storage:
+    def __init__(self, editor):
+        self.editor = editor
+        # Encoded classes and relationships of the last save, reused for
+        # those that did not change, see DiagramTexts
+        self.texts = DiagramTexts()
+        # Writes the file of the backend in the background, see autosave
+        self.autosaver = Autosave(editor, texts=self.texts)
+        # Whether JSON files are saved in canonical form, see setCanonical
+        self.canonical = False
+        # The backend the editor is attached to. A plain Backend stands for
+        # none, and saves nothing
+        self.backend = Backend(self, None)
+
+    # The journal of the attached file, if any
+    @property
+    def journal(self):
+        return getattr(self.backend, 'journal', None)
+
+    def attach(self, backend):
+        self.close()
+        backend.attach()
+        self.backend = backend
+        return backend
+
+    def close(self):
+        self.backend.close()
+        self.backend = Backend(self, None)
+
+    # Detaches a backend that follows every change, before the editor is
+    # cleared for another file, which must not clear the backend too
+    def release(self):
+        if self.backend.live:
+            self.close()
+
+    # Another file was loaded into the editor, which an attached file does
+    # not hold. A backend that follows every change has it already
+    def merged(self):
+        if not self.backend.live:
+            self.close()
+
+    # Saves the editor to `filename`. Saving to a store or a project, or to a
+    # file while neither is attached, attaches the editor to it
+    def save(self, filename, compact=False, journal=True):
+        backend = self.backend
+        if not backend.holds(filename):
+            exported = not isStoreName(filename) and not isProjectName(filename)
+            if exported and backend.live:
+                writeDiagram(backend.model(), filename, compact, self.texts, self.canonical)
+                return
+            if not exported:
+                writeDiagram(backend.model(), filename)
+            if isStoreName(filename):
+                backend = self.attach(StoreBackend(self, filename))
+            elif isProjectName(filename):
+                backend = self.attach(ProjectBackend(self, filename))
+            else:
+                backend = self.attach(FileBackend(self, filename, compact, journal))
+        backend.save(compact, journal)
+
+    # Attaches the editor to `filename`, once it is all the editor holds
+    # The journal of a file is resumed by the controller, see resumeJournal
+    def loaded(self, filename, journal=True):
+        self.editor.markSaved()
+        path = projectPath(filename)
+        if path is not None:
+            self.attach(ProjectBackend(self, path))
+        elif isStore(filename):
+            self.attach(StoreBackend(self, filename))
+        else:
+            self.attach(FileBackend(self, filename, journal=journal)).wrote(False)
+
+    # Collects a background write once it is over, or waits for it
+    # The exception of a write that failed is raised here
+    def finishAutosave(self, wait=False):
+        written = self.autosaver.finish(wait)
+        if written is None:
+            return
+        filename, compact, generation, canonical = written
+        self.editor.markSaved(generation)
+        if self.backend.holds(filename):
+            self.backend.autosaved(compact, generation, canonical)
+
+    # Canonical saves give the same file for the same diagram, whatever order
+    # its classes, members and relationships were added in, see writeDiagram.
+    # Every JSON save and autosave follows the setting, and a file written
+    # the other way is written in full by the next save, see FileBackend.current
+    def setCanonical(self, canonical):
+        self.canonical = canonical
+        self.autosaver.canonical = canonical
@@ -0,0 +1,315 @@
+import mmap
+import struct
+from model.class_model import Field, Method, Members, LazyClass
+from model.relationship_model import Type
+from controller.validator import DiagramError, lazyMemberProblems
+
+# Binary save format
+#
+# JSON stays the interchange format. The binary format is an optional,
+# smaller and faster alternative for the same data EditorEncoder saves. Every
+# name is stored once in a string table and referred to by index, and
+# relationships refer to their classes by index rather than repeating names.
+#
+# Integers are unsigned LEB128 varints, so small indexes take a single byte:
+#   magic          b'UMLB' and a version byte
+#   header         number of strings, classes and relationships, so the reader
+#                  can preallocate its tables
+#   strings        byte length and UTF-8 bytes of each string. The first
+#                  strings are the class names, in class order
+#   classes        name, field count and field names, method count and for each
+#                  method its name, parameter count and parameter names, all as
+#                  string indexes. Then the position: a byte that is 0 for no
+#                  position, 1 for two zigzag varints, or 2 for two doubles
+#   relationships  source and destination as class indexes, and the Type value
+#   index          fixed size little-endian integers, so any string or class
+#                  can be found without reading the ones before it: the offset
+#                  of every string, then for every class its offset times two,
+#                  plus one if it has methods
+#   trailer        offsets of the relationships and of the index
+#
+# The index is what lets MappedDiagram map a file and read classes on demand.
+#
+# Files are told apart by their first bytes, so loading never depends on the
+# name. Saving picks the binary format for names ending in EXTENSION
+MAGIC = b'UMLB'
+VERSION = 2
+EXTENSION = '.umlb'
+
+# Output is written in blocks of about this many bytes
+BLOCK_SIZE = 64 * 1024
+
+_doubles = struct.Struct('<dd')
+_offset = struct.Struct('<Q')
+_trailer = struct.Struct('<QQ')
+
+def isBinaryName(filename) -> bool:
+    return filename.lower().endswith(EXTENSION)
+
+def isBinary(filename) -> bool:
+    with open(filename, 'rb') as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+def _varint(out, n):
+    while n > 0x7f:
+        out.append((n & 0x7f) | 0x80)
+        n >>= 7
+    out.append(n)
+
+def _zigzag(n):
+    return n * 2 if n >= 0 else -n * 2 - 1
+
+def _unzigzag(n):
+    return n >> 1 if not n & 1 else -((n + 1) >> 1)
+
+# Writes the classes and relationships to a binary file
+#   classes => Class objects, iterated more than once
+#   relationships => Relationship objects
+#   position => gives the position saved for a class, Class.position by default
+def writeBinary(file, classes, relationships, position=None):
+    # First pass: the string table, class names first, then in order of first use
+    strings = {}
+    index = strings.setdefault
+    class_index = {}
+    for clazz in classes:
+        class_index[clazz.name] = len(class_index)
+        index(clazz.name, len(strings))
+    for clazz in classes:
+        for field in clazz.fields:
+            index(field.name, len(strings))
+        for method in clazz.methods:
+            index(method.name, len(strings))
+            for param in method.params:
+                index(param, len(strings))
+    relationships = list(relationships)
+
+    written = 0
+    out = bytearray(MAGIC)
+    out.append(VERSION)
+    for count in (len(strings), len(class_index), len(relationships)):
+        _varint(out, count)
+    string_offsets = []
+    for string in strings:
+        string_offsets.append(written + len(out))
+        data = string.encode('utf-8')
+        _varint(out, len(data))
+        out += data
+        if len(out) >= BLOCK_SIZE:
+            file.write(out)
+            written += len(out)
+            out.clear()
+
+    # Second pass: the classes, as string indexes
+    class_entries = []
+    for clazz in classes:
+        class_entries.append((written + len(out)) * 2 + (len(clazz.methods) > 0))
+        _varint(out, strings[clazz.name])
+        _varint(out, len(clazz.fields))
+        for field in clazz.fields:
+            _varint(out, strings[field.name])
+        _varint(out, len(clazz.methods))
+        for method in clazz.methods:
+            _varint(out, strings[method.name])
+            _varint(out, len(method.params))
+            for param in method.params:
+                _varint(out, strings[param])
+        xy = position(clazz) if position else clazz.position
+        if xy is None:
+            out.append(0)
+        elif isinstance(xy[0], int) and isinstance(xy[1], int):
+            out.append(1)
+            _varint(out, _zigzag(xy[0]))
+            _varint(out, _zigzag(xy[1]))
+        else:
+            out.append(2)
+            out += _doubles.pack(xy[0], xy[1])
+        if len(out) >= BLOCK_SIZE:
+            file.write(out)
+            written += len(out)
+            out.clear()
+
+    relationships_start = written + len(out)
+    for rel in relationships:
+        _varint(out, class_index[rel.src])
+        _varint(out, class_index[rel.dst])
+        _varint(out, rel.typ.value)
+        if len(out) >= BLOCK_SIZE:
+            file.write(out)
+            written += len(out)
+            out.clear()
+
+    index_start = written + len(out)
+    for offset in string_offsets:
+        out += _offset.pack(offset)
+    for entry in class_entries:
+        out += _offset.pack(entry)
+    out += _trailer.pack(relationships_start, index_start)
+    file.write(out)
+
+# Reads the parts of a binary file, which may be bytes or a memory map
+# Indexes and lengths out of range raise IndexError or struct.error, which
+# the public functions turn into ValueError
+class _Reader:
+    def __init__(self, data, pos=0, strings=None):
+        self.data = data
+        self.pos = pos
+        self.strings = strings
+
+    # Reads the magic, the version and the counts at the start of the file
+    def readHeader(self):
+        data = self.data
+        if data[:len(MAGIC)] != MAGIC:
+            raise ValueError('Not a binary diagram file')
+        if len(data) <= len(MAGIC) or data[len(MAGIC)] != VERSION:
+            raise ValueError('Unsupported binary diagram version')
+        self.pos = len(MAGIC) + 1
+        self.string_count = self.varint()
+        self.class_count = self.varint()
+        self.relationship_count = self.varint()
+        # Every string, class and relationship takes some bytes, so counts the
+        # file is too short for are rejected before any table is allocated
+        # for them. The class names are among the strings
+        needed = (self.string_count * (1 + _offset.size) + self.class_count * (4 + _offset.size)
+                  + self.relationship_count * 3 + _trailer.size)
+        if self.class_count > self.string_count or self.pos + needed > len(data):
+            raise ValueError('Binary diagram file is truncated or corrupt')
+
+    def varint(self):
+        data = self.data
+        pos = self.pos
+        byte = data[pos]
+        pos += 1
+        n = byte & 0x7f
+        shift = 7
+        while byte >= 0x80:
+            byte = data[pos]
+            pos += 1
+            n |= (byte & 0x7f) << shift
+            shift += 7
+        self.pos = pos
+        return n
+
+    def string(self):
+        length = self.varint()
+        end = self.pos + length
+        if end > len(self.data):
+            raise IndexError
+        text = str(self.data[self.pos:end], 'utf-8')
+        self.pos = end
+        return text
+
+    # Reads the class at the current position
+    # Returns (name, fields, methods, position)
+    def readClass(self):
+        strings = self.strings
+        varint = self.varint
+        name = strings[varint()]
+        fields = [Field(strings[varint()]) for _ in range(varint())]
+        methods = []
+        for _ in range(varint()):
+            method = strings[varint()]
+            methods.append(Method(method, [strings[varint()] for _ in range(varint())]))
+        kind = self.data[self.pos]
+        self.pos += 1
+        if kind == 0:
+            position = None
+        elif kind == 1:
+            position = (_unzigzag(varint()), _unzigzag(varint()))
+        elif kind == 2:
+            position = _doubles.unpack_from(self.data, self.pos)
+            self.pos += _doubles.size
+        else:
+            raise ValueError(f'Invalid position in class {name}')
+        return name, fields, methods, position
+
+    # Yields (source, destination, Type) for `count` relationships at the
+    # current position, with the classes looked up in `classes` by index
+    def readRelationships(self, classes, count):
+        for _ in range(count):
+            src, dst = classes[self.varint()], classes[self.varint()]
+            yield src, dst, Type(self.varint())
+
+# Reads a binary file into a ModelLoader, see ModelLoader.add and relate
+# The caller calls loader.finish() afterwards
+# A malformed file raises ValueError
+def readBinary(file, loader):
+    reader = _Reader(file.read())
+    try:
+        reader.readHeader()
+        strings = reader.strings = [None] * reader.string_count
+        for i in range(reader.string_count):
+            strings[i] = reader.string()
+        names = strings[:reader.class_count]
+        for _ in range(reader.class_count):
+            loader.add(*reader.readClass())
+        for src, dst, typ in reader.readRelationships(names, reader.relationship_count):
+            loader.relate(src, dst, typ)
+        index_start = reader.pos
+        end = index_start + (reader.string_count + reader.class_count) * _offset.size + _trailer.size
+        if end != len(reader.data) or _trailer.unpack_from(reader.data, end - _trailer.size)[1] != index_start:
+            raise ValueError('Binary diagram file has a broken index')
+    except (IndexError, struct.error):
+        raise ValueError('Binary diagram file is truncated or corrupt')
+
+# Strings of a mapped file, read through the index when they are asked for
+class _StringIndex:
+    def __init__(self, data, start, count):
+        self.data = data
+        self.start = start
+        self.count = count
+
+    def __getitem__(self, i):
+        if not 0 <= i < self.count:
+            raise IndexError(i)
+        return _Reader(self.data, _offset.unpack_from(self.data, self.start + i * _offset.size)[0]).string()
+
+# A binary file mapped into memory, whose classes are read on demand
+#
+# Opening reads the header, the index and the class names. Each class is a
+# LazyClass, which calls loadClass the first time its members are used.
+# The map stays open as long as any of its classes is not loaded
+class MappedDiagram:
+    def __init__(self, filename):
+        self.filename = filename
+        with open(filename, 'rb') as f:
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            reader = _Reader(self.data)
+            reader.readHeader()
+            self.relationships_start, index_start = _trailer.unpack_from(self.data, len(self.data) - _trailer.size)
+            self.class_index = index_start + reader.string_count * _offset.size
+            if self.class_index + reader.class_count * _offset.size + _trailer.size != len(self.data):
+                raise ValueError('Binary diagram file has a broken index')
+            self.strings = _StringIndex(self.data, index_start, reader.string_count)
+            self.class_count = reader.class_count
+            self.relationship_count = reader.relationship_count
+            # The class names are the first strings, so they are read in one go
+            self.names = [reader.string() for _ in range(self.class_count)]
+        except (IndexError, struct.error):
+            raise ValueError('Binary diagram file is truncated or corrupt')
+
+    # The classes, not loaded yet, in file order
+    def classes(self):
+        entries = struct.unpack_from(f'<{self.class_count}Q', self.data, self.class_index)
+        return [LazyClass(name, self, entry >> 1, bool(entry & 1)) for name, entry in zip(self.names, entries)]
+
+    # (source, destination, Type) for every relationship, with the classes
+    # taken from `classes`, which are in file order
+    def relationships(self, classes):
+        reader = _Reader(self.data, self.relationships_start)
+        try:
+            return list(reader.readRelationships(classes, self.relationship_count))
+        except (IndexError, struct.error):
+            raise ValueError('Binary diagram file is truncated or corrupt')
+
+    # Returns (fields, methods, position) of the class at `offset`, see LazyClass
+    # A class that cannot be read raises a DiagramError
+    def loadClass(self, offset):
+        try:
+            name, fields, methods, position = _Reader(self.data, offset, self.strings).readClass()
+        except (IndexError, ValueError, struct.error):
+            raise DiagramError([(f'{self.filename}: class at byte {offset}', 'truncated or corrupt')])
+        problems = lazyMemberProblems(f'{self.filename}: class `{name}`', fields, methods)
+        if problems:
+            raise DiagramError(problems)
+        return Members(fields), Members(methods), position
@@ -0,0 +1,71 @@
+import bz2
+import gzip
+import io
+import lzma
+
+# Compressed save files
+#
+# A save file can be wrapped in a gzip, bz2 or xz stream. Saving picks the
+# codec from the last extension of the name, so `diagram.json.gz` is gzipped
+# JSON and `diagram.umlb.xz` is a binary diagram compressed with lzma. The
+# name without that extension decides JSON or binary, as usual.
+#
+# Loading never depends on the name: a compressed file is told apart by its
+# first bytes, and whatever it holds is read through the stream. Data is
+# compressed and decompressed as it is written and read, so a compressed save
+# takes no more memory than a plain one.
+#
+# gzip is written at level 6, which is nearly as small as level 9 and much
+# faster. bz2 and lzma keep their own defaults
+
+class Codec:
+    def __init__(self, name, extension, magic, open, **options):
+        self.name = name
+        self.extension = extension
+        self.magic = magic
+        self._open = open
+        self.options = options
+
+    # Wraps a binary file object in a compressing or decompressing stream
+    # A text mode ('rt' or 'wt') gives a UTF-8 text stream over it
+    def open(self, file, mode):
+        options = self.options if 'w' in mode else {}
+        stream = self._open(file, mode.replace('t', 'b'), **options)
+        if 't' in mode:
+            return io.TextIOWrapper(stream, encoding='utf-8')
+        return stream
+
+# gzip headers would hold the temporary file's name and the time of the save,
+# so the same diagram would never compress to the same bytes
+def _gzip(file, mode, **options):
+    return gzip.GzipFile('', mode, fileobj=file, mtime=0, **options)
+
+CODECS = [
+    Codec('gzip', '.gz', b'\x1f\x8b', _gzip, compresslevel=6),
+    Codec('bz2', '.bz2', b'BZh', bz2.open),
+    Codec('lzma', '.xz', b'\xfd7zXZ\x00', lzma.open),
+]
+
+_longest_magic = max(len(codec.magic) for codec in CODECS)
+
+# The codec a file of this name is saved with, or None for no compression
+def codecForName(filename):
+    lower = filename.lower()
+    for codec in CODECS:
+        if lower.endswith(codec.extension):
+            return codec
+    return None
+
+# The name without the compression extension, which tells JSON from binary
+def baseName(filename):
+    codec = codecForName(filename)
+    return filename[:-len(codec.extension)] if codec else filename
+
+# The codec a file was compressed with, by its first bytes, or None
+def detectCodec(filename):
+    with open(filename, 'rb') as f:
+        head = f.read(_longest_magic)
+    for codec in CODECS:
+        if head.startswith(codec.magic):
+            return codec
+    return None
@@ -1,10 +1,15 @@
-import json
+import sys
+from contextlib import contextmanager
 from model.class_model import Class, Field, Method
-from model.editor_model import EditorEncoder
+from model.event_model import Change, ChangeEvent
 from model.relationship_model import Relationship, Type
+from controller.backend import Storage
+from controller.journal import replay
+from controller.loader import gcPaused, loadFile, openFile
 from controller.memento import Memento
 from view.ui_cli import CLI
 from view.ui_gui import GUI
+from view.ui_interface import DeferredUI
 from PIL import Image
 
 # Controller for the Editor class
@@ -13,11 +18,45 @@ from PIL import Image
 # saved in the Editor's action stack
 #
 # Such functions have been annotated with a return type
+#
+# The controller only changes the editor. The editor reports every change as
+# an event, and the UI redraws from those events once per batch of changes
 class EditorController:
     def __init__(self, ui, editor):
         self.ui = ui
         self.editor = editor
+        self.ui.attachEditor(editor)
+        # The file, store or project the editor was last saved to, loaded
+        # from or opened from, see controller/backend.py
+        self.storage = Storage(editor)
     
+    # Runs a group of changes as one transaction on the editor
+    # The UI only hears about it once the transaction is over: per-item
+    # feedback is dropped, errors are reported once, and the canvas is redrawn
+    # once. If an exception escapes, the editor is rolled back and the
+    # exception is raised again
+    @contextmanager
+    def transaction(self):
+        if isinstance(self.ui, DeferredUI):
+            # Nested transactions roll back on their own, but report with the outer one
+            with self.editor.transaction():
+                yield self
+            return
+        deferred = DeferredUI(self.ui)
+        self.ui = deferred
+        try:
+            with self.editor.transaction():
+                yield self
+        finally:
+            self.ui = deferred.ui
+            deferred.finish()
+
+    # Whether the user works in the CLI, also while a transaction stands in
+    # for its UI, see DeferredUI
+    def inCLI(self) -> bool:
+        ui = self.ui.ui if isinstance(self.ui, DeferredUI) else self.ui
+        return isinstance(ui, CLI)
+
     def export_image(self):
         file_name = self.ui.uiChooseCanvasLocation()
         # For an empty filename (sent on GUI 'Cancel') do nothing
@@ -32,65 +71,170 @@ class EditorController:
         img.convert()
         img.save(file_name + '.png', 'png')
     
-    def save(self):
+    # A class whose box was never dragged has no position, and the GUI draws
+    # it at a spot of its own. Saving moves such classes to that spot, so the
+    # file has the layout the user sees, whichever way the diagram is saved
+    def placeClasses(self):
+        # Boxes are drawn for classes once their events are delivered
+        self.editor.events.flush()
+        for class_id, position in self.ui.defaultPositions().items():
+            self.editor.moveClass(class_id, position)
+
+    # Compact saves have no indentation, which makes large files much smaller
+    def save(self, compact=False):
         filename = self.ui.uiChooseSaveLocation()
         # For an empty filename (sent on GUI 'Cancel') do nothing
         if not filename:
             # If it's the CLI, give clear output
-            if isinstance(self.ui, CLI):
+            if self.inCLI():
                 self.ui.uiError(f'Could not save to `{filename}`')
             return
 
-        output = json.dumps(self.editor, cls=EditorEncoder, indent=4)
-        with open(f'{filename}', 'w') as f:
-            f.write(output)
-            self.ui.uiFeedback(f'Saved to {filename}!')
+        # An autosave still writing the file would replace it afterwards
+        self.finishAutosave(True)
+        self.placeClasses()
+        # Saving to a store or a project attaches the editor to it. Saving to
+        # the file, store or project it is attached to only writes what
+        # changed, and a file with a small journal only syncs the journal
+        # Names ending in .umlb are saved in the binary format, see writeDiagram
+        self.storage.save(filename, compact)
+        self.ui.uiFeedback(f'Saved to {filename}!')
     
     def load(self):
         filename = self.ui.uiChooseLoadLocation()
         # For an empty filename (sent on GUI 'Cancel') do nothing
         if not filename:
             # If it's the CLI, give clear output
-            if isinstance(self.ui, CLI):
+            if self.inCLI():
                 self.ui.uiError(f'Could not load from `{filename}`')
             return
 
-        # We no longer use load() from the GUI
-        # if isinstance(self.ui, GUI):
-        #     # Suppress popups as we load from JSON
-        #     self.ui.silent_mode = True
-
-        with open(filename, 'r') as f:
-            data = f.read()
-            obj = json.loads(data)
-            for clazz in obj['classes']:
-                self.classAdd(clazz['name'])
-                for attr in clazz['fields']:
-                    self.addField(clazz['name'], attr['name'])
-                for method in clazz['methods']:
-                    params = []
-                    for p in method['params']:
-                        params.append(p['name'])
-                    self.addMethod(clazz['name'], method['name'], params)
-            for rel in obj['relationships']:
-                self.relationshipAdd(rel['source'], rel['destination'], Type.make(rel['type'].lower()))
-                        
+        # The file is loaded as one transaction, so a malformed file leaves
+        # the editor as it was, and the UI hears about the whole file at once
+        # The file is streamed, and the loader builds each class as soon as it
+        # is parsed, see ModelLoader. Binary files are recognized by their
+        # first bytes
+        # The journal only follows the file if the file is all that is loaded,
+        # and is resumed below. Otherwise its steps are replayed with the file
+        empty = len(self.editor.classes) == 0
+        self.finishAutosave(True)
+        # An empty editor takes on the file loaded into it, and leaves any
+        # store or project
+        if empty:
+            self.storage.release()
+        try:
+            with self.transaction():
+                loadFile(self.editor, filename, ('classes', 'relationships'), journal=not empty)
+        except (OSError, ValueError, KeyError, TypeError, AttributeError) as e:
+            self.ui.uiError(f'Could not load from `{filename}`: {e}')
+            return
+        # Autosave only writes back a file that is all the editor holds
+        if empty:
+            self.storage.loaded(filename)
+            self.resumeJournal(filename)
+        else:
+            self.storage.merged()
+
         self.ui.uiFeedback(f'=--> Loaded from {filename}!')
-        # We no longer use load() from the GUI
-        # if isinstance(self.ui, GUI):
-        #     # Recalculate grayed out buttons
-        #     self.ui.updateAccess()
-        #     # No longer suppress popups
-        #     self.ui.silent_mode = False
-
-    def saveGUI(self):
+        self.ui.updateAccess()
+
+    # Opens a binary file without reading its classes, which are read the
+    # first time they are used. This makes looking at or changing a few
+    # classes of a very large diagram quick. It replaces the current diagram.
+    # A project reads each shard the first time one of its classes is used.
+    # Other files are loaded in full
+    def open(self):
+        filename = self.ui.uiChooseLoadLocation()
+        # For an empty filename (sent on GUI 'Cancel') do nothing
+        if not filename:
+            # If it's the CLI, give clear output
+            if self.inCLI():
+                self.ui.uiError(f'Could not open `{filename}`')
+            return
+
+        self.finishAutosave(True)
+        # Opening clears the editor, which must not clear the store too
+        self.storage.release()
+        try:
+            with self.transaction():
+                openFile(self.editor, filename, journal=False)
+        except (OSError, ValueError, KeyError, TypeError, AttributeError) as e:
+            self.ui.uiError(f'Could not open `{filename}`: {e}')
+            return
+        self.storage.loaded(filename)
+        self.resumeJournal(filename)
+
+        self.ui.uiFeedback(f'=--> Opened {filename}!')
+        self.ui.updateAccess()
+
+    #===== Journal =====#
+    # Steps are written to the journal of the current file as they happen, see
+    # controller/journal.py, and saving syncs them while the journal is small.
+    # In the GUI, boxes are moved without commands, so GUI saves and loads
+    # keep no journal
+
+    # Replays the steps a crash may have left in the journal of a file that
+    # was just loaded. The replayed steps are not added to the undo history
+    def resumeJournal(self, filename):
+        journal = self.storage.journal
+        if journal is None:
+            return
+        try:
+            steps = journal.resume()
+            if steps:
+                with self.transaction():
+                    replay(self, steps)
+            journal.synced = self.editor.events.generation
+        except (OSError, ValueError, KeyError, TypeError, AttributeError) as e:
+            self.storage.backend.stopJournal()
+            self.ui.uiError(f'Could not recover the changes to `{filename}`: {e}')
+            return
+        if steps:
+            self.ui.uiFeedback(f'Recovered {len(steps)} unsaved changes to {filename}')
+
+    #===== Autosave =====#
+    # The file last saved, loaded or opened is written again in the
+    # background while the editor has changes that are not in it or its
+    # journal, see controller/autosave.py, and a project writes the shards
+    # that changed. The UI calls autosave regularly, on its own thread, and it
+    # only writes once the interval has passed
+
+    def autosave(self):
+        self.finishAutosave()
+        self.storage.backend.autosave()
+
+    # Collects a background write once it is over, or waits for it
+    def finishAutosave(self, wait=False):
+        try:
+            self.storage.finishAutosave(wait)
+        except (OSError, ValueError, TypeError) as e:
+            self.ui.uiError(f'Could not autosave `{self.storage.backend.filename}`: {e}')
+
+    # Names of the classes with a field or a method called `name`
+    # An attached store finds them through its indexes
+    def classesWithField(self, name):
+        return self.storage.backend.classesWithField(name)
+
+    def classesWithMethod(self, name):
+        return self.storage.backend.classesWithMethod(name)
+
+    # Canonical saves give the same file for the same diagram, whatever order
+    # its classes, members and relationships were added in, see writeDiagram.
+    # Every JSON save and autosave follows the setting. The file saved last
+    # was written the other way, so the next save writes it in full
+    def setCanonical(self, canonical):
+        self.storage.setCanonical(canonical)
+        self.ui.uiFeedback(f'Canonical saves are {"on" if canonical else "off"}')
+
+    def saveGUI(self, compact=False):
         filename = self.ui.uiChooseSaveLocation()
         if not filename:
             self.ui.uiError("Save operation canceled.")
             return
           
-        memento = Memento(self.editor, self.ui)
-        memento.save_to_file(f"{filename}")
+        self.finishAutosave(True)
+        self.placeClasses()
+        Memento(self.editor, self.ui).save_to_file(filename, compact, self.storage)
 
     def loadGUI(self):
         filename = self.ui.uiChooseLoadLocation()
@@ -98,8 +242,12 @@ class EditorController:
             self.ui.uiError("Load operation canceled.")
             return
 
+        self.finishAutosave(True)
+        # Loading clears the editor, which must not clear the store too
+        self.storage.close()
         memento = Memento(self.editor, self.ui)
-        memento.load_from_file(filename)
+        if memento.load_from_file(filename):
+            self.storage.loaded(filename, journal=False)
     
     def undo(self):
         self.stepCmd(True)
@@ -118,6 +266,7 @@ class EditorController:
             # is not skipped when doing redo
             if self.editor.action_idx > -1:
                 self.editor.action_stack[self.editor.action_idx].undo(self)
+                self.storage.backend.record('undo', self.editor.action_stack[self.editor.action_idx])
                 self.editor.action_idx -= 1
                 if self.editor.action_idx >= 0:
                     # If we did not undo the first command, we have commands we can still undo
@@ -138,6 +287,7 @@ class EditorController:
                 self.editor.can_redo = False
             else:
                 self.editor.action_stack[self.editor.action_idx].execute(self)
+                self.storage.backend.record('do', self.editor.action_stack[self.editor.action_idx])
                 if self.editor.action_idx == len(self.editor.action_stack) - 1:
                     # If we just now called redo on the latest command, there is nothing left to redo
                     self.editor.can_redo = False
@@ -151,6 +301,7 @@ class EditorController:
     
     def pushCmd(self, cmd):
         self.editor.pushCmd(cmd)
+        self.storage.backend.record('do', cmd)
         self.editor.can_undo = True
         # Recalculate grayed out buttons
         self.ui.updateAccess()
@@ -163,22 +314,18 @@ class EditorController:
             newclass = Class(name)
             self.editor.classes[name] = newclass
             self.ui.uiFeedback(f'Added class {name}!')
-            self.ui.addClassBox(name)
             return True
         
     def classDelete(self, name) -> bool:
         if name in self.editor.classes:
-            del self.editor.classes[name]
             # Deleting relationships that are no longer valid after class deletion
-            toRemove = []
-            for (src, dst) in self.editor.relationships:
-                if name == src or name == dst:
-                    toRemove.append((src, dst))
-            for rel in toRemove:
-                self.editor.relationships.pop(rel, None)
-                
+            # The UI hears about the class and its relationships together
+            with self.editor.batch():
+                for (src, dst) in self.editor.relationshipKeys(name):
+                    self.editor.removeRelationship(src, dst)
+                del self.editor.classes[name]
+
             self.ui.uiFeedback(f'Deleted class {name}!')
-            self.ui.deleteClassBox(name)
             return True
         else:
             self.ui.uiError(f'No class exists with the name `{name}`')
@@ -187,11 +334,9 @@ class EditorController:
     # Function to rename a class called 'name' to a class called 'rename'.
     def classRename(self, name, rename) -> bool:
         if name in self.editor.classes and rename not in self.editor.classes:
-            clazz = self.editor.classes.pop(name)
-            clazz.name = rename
-            self.editor.classes[rename] = clazz
+            # Classes and relationships are keyed by id, so only the name table changes
+            self.editor.classes.rename(name, rename)
             self.ui.uiFeedback(f'Renamed class `{name}` to `{rename}`')
-            self.ui.renameClassBox(name, rename)
             return True
         elif rename in self.editor.classes:
             self.ui.uiError(f'{rename} is an already existing class. Cannot rename.')
@@ -215,27 +360,20 @@ class EditorController:
             self.ui.uiError(f'class `{class2}` does not exist')
         else:
             # Add relationship to the editor's relationships dictionary
-            self.editor.relationships[(class1, class2)] = Relationship(class1, class2, typ.name)
+            self.editor.addRelationship(class1, class2, typ)
             self.ui.uiFeedback(f'Added relationship between {class1} and {class2} of type {typ.name}!')
-            
-            # Draw the relationship line in the UI
-            self.ui.drawRelationshipLine(class1, class2, typ.name.lower())
             return True
         return False
 
     # Function which deletes a relationship between class1 and class2
     def relationshipDelete(self, class1, class2):
         # Check if the relationship exists in either direction
-        if (class1, class2) in self.editor.relationships:
-            # Delete the relationship from the editor's dictionary
-            del self.editor.relationships[(class1, class2)]
-            self.ui.deleteRelationshipLine(class1, class2)
+        if self.editor.removeRelationship(class1, class2):
+            # Relationship was deleted from the editor's dictionary
             self.ui.uiFeedback(f'Relationship between {class1} and {class2} deleted.')
             return True
-        elif (class2, class1) in self.editor.relationships:
+        elif self.editor.removeRelationship(class2, class1):
             # If the reverse relationship exists, delete it as well
-            del self.editor.relationships[(class2, class1)]
-            self.ui.deleteRelationshipLine(class2, class1)
             self.ui.uiFeedback(f'Relationship between {class2} and {class1} deleted.')
             return True
         else:
@@ -252,8 +390,8 @@ class EditorController:
                 self.ui.uiError(f'There is no relationship between `{class1}` and `{class2}`!')
                 return False
 
-        # Retrieve the relationship object from the dictionary
-        rel = self.editor.relationships.get(rel_key)
+        # Retrieve the relationship object from the dictionary, to change it in place
+        rel = self.editor.relationships.edit(rel_key)
         if not isinstance(rel, Relationship):
             self.ui.uiError(f'Invalid relationship data between `{class1}` and `{class2}`.')
             return False
@@ -266,25 +404,21 @@ class EditorController:
         # Change the type of the relationship and provide feedback
         old_typ = rel.typ
         rel.typ = new_typ
+        self.editor.relationshipChanged(*rel_key)
         self.ui.uiFeedback(f'Changed relationship from {class1} to {class2} from {old_typ.name} to {new_typ.name}')
 
-        # Update the UI by redrawing the relationship line with the new type
-        self.ui.deleteRelationshipLine(class1, class2)
-        self.ui.drawRelationshipLine(class1, class2, new_typ.name.lower())  # Pass relationship type as string
-
         return True
         
     # Function renames given attribute in given class if both exist and new name does not
     def renameField(self, class1, field1, field2):
         if class1 in self.editor.classes:
-            item = self.editor.classes[class1]
+            item = self.editor.classes.edit(class1)
             
-            if Field(field1) in item.fields:
-                if Field(field2) not in item.fields:
-                    self.editor.classes[class1].fields.remove(Field(field1))
-                    self.editor.classes[class1].fields.append(Field(field2))
+            if field1 in item.fields:
+                if field2 not in item.fields:
+                    item.fields.rename(field1, field2)
                     self.ui.uiFeedback(f'Field `{field1}` renamed to {field2}!')
-                    self.ui.updateAttributesBox(class1)  # Update the UI
+                    self.editor.membersChanged(class1)
                     return True
                 else:
                     self.ui.uiError(f'Field `{field2}` already exists in the class {class1}')
@@ -295,12 +429,11 @@ class EditorController:
     # Function deletes given attribute from given class if both exist
     def deleteField(self, class1, field1) -> bool:
         if class1 in self.editor.classes:
-            item = self.editor.classes[class1]
+            item = self.editor.classes.edit(class1)
             
-            if Field(field1) in item.fields:
-                self.editor.classes[class1].fields.remove(Field(field1))
+            if item.fields.pop(field1) is not None:
                 self.ui.uiFeedback(f'Field `{field1}` has been removed from class {class1}')
-                self.ui.updateAttributesBox(class1)  # Update the UI
+                self.editor.membersChanged(class1)
                 return True
             else:
                 self.ui.uiError(f'Field `{field1}` does not exist in class {class1}')
@@ -311,13 +444,13 @@ class EditorController:
     # Fuction will check to see if class exists, and whether the given attribute does not already exists. If both parameters pass the attribute will be added to the class #
     def addField(self, class1, field1) -> bool:
         if class1 in self.editor.classes:
-            item = self.editor.classes[class1]
-            if Field(field1) in item.fields:
+            item = self.editor.classes.edit(class1)
+            if field1 in item.fields:
                 self.ui.uiError(f'Field `{field1}` already exists in the class {class1}')
             else:
-                self.editor.classes[class1].fields.append(Field(field1))
+                item.fields.add(Field(field1))
                 self.ui.uiFeedback(f'Field `{field1}` has been added to class {class1}')
-                self.ui.updateAttributesBox(class1)  # Update the UI
+                self.editor.membersChanged(class1)
                 return True
         else:
             self.ui.uiError(f'Class {class1} does not exist')
@@ -326,13 +459,13 @@ class EditorController:
     # Adds a method to a class with a given list of parameters
     def addMethod(self, class1, method, params) -> bool:
         if class1 in self.editor.classes:
-            item = self.editor.classes[class1]
-            if Method(method) in item.methods:
+            item = self.editor.classes.edit(class1)
+            if method in item.methods:
                 self.ui.uiError(f'Method `{method}` already exists in the class {class1}')
             else:
-                self.editor.classes[class1].methods.append(Method(method, params))
+                item.methods.add(Method(method, params))
                 self.ui.uiFeedback(f'Method `{method}` has been added to class {class1}')
-                self.ui.updateAttributesBox(class1)  # Update the UI
+                self.editor.membersChanged(class1)
                 return True
         else:
             self.ui.uiError(f'Class {class1} does not exist')
@@ -341,11 +474,10 @@ class EditorController:
     # Deletes a method from a class regardless of the parameters
     def deleteMethod(self, class1, method) -> bool:
         if class1 in self.editor.classes:
-            item = self.editor.classes[class1]
-            if Method(method) in item.methods:
-                self.editor.classes[class1].methods.remove(Method(method))
+            item = self.editor.classes.edit(class1)
+            if item.methods.pop(method) is not None:
                 self.ui.uiFeedback(f'Method `{method}` has been removed from class {class1}')
-                self.ui.updateAttributesBox(class1)  # Update the UI
+                self.editor.membersChanged(class1)
                 return True
             else:
                 self.ui.uiError(f'Method `{method}` does not exist in class {class1}')
@@ -356,14 +488,12 @@ class EditorController:
     # Renames a method from a class without changing the parameters
     def renameMethod(self, class1, method1, method2) -> bool:
         if class1 in self.editor.classes:
-            item = self.editor.classes[class1]
-            if Method(method1) in item.methods:
-                if Method(method2) not in item.methods:
-                    idx = self.editor.classes[class1].methods.index(Method(method1))
-                    obj = self.editor.classes[class1].methods.pop(idx)
-                    self.editor.classes[class1].methods.append(Method(method2, obj.params))
+            item = self.editor.classes.edit(class1)
+            if method1 in item.methods:
+                if method2 not in item.methods:
+                    item.methods.rename(method1, method2)
                     self.ui.uiFeedback(f'Method `{method1}` renamed to {method2}!')
-                    self.ui.updateAttributesBox(class1)  # Update the UI
+                    self.editor.membersChanged(class1)
                     return True
                 else:
                     self.ui.uiError(f'Method `{method2}` already exists in the class {class1}')
@@ -374,16 +504,15 @@ class EditorController:
     # Removes a single parameter from a method
     def removeParameter(self, class1, method, param) -> bool:
         if class1 in self.editor.classes:
-            item = self.editor.classes[class1]
-            if Method(method) in item.methods:
-                idx = self.editor.classes[class1].methods.index(Method(method))
+            obj = self.editor.classes.edit(class1).methods.get(method)
+            if obj is not None:
                 try:
-                    self.editor.classes[class1].methods[idx].params.remove(param)
+                    obj.params.remove(param)
                 except ValueError:
                     self.ui.uiError(f'Method {method} did not have the parameter {param}!')
                     return False
                 self.ui.uiFeedback(f'Parameter `{param}` has been removed from method {method}!')
-                self.ui.updateAttributesBox(class1)  # Update the UI
+                self.editor.membersChanged(class1)
                 return True
             else:
                 self.ui.uiError(f'Method `{method}` does not exist in class {class1}')
@@ -394,12 +523,11 @@ class EditorController:
     # Removes every parameter from a method in a given class
     def clearParameters(self, class1, method) -> bool:
         if class1 in self.editor.classes:
-            item = self.editor.classes[class1]
-            if Method(method) in item.methods:
-                idx = self.editor.classes[class1].methods.index(Method(method))
-                self.editor.classes[class1].methods[idx].params.clear()
+            obj = self.editor.classes.edit(class1).methods.get(method)
+            if obj is not None:
+                obj.params.clear()
                 self.ui.uiFeedback(f'Parameters have been removed from method {method}!')
-                self.ui.updateAttributesBox(class1)  # Update the UI
+                self.editor.membersChanged(class1)
                 return True
             else:
                 self.ui.uiError(f'Method `{method}` does not exist in class {class1}')
@@ -410,16 +538,15 @@ class EditorController:
     # Renames a single parameter
     def renameParameter(self, class1, method, param1, param2) -> bool:
         if class1 in self.editor.classes:
-            item = self.editor.classes[class1]
-            if Method(method) in item.methods:
-                idx = self.editor.classes[class1].methods.index(Method(method))
-                if param1 not in self.editor.classes[class1].methods[idx].params:
+            obj = self.editor.classes.edit(class1).methods.get(method)
+            if obj is not None:
+                if param1 not in obj.params:
                     self.ui.uiError(f'Method `{method}` does not have a parameter named `{param1}`')
                     return False
-                idx2 = self.editor.classes[class1].methods[idx].params.index(param1)
-                self.editor.classes[class1].methods[idx].params[idx2] = param2
+                idx = obj.params.index(param1)
+                obj.params[idx] = param2
                 self.ui.uiFeedback(f'Parameter `{param1}` has been renamed to `{param2}`!')
-                self.ui.updateAttributesBox(class1)  # Update the UI
+                self.editor.membersChanged(class1)
                 return True
             else:
                 self.ui.uiError(f'Method `{method}` does not exist in class {class1}')
@@ -430,12 +557,11 @@ class EditorController:
     # Replaces entire parameter list
     def replaceParameters(self, class1, method, params) -> bool:
         if class1 in self.editor.classes:
-            item = self.editor.classes[class1]
-            if Method(method) in item.methods:
-                idx = self.editor.classes[class1].methods.index(Method(method))
-                self.editor.classes[class1].methods[idx].params = params
+            obj = self.editor.classes.edit(class1).methods.get(method)
+            if obj is not None:
+                obj.params = [sys.intern(param) for param in params]
                 self.ui.uiFeedback(f'Parameter list has been inserted into `{method}`!')
-                self.ui.updateAttributesBox(class1)  # Update the UI
+                self.editor.membersChanged(class1)
                 return True
             else:
                 self.ui.uiError(f'Method `{method}` does not exist in class {class1}')
@@ -443,23 +569,167 @@ class EditorController:
             self.ui.uiError(f'Class {class1} does not exist')
         return False
 
+    #===== Bulk Operations =====#
+    # Tooling that builds diagrams programmatically can change many things at
+    # once. The whole batch is checked against sets before anything changes,
+    # and nothing is applied if any part of it is invalid. It is then applied
+    # in one pass, so subscribers hear about it once, and the matching
+    # CommandBulkAdd/CommandBulkDelete makes it a single undo step
+    #
+    #   classes => list of (name, [field names], [(method name, [params])])
+    #   relationships => list of (source, destination, type)
+
+    # Adds classes with their members, then relationships between any classes,
+    # including the ones added by this batch
+    def bulkAdd(self, classes=(), relationships=()) -> bool:
+        with gcPaused():
+            built = self.bulkBuild(classes, relationships)
+            if built is not None:
+                self.bulkApply(*built)
+        if built is None:
+            self.ui.uiError(self.bulkAddError(classes, relationships))
+            return False
+        self.ui.uiFeedback(f'Added {len(classes)} classes and {len(relationships)} relationships!')
+        return True
+
+    # Builds the classes and relationships of a batch without changing the
+    # editor, checking the batch on the way with the same rules as
+    # bulkAddError, which is only run to describe a problem
+    # Returns (classes, relationships) ready for bulkApply, or None if the
+    # batch is invalid
+    def bulkBuild(self, classes, relationships):
+        editor = self.editor
+        existing = editor.classes.ids.keys()
+        built = {}
+        for name, fields, methods in classes:
+            clazz = Class(name)
+            if fields and not clazz.fields.extend(map(Field, fields)):
+                return None
+            if methods and not clazz.methods.extend([Method(method, params) for method, params in methods]):
+                return None
+            built[clazz.name] = clazz
+        if len(built) != len(classes) or not existing.isdisjoint(built):
+            return None
+
+        links = []
+        pairs = set()
+        for src, dst, typ in relationships:
+            if isinstance(typ, str):
+                typ = Type.make(typ.lower())
+                if not typ:
+                    return None
+            src_class = built.get(src) or editor.classes.get(src)
+            dst_class = built.get(dst) or editor.classes.get(dst)
+            if src_class is None or dst_class is None:
+                return None
+            # Relationships are undirected for the purpose of uniqueness
+            pair = (src, dst) if src <= dst else (dst, src)
+            if pair in pairs or (src not in built and dst not in built and
+                                 (editor.hasRelationship(src, dst) or editor.hasRelationship(dst, src))):
+                return None
+            pairs.add(pair)
+            links.append((src_class, dst_class, typ))
+        return list(built.values()), links
+
+    # The classes and relationships built by bulkBuild are stored with adopt,
+    # skipping the per-item checks, and the change is reported at once. Added
+    # to an empty editor, it is one Reset, as for a file that was opened.
+    # Otherwise each new class and relationship is reported, so subscribers
+    # only update what is new
+    def bulkApply(self, built, links):
+        editor = self.editor
+        empty = not editor.classes
+        with editor.batch():
+            editor.classes.adopt(built)
+            links = [((src.id, dst.id), Relationship(src, dst, typ)) for src, dst, typ in links]
+            editor.relationships.adopt(links)
+            if empty:
+                editor.events.emitAll([ChangeEvent(Change.Reset)])
+            else:
+                editor.events.emitAll([ChangeEvent(Change.ClassAdded, clazz.id) for clazz in built]
+                                      + [ChangeEvent(Change.RelationshipAdded, *key) for key, _ in links])
+
+    # Returns the first problem with a bulkAdd batch, or None if it is valid
+    # Names are checked with set operations, one pass over each list
+    def bulkAddError(self, classes, relationships):
+        existing = self.editor.classes.ids.keys()
+        names = {name for name, _, _ in classes}
+        if len(names) != len(classes) or not existing.isdisjoint(names):
+            seen = set()
+            for name, _, _ in classes:
+                if name in existing or name in seen:
+                    return f'Class {name} already exists'
+                seen.add(name)
+        for name, fields, methods in classes:
+            if len(set(fields)) != len(fields):
+                return f'Class {name} has the same field more than once'
+            # Method names are the keys of the (name, params) pairs
+            if len(dict(methods)) != len(methods):
+                return f'Class {name} has the same method more than once'
+
+        # Relationships are undirected for the purpose of uniqueness
+        missing = {name for src, dst, _ in relationships for name in (src, dst)} - names - existing
+        if missing:
+            return f'class `{min(missing)}` does not exist'
+        pairs = set()
+        for src, dst, typ in relationships:
+            if isinstance(typ, str) and not Type.make(typ.lower()):
+                return f'Invalid relationship type: {typ}'
+            pair = frozenset((src, dst))
+            # Only classes that existed before the batch can already be related
+            if pair in pairs or (src in existing and dst in existing and
+                                 (self.editor.hasRelationship(src, dst) or self.editor.hasRelationship(dst, src))):
+                return f'There is already a relationship between `{src}` and `{dst}`'
+            pairs.add(pair)
+        return None
+
+    # Deletes relationships, given as (class1, class2) in either direction,
+    # then deletes classes along with every relationship they are part of
+    def bulkDelete(self, classes=(), relationships=()) -> bool:
+        classes = list(dict.fromkeys(classes))
+        for name in classes:
+            if name not in self.editor.classes:
+                self.ui.uiError(f'No class exists with the name `{name}`')
+                return False
+        for class1, class2 in relationships:
+            if not self.editor.hasRelationship(class1, class2) and not self.editor.hasRelationship(class2, class1):
+                self.ui.uiError(f'No relationship found between {class1} and {class2}.')
+                return False
+
+        with self.editor.batch():
+            for class1, class2 in relationships:
+                if not self.editor.removeRelationship(class1, class2):
+                    # A pair given twice may already be gone
+                    self.editor.removeRelationship(class2, class1)
+            for name in classes:
+                for (src, dst) in self.editor.relationshipKeys(name):
+                    self.editor.removeRelationship(src, dst)
+                del self.editor.classes[name]
+        self.ui.uiFeedback(f'Deleted {len(classes)} classes and {len(relationships)} relationships!')
+        return True
+
+    # Describes a class in the form bulkAdd takes
+    def classSpec(self, name):
+        clazz = self.editor.classes[name]
+        return (name, clazz.fields.names(), [(m.name, m.params.copy()) for m in clazz.methods])
+
     def editorHelp(self):
         self.ui.displayHelp()
     
     # Helper function for listClasses and listRelationships
     def findRelationships(self, class_name):
         # Find all relationships associated with `class_name`
+        # The editor's adjacency index only gives the edges touching `class_name`
         related_classes = []
-        for (src, dst), relationship in self.editor.relationships.items():
-            # Ensure we’re checking the `Relationship` object, not a tuple
-            if src == class_name or dst == class_name:
-                # Check if the relationship has a valid `Type`
-                if not isinstance(relationship.typ, Type):
-                    self.ui.uiError(f"Invalid relationship type for relationship between {src} and {dst}")
-                else:
-                    # Determine direction and add to related_classes list
-                    direction = (class_name == src)
-                    related_classes.append((dst if direction else src, direction, relationship.typ))
+        for (src, dst) in self.editor.relationshipKeys(class_name):
+            relationship = self.editor.relationships[(src, dst)]
+            # Check if the relationship has a valid `Type`
+            if not isinstance(relationship.typ, Type):
+                self.ui.uiError(f"Invalid relationship type for relationship between {src} and {dst}")
+            else:
+                # Determine direction and add to related_classes list
+                direction = (class_name == src)
+                related_classes.append((dst if direction else src, direction, relationship.typ))
         return related_classes
 
     def listRelationships(self, class_name):
@@ -0,0 +1,188 @@
+import json
+import os
+from model.command_model import Command
+from model.relationship_model import Type
+
+# Append-only journal of the commands applied since a diagram was last written
+#
+# The journal of `diagram.json` is `diagram.json.journal`. Its first line
+# identifies the saved file it follows, by size and modification time. Every
+# other line is one step: a command that was done (pushed or redone) or undone,
+# with the state the command keeps for undo. Lines are flushed as they are
+# written, so they survive the editor crashing, and synced to disk on each
+# save, see `sync`.
+#
+# While the journal is small, saving only has to sync it, which costs as much
+# as the edits made since the last save. Once it passes `limit` bytes, the
+# next save writes the whole diagram again and starts an empty journal, which
+# folds the steps into the saved file. The file and its journal together are
+# the diagram, so every reader replays the journal after the file, see
+# loadFile.
+#
+# A journal whose first line does not match the saved file, because the file
+# was saved some other way, is ignored. Changes made without a command, such
+# as a call to the controller from a script, are not in the journal, so
+# `synced` keeps the editor's change count as of the last step, and the next
+# save writes the whole file if it has moved on. This only catches such
+# changes while no command follows them.
+JOURNAL_BYTES = 1024 * 1024
+SUFFIX = '.journal'
+
+# Commands by class name, for reading them back
+def _commands():
+    commands = {}
+    classes = list(Command.__subclasses__())
+    while classes:
+        cls = classes.pop()
+        commands[cls.__name__] = cls
+        classes.extend(cls.__subclasses__())
+    return commands
+
+# Relationship types are saved by name, and read back by the `type` key
+def _encode(obj):
+    if isinstance(obj, Type):
+        return {'type': obj.name}
+    raise TypeError(f'Cannot save {type(obj).__name__} in the journal')
+
+def _decode(obj):
+    if obj.keys() == {'type'}:
+        return Type[obj['type']]
+    return obj
+
+def encodeCommand(step, cmd) -> str:
+    return json.dumps({'step': step, 'command': type(cmd).__name__, 'state': vars(cmd)},
+                      default=_encode, separators=(',', ':'))
+
+# Returns (step, command) for a journal line
+def decodeCommand(line):
+    entry = json.loads(line, object_hook=_decode)
+    cls = _commands()[entry['command']]
+    cmd = cls.__new__(cls)
+    cmd.__dict__.update(entry['state'])
+    return entry['step'], cmd
+
+# Applies steps read from a journal through the controller `ctrl`
+def replay(ctrl, steps):
+    for step, cmd in steps:
+        if not (cmd.execute(ctrl) if step == 'do' else cmd.undo(ctrl)):
+            raise ValueError(f'{type(cmd).__name__} could not be replayed')
+
+class Journal:
+    def __init__(self, filename, limit=JOURNAL_BYTES):
+        self.filename = filename
+        self.path = filename + SUFFIX
+        self.limit = limit
+        self.file = None
+        # Steps written since the journal started, see restart
+        self.lines = []
+        # Whether steps were written since the journal was last synced
+        self.unsynced = False
+        # EventBus.generation after the last step, see EditorController.save
+        self.synced = None
+        # Whether the saved file is compact JSON
+        self.compact = False
+
+    # Identifies the saved file, so a journal is never replayed over a file
+    # it does not follow
+    def _header(self):
+        stat = os.stat(self.filename)
+        return json.dumps({'size': stat.st_size, 'mtime': stat.st_mtime_ns})
+
+    # Starts an empty journal for a file that was just saved in full
+    # The journal file is only created once there is a step to write
+    def start(self):
+        self.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        self.header = self._header()
+        self.lines = []
+
+    # Starts the journal again for a file that was replaced with a copy of
+    # the editor from before the last `count` steps, which are kept
+    def restart(self, count):
+        lines = self.lines[len(self.lines) - count:] if count else []
+        self.start()
+        for line in lines:
+            self._write(line)
+        self.sync()
+
+    # Reads the steps to replay over the file, which is none if there is no
+    # journal or it does not follow the file. A line cut off by a crash ends
+    # the steps
+    # Returns the steps, and the length of the journal up to the last one
+    def read(self):
+        header = self._header()
+        steps = []
+        if not os.path.exists(self.path):
+            return steps, 0
+        with open(self.path, 'rb') as f:
+            if f.readline().decode('utf-8', 'replace').rstrip('\n') != header:
+                return steps, 0
+            length = f.tell()
+            for line in f:
+                if not line.endswith(b'\n'):
+                    break
+                try:
+                    steps.append(decodeCommand(line.decode('utf-8')))
+                except (ValueError, KeyError, TypeError):
+                    break
+                length += len(line)
+        return steps, length
+
+    # Continues the journal of a file that was just loaded
+    # Returns the steps to replay over it, see read
+    def resume(self):
+        self.close()
+        self.header = self._header()
+        self.lines = []
+        steps, length = self.read()
+        if not steps:
+            return steps
+        # Anything after the last whole step is dropped, so new steps follow it
+        with open(self.path, 'r+b') as f:
+            f.truncate(length)
+        self.file = open(self.path, 'a')
+        self.lines = [encodeCommand(step, cmd) for step, cmd in steps]
+        return steps
+
+    # Appends one step: 'do' for a command that was executed, 'undo' for one
+    # that was undone
+    def record(self, step, cmd):
+        self._write(encodeCommand(step, cmd))
+
+    def _write(self, line):
+        if self.file is None:
+            self.file = open(self.path, 'w')
+            self.file.write(self.header + '\n')
+        self.file.write(line + '\n')
+        self.file.flush()
+        self.lines.append(line)
+        self.unsynced = True
+
+    # Makes sure the steps written so far are on disk, not only flushed to
+    # the system. Steps are synced in batches, by saves and autosaves, so
+    # each command does not wait on the disk
+    def sync(self):
+        if self.unsynced and self.file is not None:
+            os.fsync(self.file.fileno())
+        self.unsynced = False
+
+    # Whether the saved file is still the one the journal follows
+    def follows(self) -> bool:
+        try:
+            return self._header() == self.header
+        except OSError:
+            return False
+
+    def size(self) -> int:
+        return self.file.tell() if self.file is not None else 0
+
+    # Whether the next save should write the whole diagram
+    def full(self) -> bool:
+        return self.size() > self.limit
+
+    def close(self):
+        if self.file is not None:
+            self.sync()
+            self.file.close()
+            self.file = None
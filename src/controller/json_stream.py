@@ -0,0 +1,172 @@
+import json
+import re
+
+# Incremental reader and writer for diagram files
+#
+# A diagram file is one JSON object whose big values are arrays, such as
+#   {"classes": [...], "relationships": [...]}
+# Rather than reading the whole text and building the whole dict tree at once,
+# the file is read in chunks and each element of an array is decoded and handed
+# to the caller on its own. Only the unread part of the current chunk and the
+# element being decoded are held in memory. Writing works the same way, one
+# element at a time.
+#
+# Files are read in text mode. Malformed input raises json.JSONDecodeError,
+# which is a ValueError
+CHUNK_SIZE = 64 * 1024
+
+_WHITESPACE = re.compile(r'[ \t\n\r]*')
+_decoder = json.JSONDecoder()
+
+class JsonStream:
+    def __init__(self, file, chunk_size=CHUNK_SIZE):
+        self.file = file
+        self.chunk_size = chunk_size
+        self.buf = ''
+        self.pos = 0
+        self.eof = False
+        # Top-level keys seen so far by `items`, and those of them that were
+        # asked for but did not hold an array
+        self.found = set()
+        self.not_arrays = set()
+
+    # Reads the next chunk, dropping the part of the buffer already consumed
+    # Returns False at the end of the file
+    def _fill(self, size=None):
+        if self.eof:
+            return False
+        chunk = self.file.read(size or self.chunk_size)
+        self.buf = self.buf[self.pos:] + chunk
+        self.pos = 0
+        if not chunk:
+            self.eof = True
+        return bool(chunk)
+
+    def _error(self, msg):
+        return json.JSONDecodeError(msg, self.buf, self.pos)
+
+    # The next character that is not whitespace, without consuming it
+    # Returns '' at the end of the file
+    def _peek(self):
+        while True:
+            self.pos = _WHITESPACE.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._fill():
+                return ''
+
+    def _expect(self, char):
+        if self._peek() != char:
+            raise self._error(f'Expecting {char!r}')
+        self.pos += 1
+
+    # Decodes one complete value starting at the next non-whitespace character
+    # A value cut off by the end of the buffer fails to decode, or (for numbers)
+    # runs up to the end of it, so more is read and the value is decoded again.
+    # Reads grow each time, so a value much larger than a chunk is still read
+    # in a few passes
+    def value(self):
+        self._peek()
+        size = self.chunk_size
+        while True:
+            try:
+                obj, end = _decoder.raw_decode(self.buf, self.pos)
+                if end < len(self.buf) or self.eof:
+                    self.pos = end
+                    return obj
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            self._fill(size)
+            size *= 2
+
+    # Yields the elements of the array starting at the next character
+    def array(self):
+        self._expect('[')
+        if self._peek() == ']':
+            self.pos += 1
+            return
+        while True:
+            yield self.value()
+            char = self._peek()
+            self.pos += 1
+            if char == ']':
+                return
+            if char != ',':
+                self.pos -= 1
+                raise self._error("Expecting ',' delimiter")
+
+    # Yields (key, element) for every element of the arrays under `keys` in the
+    # top-level object, in file order. Other values are decoded and skipped
+    # The keys seen are added to `found`
+    def items(self, keys):
+        self._expect('{')
+        if self._peek() == '}':
+            self.pos += 1
+            return
+        while True:
+            if self._peek() != '"':
+                raise self._error('Expecting property name enclosed in double quotes')
+            key = self.value()
+            self.found.add(key)
+            self._expect(':')
+            if key in keys and self._peek() == '[':
+                for element in self.array():
+                    yield key, element
+            else:
+                if key in keys:
+                    self.not_arrays.add(key)
+                self.value()
+            char = self._peek()
+            self.pos += 1
+            if char == '}':
+                break
+            if char != ',':
+                self.pos -= 1
+                raise self._error("Expecting ',' delimiter")
+        if self._peek():
+            raise self._error('Extra data')
+
+# Streams the arrays under `keys` of the JSON object in `file`, see JsonStream.items
+def streamArrays(file, keys, chunk_size=CHUNK_SIZE):
+    return JsonStream(file, chunk_size).items(keys)
+
+# An element encoded already by elementEncoder, which writeArrays writes as it is
+class RawJSON(str):
+    __slots__ = ()
+
+# The function writeArrays encodes each element with. It gives the text of
+# the element as it appears in the file, indented for its place in an array
+def elementEncoder(indent=4, cls=json.JSONEncoder):
+    if indent is None:
+        return cls(separators=(',', ':')).encode
+    encode = cls(indent=indent).encode
+    inner = '\n' + ' ' * (2 * indent)
+    # Strings never hold a raw newline, so this only indents the structure
+    return lambda element: encode(element).replace('\n', inner)
+
+# Writes a JSON object whose values are arrays, one element at a time
+#   arrays => list of (key, iterable of elements)
+#   cls => JSONEncoder subclass used for the elements
+# Elements given as RawJSON, by the same elementEncoder, are written as they are
+# Only one element is ever encoded at a time. With an indent the output is
+# the same as json.dump with that indent, without one it has no whitespace
+def writeArrays(file, arrays, indent=4, cls=json.JSONEncoder):
+    encode = elementEncoder(indent, cls)
+    if indent is None:
+        outer = inner = ''
+        colon = ':'
+    else:
+        outer = '\n' + ' ' * indent
+        inner = outer + ' ' * indent
+        colon = ': '
+    file.write('{')
+    for i, (key, elements) in enumerate(arrays):
+        file.write(f'{"," if i else ""}{outer}{json.dumps(key)}{colon}[')
+        empty = True
+        for element in elements:
+            text = element if isinstance(element, RawJSON) else encode(element)
+            file.write(f'{inner if empty else "," + inner}{text}')
+            empty = False
+        file.write(']' if empty else outer + ']')
+    file.write(outer[:1] + '}' if arrays else '}')
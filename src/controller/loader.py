@@ -0,0 +1,218 @@
+import gc
+import io
+from contextlib import contextmanager
+from model.class_model import Class, Field, Method
+from model.relationship_model import Relationship, Type
+from controller.binary_format import MAGIC, MappedDiagram, isBinary, readBinary
+from controller.compression import detectCodec
+from controller.journal import Journal, replay
+from controller.json_stream import JsonStream
+from controller.model_cache import cacheable, readCached, writeCached
+from controller.project import ProjectDiagram, projectPath, readProject
+from controller.sqlite_store import isStore, readStore
+from controller.storage import fileStamp
+from controller.validator import Validator
+from view.ui_interface import UI
+
+# Pauses the cyclic garbage collector while a large model is built
+# Building only allocates objects that do not form cycles, so there is nothing
+# for it to find, and it would rescan the growing model over and over
+# The model lives on, so afterwards it is moved to the oldest generation
+# rather than scanned by the next young collection. freeze and unfreeze move
+# whole generations, which costs O(1)
+@contextmanager
+def gcPaused():
+    collecting = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if collecting:
+            gc.freeze()
+            gc.unfreeze()
+            gc.enable()
+
+# Builds the model straight from the elements of a save file
+#
+# Replaying a file through classAdd, addField and addMethod checks, reports and
+# redraws every item on its own. The loader builds the Class, Field and Method
+# objects itself, has the Validator check each item as it is read, and only
+# adds the classes and relationships to the editor once the whole file checked
+# out. Callers run it inside a transaction, so the UI is rebuilt once from the
+# batched events.
+#
+# Problems raise DiagramError, a ValueError listing every problem in the file,
+# and leave the editor as it was
+class ModelLoader:
+    def __init__(self, editor):
+        self.editor = editor
+        self.validator = Validator(editor)
+        self.classes = []
+        # (source, destination, Type), linked by finish()
+        self.relationships = []
+
+    # Reads the classes and relationships of a JsonStream
+    # `required` lists the keys the file must have
+    # The caller calls finish() afterwards
+    def read(self, stream, required=()):
+        for key, item in stream.items(('classes', 'relationships')):
+            if key == 'classes':
+                self.addClass(item)
+            else:
+                self.addRelationship(item)
+        self.validator.checkDocument(stream.found, required, stream.not_arrays)
+
+    # Adds a class given as a save file dict
+    # Once the file has a problem, classes are only checked, not built
+    def addClass(self, item):
+        if not self.validator.checkClass(item) or self.validator.problems:
+            return
+        fields = [Field(field['name']) for field in item['fields']]
+        methods = [Method(method['name'], [p['name'] for p in method['params']])
+                   for method in item['methods']]
+        position = item.get('position')
+        self.build(item['name'], fields, methods, (position['x'], position['y']) if position else None)
+
+    # Adds a class built from its Field and Method objects
+    def add(self, name, fields, methods, position=None):
+        if self.validator.checkMembers(name, fields, methods) and not self.validator.problems:
+            self.build(name, fields, methods, position)
+
+    def build(self, name, fields, methods, position):
+        clazz = Class(name)
+        if fields:
+            clazz.fields.extend(fields)
+        if methods:
+            clazz.methods.extend(methods)
+        clazz.position = position
+        self.classes.append(clazz)
+
+    # Queues a relationship given as a save file dict
+    # Its classes may come later in the file, so it is checked by finish()
+    def addRelationship(self, item):
+        typ = self.validator.checkRelationship(item)
+        if typ:
+            self.relationships.append((item['source'], item['destination'], typ))
+
+    def relate(self, src, dst, typ):
+        self.validator.checkRelated(src, dst)
+        self.relationships.append((src, dst, typ))
+
+    # Checks the relationships, then adds everything to the editor
+    # Returns the classes and the (source, destination, Type) added
+    def finish(self):
+        self.validator.finish()
+        editor = self.editor
+        classes, relationships = self.classes, self.relationships
+        for clazz in classes:
+            editor.classes[clazz.name] = clazz
+        for src, dst, typ in relationships:
+            editor.addRelationship(src, dst, typ)
+        self.classes = []
+        self.relationships = []
+        return classes, relationships
+
+# Loads a save file into the editor, telling the binary format from JSON by
+# its first bytes. `required` lists the keys a JSON file must have
+# A compressed file is read through its decompressing stream, see
+# controller/compression.py, a SQLite store through its tables, and a project
+# directory, or its manifest, shard by shard, see controller/project.py
+# Large files are cached once loaded, and read from the cache while they are
+# unchanged, see controller/model_cache.py
+# The steps in the file's journal are replayed after it unless `journal` is
+# False, for a caller that resumes the journal itself, see replayJournal
+def loadFile(editor, filename, required=(), journal=True):
+    path = projectPath(filename)
+    if path is not None:
+        loader = ModelLoader(editor)
+        with gcPaused():
+            readProject(path, loader)
+            loader.finish()
+        return
+    if isStore(filename):
+        loader = ModelLoader(editor)
+        with gcPaused():
+            readStore(filename, loader)
+            loader.finish()
+        return
+    loader = ModelLoader(editor)
+    codec = detectCodec(filename)
+    cache = cacheable(filename, codec is not None)
+    with gcPaused():
+        if cache:
+            stamp = fileStamp(filename)
+            keys = readCached(filename, loader)
+            if keys is not None:
+                loader.validator.checkDocument(keys, required)
+                loader.finish()
+                if journal:
+                    replayJournal(editor, filename)
+                return
+        if codec is None:
+            with open(filename, 'rb') as f:
+                keys = _load(loader, f, required)
+        else:
+            with open(filename, 'rb') as raw, codec.open(raw, 'rb') as f:
+                keys = _load(loader, f, required)
+        added = loader.finish()
+    if cache:
+        writeCached(filename, stamp, keys, *added)
+    if journal:
+        replayJournal(editor, filename)
+
+# Replays the journal of a file that was just loaded, see controller/journal.py
+# A save only syncs the journal while it is small, so the file alone can be
+# behind the diagram. The steps run through a controller with no UI. The
+# controller module imports this one, so it is imported here
+def replayJournal(editor, filename):
+    steps, _ = Journal(filename).read()
+    if steps:
+        from controller.editor_controller import EditorController
+        replay(EditorController(UI(), editor), steps)
+
+# Reads a binary or JSON file into a ModelLoader
+# Returns the top-level keys of the file
+def _load(loader, file, required):
+    if file.read(len(MAGIC)) == MAGIC:
+        file.seek(0)
+        readBinary(file, loader)
+        return {'classes', 'relationships'}
+    file.seek(0)
+    stream = JsonStream(io.TextIOWrapper(file, encoding='utf-8'))
+    loader.read(stream, required)
+    return stream.found
+
+# Replaces the editor's model with the diagram in a file. Binary files are
+# mapped, and their classes are only read when they are first used, see
+# MappedDiagram. A project reads a shard when one of its classes is first
+# used, see ProjectDiagram. Other files are loaded in full
+# The file's journal is replayed as it is by loadFile
+def openFile(editor, filename, journal=True):
+    editor.classes.clear()
+    editor.clearRelationships()
+    path = projectPath(filename)
+    if path is not None:
+        diagram = ProjectDiagram(path)
+    elif isBinary(filename):
+        diagram = MappedDiagram(filename)
+    else:
+        loadFile(editor, filename, journal=journal)
+        return
+    if len(set(diagram.names)) != len(diagram.names):
+        raise ValueError('A class is in the file more than once')
+    with gcPaused():
+        classes = diagram.classes()
+        editor.classes.adopt(classes)
+        # Classes are new, so relationships are linked by id, only checking
+        # that no pair of classes is related twice
+        pairs = set()
+        relationships = []
+        for src, dst, typ in diagram.relationships(classes):
+            pair = (src.id, dst.id) if src.id <= dst.id else (dst.id, src.id)
+            if pair in pairs:
+                raise ValueError(f'There is already a relationship between `{src.name}` and `{dst.name}`')
+            pairs.add(pair)
+            relationships.append(((src.id, dst.id), Relationship(src, dst, typ)))
+        editor.relationships.adopt(relationships)
+    if journal and path is None:
+        replayJournal(editor, filename)
@@ -0,0 +1,122 @@
+import hashlib
+import marshal
+import os
+import struct
+from model.class_model import Field, Method
+from model.relationship_model import Type
+from controller.storage import fileStamp, replaceFile
+
+# Cache of the diagrams last loaded from large files
+#
+# Parsing a large JSON file, or decompressing one, takes most of the time of
+# a load. Once a file has been loaded, the classes and relationships it held
+# are written to the cache as plain tuples with marshal, which reads back
+# several times faster than any of the save formats. The next load of the
+# same file reads the cache instead, and goes through the ModelLoader as
+# usual, so it is checked against the editor like any other load.
+#
+# An entry is only used for the file it was made from, while it has the same
+# size, modification time and content hash. The hash is checked on every
+# use, so a file changed without its size or time changing is read again.
+# A file that is not worth caching, or an entry that is missing, stale or
+# unreadable, is simply loaded from the file, which makes a new entry.
+#
+# Entries are named after the hash of the file's full path, and the least
+# recently used are removed once there are more than CACHE_ENTRIES. They are
+# kept under $XDG_CACHE_HOME, or ~/.cache if it is not set. Setting
+# NO_CACHE_VARIABLE in the environment to anything but an empty string turns
+# the cache off, so nothing is read from or written to it
+CACHE_DIR = os.path.join(os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache'),
+                         'uml_editor')
+NO_CACHE_VARIABLE = 'UML_EDITOR_NO_CACHE'
+CACHE_ENTRIES = 16
+# Smaller files load quickly enough on their own. A compressed file holds
+# several times its size, and takes longer to read, so it is cached from a
+# smaller size
+CACHE_MIN_BYTES = 1024 * 1024
+COMPRESSED_MIN_BYTES = 64 * 1024
+MAGIC = b'UMLC'
+VERSION = 1
+
+_header = struct.Struct('<4sHI')
+
+def _entryName(path):
+    return os.path.join(CACHE_DIR, hashlib.sha1(path.encode('utf-8', 'surrogateescape')).hexdigest() + '.cache')
+
+def _digest(filename):
+    digest = hashlib.blake2b(digest_size=16)
+    with open(filename, 'rb') as f:
+        while chunk := f.read(1024 * 1024):
+            digest.update(chunk)
+    return digest.digest()
+
+def cacheable(filename, compressed=False) -> bool:
+    if os.environ.get(NO_CACHE_VARIABLE):
+        return False
+    try:
+        return os.path.getsize(filename) >= (COMPRESSED_MIN_BYTES if compressed else CACHE_MIN_BYTES)
+    except OSError:
+        return False
+
+# Reads the diagram cached for `filename` into a ModelLoader
+# Returns the top-level keys the file had, or None if there is no valid
+# entry, in which case nothing was read. The caller calls loader.finish()
+def readCached(filename, loader):
+    path = os.path.abspath(filename)
+    try:
+        with open(_entryName(path), 'rb') as f:
+            magic, version, size = _header.unpack(f.read(_header.size))
+            if magic != MAGIC or version != VERSION:
+                return None
+            key = marshal.loads(f.read(size))
+            if key != (path, *fileStamp(filename), _digest(filename)):
+                return None
+            keys, classes, relationships = marshal.loads(f.read())
+        # Used now, so it is the last to be removed
+        os.utime(_entryName(path))
+    except (OSError, EOFError, ValueError, TypeError, struct.error):
+        return None
+    for name, fields, methods, position in classes:
+        loader.add(name, [Field(field) for field in fields],
+                   [Method(method, params) for method, params in methods], position)
+    for src, dst, typ in relationships:
+        loader.relate(src, dst, Type(typ))
+    return set(keys)
+
+# Caches the classes and relationships loaded from `filename`, as returned by
+# ModelLoader.finish. `stamp` is the size and time of the file before it was
+# read, so a file changed while it was read is not cached
+def writeCached(filename, stamp, keys, classes, relationships):
+    path = os.path.abspath(filename)
+    try:
+        digest = _digest(filename)
+        if fileStamp(filename) != stamp:
+            return
+        key = marshal.dumps((path, *stamp, digest))
+        body = marshal.dumps((
+            sorted(keys),
+            [(clazz.name, [field.name for field in clazz.fields],
+              [(method.name, method.params) for method in clazz.methods], clazz.position)
+             for clazz in classes],
+            [(src, dst, typ.value) for src, dst, typ in relationships]))
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        with replaceFile(_entryName(path), 'wb') as f:
+            f.write(_header.pack(MAGIC, VERSION, len(key)))
+            f.write(key)
+            f.write(body)
+        _evict()
+    except (OSError, ValueError):
+        pass
+
+# Removes the least recently used entries beyond CACHE_ENTRIES
+def _evict():
+    entries = []
+    for entry in os.scandir(CACHE_DIR):
+        if entry.name.endswith('.cache'):
+            entries.append((entry.stat().st_mtime_ns, entry.path))
+    entries.sort()
+    for _, name in entries[:-CACHE_ENTRIES]:
+        try:
+            os.remove(name)
+        except OSError:
+            pass
@@ -0,0 +1,383 @@
+import json
+import os
+import re
+from model.class_model import Field, LazyClass, Members, Method
+from model.editor_model import EditorEncoder
+from model.event_model import Change
+from model.relationship_model import Type
+from controller.json_stream import JsonStream, writeArrays
+from controller.storage import replaceFile
+from controller.validator import DiagramError, lazyClassProblems
+
+# A diagram saved as a project directory
+#
+#   diagram.umlproj/
+#       manifest.json               the shards, the names of their classes,
+#                                   and the relationships file
+#       shard-0000.json             up to SHARD_CLASSES classes, as a save
+#       shard-0001.json             file's "classes" array
+#       relationships-0000.json     every relationship, as a save file's
+#                                   "relationships" array
+#
+# The manifest also names the classes of each shard that have methods, so
+# opening a project reads only the manifest and the relationships: every
+# class is a LazyClass, and a shard is parsed the first time one of its
+# classes is used. Loading a project reads every shard, through ModelLoader
+# like any save file.
+#
+# A project attached to an editor follows its change events, and remembers
+# which shards hold changed classes. Saving writes only those shards, and the
+# relationships and manifest if they changed. New classes go to the last
+# shard until it is full. A shard left empty is deleted.
+#
+# A save never writes over a file the manifest on disk lists. Changed shards
+# and relationships are written under new names, then the manifest is
+# replaced in one step, see replaceFile, and only then are the files it no
+# longer lists deleted. A crash at any point leaves the old manifest with the
+# files it lists, or the new one with its files, so the project always opens.
+# A crash before the manifest is written leaves new files nothing lists,
+# which are skipped when picking names later.
+#
+# Saving picks a project for names ending in EXTENSION. Loading takes the
+# directory or its manifest
+EXTENSION = '.umlproj'
+MANIFEST = 'manifest.json'
+SHARD_FILE = 'shard-{:04d}.json'
+RELATIONSHIPS_FILE = 'relationships-{:04d}.json'
+VERSION = 1
+SHARD_CLASSES = 256
+_DATA_FILE = re.compile(r'(shard|relationships)-\d{4,}\.json')
+
+def isProjectName(filename) -> bool:
+    return filename.rstrip('/\\').lower().endswith(EXTENSION)
+
+# The directory of the project at `filename`, which is the directory or its
+# manifest, or None if it is not a project
+def projectPath(filename):
+    if os.path.isdir(filename) and os.path.isfile(os.path.join(filename, MANIFEST)):
+        return filename
+    if os.path.basename(filename) == MANIFEST and os.path.isfile(filename):
+        return os.path.dirname(filename) or '.'
+    return None
+
+def isProject(filename) -> bool:
+    return projectPath(filename) is not None
+
+def readManifest(path):
+    with open(os.path.join(path, MANIFEST)) as f:
+        manifest = json.load(f)
+    if manifest.get('version') != VERSION:
+        raise ValueError('Unsupported project version')
+    return manifest
+
+# The files a manifest lists
+def _manifestFiles(manifest):
+    return [shard['file'] for shard in manifest['shards']] + [manifest['relationships']]
+
+# The first name made from `pattern` and a number from `number` on, that no
+# file in the project has and that is not in `taken`
+# Returns the name and the number after it, to go on from
+def _freshName(path, pattern, number=0, taken=()):
+    while True:
+        name = pattern.format(number)
+        number += 1
+        if name not in taken and not os.path.exists(os.path.join(path, name)):
+            return name, number
+
+# Writes a list of classes as a shard, with EditorEncoder
+def _writeShard(path, file, classes):
+    with replaceFile(os.path.join(path, file)) as f:
+        writeArrays(f, [('classes', classes)], 4, EditorEncoder)
+
+def _writeRelationships(path, file, relationships):
+    with replaceFile(os.path.join(path, file)) as f:
+        writeArrays(f, [('relationships', relationships)], 4, EditorEncoder)
+
+def _writeManifest(path, shards, relationships):
+    with replaceFile(os.path.join(path, MANIFEST)) as f:
+        json.dump({'version': VERSION, 'shards': shards, 'relationships': relationships}, f, indent=4)
+
+def _shardEntry(file, classes):
+    return {'file': file,
+            'classes': [clazz.name for clazz in classes],
+            'methods': [clazz.name for clazz in classes if clazz.hasMethods()]}
+
+# Deletes the files in `old_files`, and the shard and relationships files
+# left by a save that did not get to write its manifest, that are not in
+# `files`, the files the manifest now lists
+def _removeStale(path, old_files, files):
+    old_files = set(old_files) | {name for name in os.listdir(path) if _DATA_FILE.fullmatch(name)}
+    for file in old_files - set(files):
+        try:
+            os.remove(os.path.join(path, file))
+        except FileNotFoundError:
+            pass
+
+# Writes `model`, an Editor or a Snapshot, as the project `path`, replacing
+# what it held. The files of a project that was there are left alone until
+# the new manifest is written
+def writeProject(model, path):
+    os.makedirs(path, exist_ok=True)
+    try:
+        old_files = _manifestFiles(readManifest(path))
+    except (OSError, ValueError, KeyError, TypeError):
+        old_files = []
+    classes = list(model.classes.values())
+    shards = []
+    number = 0
+    for start in range(0, len(classes), SHARD_CLASSES):
+        group = classes[start:start + SHARD_CLASSES]
+        file, number = _freshName(path, SHARD_FILE, number)
+        _writeShard(path, file, group)
+        shards.append(_shardEntry(file, group))
+    relationships, _ = _freshName(path, RELATIONSHIPS_FILE)
+    _writeRelationships(path, relationships, model.relationships.values())
+    _writeManifest(path, shards, relationships)
+    _removeStale(path, old_files, [shard['file'] for shard in shards] + [relationships])
+
+# Reads the project at `path` into a ModelLoader, shard by shard
+# The caller calls loader.finish() afterwards
+def readProject(path, loader):
+    manifest = readManifest(path)
+    for shard in manifest['shards']:
+        names = []
+        loader.validator.document(shard['file'])
+        with open(os.path.join(path, shard['file'])) as f:
+            for _, item in JsonStream(f).items(('classes',)):
+                loader.addClass(item)
+                names.append(item.get('name') if isinstance(item, dict) else None)
+        if names != shard['classes']:
+            raise ValueError(f'{shard["file"]} does not hold the classes the manifest lists')
+    loader.validator.document(manifest['relationships'])
+    with open(os.path.join(path, manifest['relationships'])) as f:
+        for _, item in JsonStream(f).items(('relationships',)):
+            loader.addRelationship(item)
+
+# Gives the classes of one shard to their LazyClass, see LazyClass.loadClass
+# The shard is parsed when the first of them is used
+class _ShardSource:
+    def __init__(self, filename, names):
+        self.filename = filename
+        self.names = names
+        self.members = None
+
+    # A shard with a malformed class raises a DiagramError, listing every
+    # problem in it
+    def loadClass(self, index):
+        if self.members is None:
+            file = os.path.basename(self.filename)
+            members = []
+            problems = []
+            try:
+                with open(self.filename) as f:
+                    for i, (_, item) in enumerate(JsonStream(f).items(('classes',))):
+                        problems += lazyClassProblems(f'{file}: $.classes[{i}]', item)
+                        if problems:
+                            continue
+                        position = item.get('position')
+                        members.append((
+                            item['name'],
+                            Members([Field(field['name']) for field in item['fields']]),
+                            Members([Method(method['name'], [p['name'] for p in method['params']])
+                                     for method in item['methods']]),
+                            (position['x'], position['y']) if position else None))
+            except (OSError, ValueError) as e:
+                raise DiagramError([(file, str(e))])
+            if problems:
+                raise DiagramError(problems)
+            if [name for name, _, _, _ in members] != self.names:
+                raise DiagramError([(file, 'does not hold the classes the manifest lists')])
+            self.members = members
+        _, fields, methods, position = self.members[index]
+        return fields, methods, position
+
+# A project opened without reading its shards, used like MappedDiagram by
+# openFile. Its classes are LazyClass, loaded a shard at a time
+class ProjectDiagram:
+    def __init__(self, path):
+        self.path = path
+        self.manifest = readManifest(path)
+        self.names = [name for shard in self.manifest['shards'] for name in shard['classes']]
+
+    # The classes, not loaded yet, in manifest order
+    def classes(self):
+        classes = []
+        for shard in self.manifest['shards']:
+            source = _ShardSource(os.path.join(self.path, shard['file']), shard['classes'])
+            methods = set(shard['methods'])
+            classes += [LazyClass(name, source, i, name in methods) for i, name in enumerate(shard['classes'])]
+        return classes
+
+    # (source, destination, Type) for every relationship, with the classes
+    # taken from `classes`
+    def relationships(self, classes):
+        by_name = {clazz.name: clazz for clazz in classes}
+        relationships = []
+        with open(os.path.join(self.path, self.manifest['relationships'])) as f:
+            for _, item in JsonStream(f).items(('relationships',)):
+                src, dst = by_name.get(item['source']), by_name.get(item['destination'])
+                if src is None or dst is None:
+                    raise ValueError(f'class `{item["source"] if src is None else item["destination"]}` does not exist')
+                typ = Type.make(item['type'].lower())
+                if not typ:
+                    raise ValueError(f'Invalid relationship type: {item["type"]}')
+                relationships.append((src, dst, typ))
+        return relationships
+
+class Project:
+    def __init__(self, path):
+        self.path = path
+        self.editor = None
+        # Shard file -> ids of its classes, in editor order
+        self.shards = {}
+        self.shard_of = {}
+        # The files the manifest on disk lists, which a save never writes over
+        self.listed = set()
+        self.relationships = None
+        # Where to go on from when picking new shard and relationships names
+        self.shard_number = 0
+        self.relationships_number = 0
+        # Whether each class had methods when the manifest was written
+        self.methods = {}
+        self.dirty = set()
+        self.relationships_dirty = False
+        self.manifest_dirty = False
+
+    # Follows `editor` from now on. The editor must hold what the project
+    # holds, as it does after the project is loaded, opened or written
+    def attach(self, editor):
+        self.detach()
+        # Changes already made are in the project, and must not reach it
+        editor.events.flush()
+        self.editor = editor
+        classes = editor.classes
+        manifest = readManifest(self.path)
+        self.shards = {}
+        self.shard_of = {}
+        for shard in manifest['shards']:
+            ids = [classes.idOf(name) for name in shard['classes']]
+            self.shards[shard['file']] = ids
+            for cid in ids:
+                self.shard_of[cid] = shard['file']
+        self.listed = set(_manifestFiles(manifest))
+        self.relationships = manifest['relationships']
+        self.shard_number = self.relationships_number = 0
+        self.methods = {cid: classes.byId(cid).hasMethods() for cid in self.shard_of}
+        self.dirty = set()
+        self.relationships_dirty = self.manifest_dirty = False
+        editor.subscribe(self.onEditorChanges)
+        editor.markSaved()
+
+    def detach(self):
+        if self.editor is not None:
+            self.editor.unsubscribe(self.onEditorChanges)
+            self.editor = None
+
+    def onEditorChanges(self, events):
+        classes = self.editor.classes
+        for event in events:
+            match event.kind:
+                case Change.Reset:
+                    # Every class goes back into a shard, in editor order
+                    # Shards left empty are deleted by save
+                    self.dirty.update(self.shards)
+                    self.shards = {}
+                    self.shard_of = {}
+                    for clazz in classes.values():
+                        self.place(clazz.id)
+                    self.relationships_dirty = self.manifest_dirty = True
+                case Change.ClassAdded:
+                    if classes.byId(event.class_id) is not None and event.class_id not in self.shard_of:
+                        self.place(event.class_id)
+                        self.manifest_dirty = True
+                case Change.ClassDeleted:
+                    if classes.byId(event.class_id) is None and event.class_id in self.shard_of:
+                        file = self.shard_of.pop(event.class_id)
+                        self.shards[file].remove(event.class_id)
+                        self.methods.pop(event.class_id, None)
+                        self.dirty.add(file)
+                        self.manifest_dirty = True
+                case Change.ClassRenamed:
+                    if event.class_id in self.shard_of:
+                        self.dirty.add(self.shard_of[event.class_id])
+                        # Relationships and the manifest refer to classes by name
+                        self.relationships_dirty = self.manifest_dirty = True
+                case Change.MembersChanged | Change.ClassMoved:
+                    if event.class_id in self.shard_of:
+                        self.dirty.add(self.shard_of[event.class_id])
+                case Change.RelationshipAdded | Change.RelationshipDeleted | Change.RelationshipChanged:
+                    self.relationships_dirty = True
+
+    # Puts a new class in the last shard, or in a new one once that is full
+    def place(self, cid):
+        last = next(reversed(self.shards), None)
+        if last is None or len(self.shards[last]) >= SHARD_CLASSES:
+            last, self.shard_number = _freshName(self.path, SHARD_FILE, self.shard_number, self.shards)
+            self.shards[last] = []
+        self.shards[last].append(cid)
+        self.shard_of[cid] = last
+        self.dirty.add(last)
+
+    # Writes the shards with changed classes, then the relationships and the
+    # manifest if they changed, and then deletes the files the manifest no
+    # longer lists. Returns the number of files written
+    # A shard or relationships file the manifest lists is written under a
+    # new name. If a write fails, nothing is deleted, and what changed is
+    # still to be saved
+    def save(self):
+        editor = self.editor
+        # The project hears about changes when their events are delivered
+        editor.events.flush()
+        classes = editor.classes
+        path = self.path
+        written = 0
+        shards = {}
+        renamed = []
+        for file, ids in self.shards.items():
+            if file not in self.dirty:
+                shards[file] = ids
+                continue
+            # A shard left empty goes once the manifest no longer lists it
+            if not ids:
+                self.manifest_dirty = True
+                continue
+            new = file
+            if file in self.listed:
+                new, self.shard_number = _freshName(path, SHARD_FILE, self.shard_number, self.shards)
+                renamed.append(new)
+                self.manifest_dirty = True
+            group = [classes.byId(cid) for cid in ids]
+            _writeShard(path, new, group)
+            written += 1
+            shards[new] = ids
+            for clazz in group:
+                if self.methods.get(clazz.id) != clazz.hasMethods():
+                    self.methods[clazz.id] = clazz.hasMethods()
+                    self.manifest_dirty = True
+        if any(file not in self.shards for file in self.dirty):
+            self.manifest_dirty = True
+        relationships = self.relationships
+        if self.relationships_dirty:
+            relationships, self.relationships_number = _freshName(path, RELATIONSHIPS_FILE,
+                                                                  self.relationships_number)
+            _writeRelationships(path, relationships, editor.relationships.values())
+            written += 1
+            self.manifest_dirty = True
+        if self.manifest_dirty:
+            _writeManifest(path, [_shardEntry(file, [classes.byId(cid) for cid in ids])
+                                  for file, ids in shards.items()], relationships)
+            written += 1
+
+        # The new manifest is on disk, so the files it replaced can go
+        old = self.listed
+        self.shards = shards
+        for file in renamed:
+            for cid in shards[file]:
+                self.shard_of[cid] = file
+        self.relationships = relationships
+        self.listed = set(shards) | {relationships}
+        self.dirty = set()
+        self.relationships_dirty = self.manifest_dirty = False
+        _removeStale(path, old, self.listed)
+        editor.markSaved()
+        return written
@@ -0,0 +1,129 @@
+import threading
+from model.editor_model import Editor, canonicalClass, serializeClass, serializeRelationship
+from model.snapshot_model import Snapshot
+from controller.binary_format import isBinaryName, writeBinary
+from controller.compression import baseName, codecForName
+from controller.json_stream import RawJSON, elementEncoder, writeArrays
+from controller.project import isProjectName, writeProject
+from controller.sqlite_store import isStoreName, writeStore
+from controller.storage import replaceFile
+
+# The one path every save takes, from the CLI, the GUI, autosave or a script
+#
+# It reads only the model: an Editor, a Snapshot of one, or the diagram of a
+# DiagramStore. Class.position is the layout, and every relationship in the
+# table is saved, whether or not a UI has drawn it. No window is needed, so a
+# batch job can load, edit and save a positioned diagram with nothing but an
+# Editor.
+
+# The diagram as plain JSON values
+def serializeDiagram(model) -> dict:
+    return {
+        'classes': [serializeClass(clazz) for clazz in model.classes.values()],
+        'relationships': [serializeRelationship(rel) for rel in model.relationships.values()]
+    }
+
+# A canonical save gives the same bytes for the same diagram, whatever order
+# it was built in, so identical diagrams diff as identical and dedupe. Classes
+# are sorted by name, relationships by source and destination, and each class
+# is saved with canonicalClass. Compressed files are deterministic already,
+# see controller/compression.py. Other saves keep the order of the editor
+def _canonicalOrder(model):
+    classes = sorted(model.classes.values(), key=lambda clazz: clazz.name)
+    relationships = sorted(model.relationships.values(), key=lambda rel: (rel.src, rel.dst))
+    return classes, relationships
+
+# The encoded JSON of every class and relationship of an editor, as last
+# written
+#
+# Writing a large diagram as JSON mostly goes to encoding it, and most of it
+# has not changed since the last save. The texts of the classes are kept with
+# the snapshot they were encoded from. A class the editor has not changed
+# since is the very same object in a later snapshot, see Snapshot, so its
+# text is reused, and only classes that were added or changed are encoded.
+# A relationship's text only depends on its classes' names and its type, so
+# it is kept under those.
+#
+# Holding the snapshot makes the editor copy a class the first time it is
+# changed after a save, as autosave already does. The texts take about as
+# much memory as the file
+class DiagramTexts:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.snapshot = None
+        # (compact, canonical) the texts were encoded for
+        self.style = None
+        # Class id -> RawJSON of the class in self.snapshot
+        self.classes = {}
+        # (source, destination, Type) -> RawJSON of the relationship
+        self.relationships = {}
+
+    # The texts of the classes and the relationships of `snapshot`, in the
+    # order they are saved in, encoding only what changed since the last call
+    def encode(self, snapshot, compact, canonical=False):
+        encode = elementEncoder(None if compact else 4)
+        serialize = canonicalClass if canonical else serializeClass
+        with self.lock:
+            if (compact, canonical) != self.style:
+                self.snapshot, self.classes, self.relationships = None, {}, {}
+            old = self.snapshot.classes if self.snapshot is not None else {}
+            classes = {}
+            for cid, clazz in snapshot.classes.items():
+                if old.get(cid) is clazz:
+                    classes[cid] = self.classes[cid]
+                else:
+                    classes[cid] = RawJSON(encode(serialize(clazz)))
+            relationships = {}
+            for rel in snapshot.relationships.values():
+                key = (rel.src, rel.dst, rel.typ)
+                text = self.relationships.get(key)
+                relationships[key] = text if text is not None else RawJSON(encode(serializeRelationship(rel)))
+            self.snapshot, self.style = snapshot, (compact, canonical)
+            self.classes, self.relationships = classes, relationships
+            if not canonical:
+                return list(classes.values()), list(relationships.values())
+            order = sorted(snapshot.classes.items(), key=lambda item: item[1].name)
+            return ([classes[cid] for cid, _ in order],
+                    [relationships[key] for key in sorted(relationships, key=lambda key: key[:2])])
+
+# Writes the diagram to `filename` in place of the old file, see replaceFile
+# Names ending in .umlb are saved in the binary format, anything else as
+# JSON, indented unless `compact`. Either can be compressed by adding .gz,
+# .bz2 or .xz to the name, see controller/compression.py. Names ending in
+# .db, .sqlite or .sqlite3 are SQLite stores, written in one transaction,
+# and names ending in .umlproj are project directories, see
+# controller/project.py. Classes and relationships are written one at a
+# time, so the whole document is never built in memory. Given the
+# DiagramTexts of the editor, a JSON save of the editor or a snapshot of it
+# only encodes what changed. JSON saves can be `canonical`, see _canonicalOrder
+def writeDiagram(model, filename, compact=False, texts=None, canonical=False):
+    if isProjectName(filename):
+        writeProject(model, filename)
+        return
+    if isStoreName(filename):
+        writeStore(model, filename)
+        return
+    codec = codecForName(filename)
+    binary = isBinaryName(baseName(filename))
+    with replaceFile(filename, 'wb' if binary or codec else 'w') as f:
+        if codec:
+            with codec.open(f, 'wb' if binary else 'wt') as stream:
+                _write(model, stream, binary, compact, texts, canonical)
+        else:
+            _write(model, f, binary, compact, texts, canonical)
+
+def _write(model, file, binary, compact, texts, canonical):
+    if binary:
+        writeBinary(file, model.classes.values(), model.relationships.values())
+        return
+    if isinstance(model, Editor) and texts is not None:
+        model = model.snapshot()
+    if isinstance(model, Snapshot) and texts is not None:
+        classes, relationships = texts.encode(model, compact, canonical)
+    elif canonical:
+        classes, relationships = _canonicalOrder(model)
+        classes, relationships = map(canonicalClass, classes), map(serializeRelationship, relationships)
+    else:
+        classes = map(serializeClass, model.classes.values())
+        relationships = map(serializeRelationship, model.relationships.values())
+    writeArrays(file, [('classes', classes), ('relationships', relationships)], None if compact else 4)
@@ -0,0 +1,377 @@
+import itertools
+import os
+import sqlite3
+import urllib.request
+from model.class_model import Class, Field, Method
+from model.event_model import Change
+from model.relationship_model import Relationship, Type
+
+# A diagram kept in a local SQLite database
+#
+# Classes, their members, positions and relationships are rows in indexed
+# tables. Once a store is attached to an editor it follows the editor's change
+# events, and every batch of changes is one database transaction that only
+# touches the rows of what changed:
+#   - a class added, renamed or moved is an UPSERT of its row
+#   - a member added or renamed is an UPSERT of its row, and a member
+#     deleted is a DELETE of its row. Members are keyed by their slot, see
+#     Members.slots, and the parameters of a method whose list changed
+#     replace its parameter rows
+#   - a relationship added or changed is an UPSERT of its row
+#   - a class or relationship deleted is a DELETE of its row, and the rows
+#     that refer to a class go with it
+# Only a Reset, such as loading another file, writes every row again.
+#
+# Events say what changed, not how, so the store reads the current state of
+# each class and relationship named by an event. A class that is gone by
+# then is deleted, which also makes coalesced events safe to apply in order.
+#
+# Store rows have their own ids, which stay the same across sessions.
+# `rows` maps the editor's class ids to them.
+#
+# Files are told apart by their first bytes, like the other formats. Saving
+# picks a store for names ending in one of EXTENSIONS. Loading opens the
+# database read-only, and only reads a store with the tables below and
+# VERSION as its user_version, so loading any other SQLite database leaves
+# it untouched
+MAGIC = b'SQLite format 3\x00'
+EXTENSIONS = ('.db', '.sqlite', '.sqlite3')
+VERSION = 1
+TABLES = {'classes', 'fields', 'methods', 'params', 'relationships'}
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS classes (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    x, y
+);
+CREATE INDEX IF NOT EXISTS classes_name ON classes (name);
+CREATE TABLE IF NOT EXISTS fields (
+    class_id INTEGER NOT NULL REFERENCES classes (id) ON DELETE CASCADE,
+    pos INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    PRIMARY KEY (class_id, pos)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS fields_name ON fields (name);
+CREATE TABLE IF NOT EXISTS methods (
+    class_id INTEGER NOT NULL REFERENCES classes (id) ON DELETE CASCADE,
+    pos INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    PRIMARY KEY (class_id, pos)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS methods_name ON methods (name);
+CREATE TABLE IF NOT EXISTS params (
+    class_id INTEGER NOT NULL REFERENCES classes (id) ON DELETE CASCADE,
+    method INTEGER NOT NULL,
+    pos INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    PRIMARY KEY (class_id, method, pos)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS relationships (
+    src INTEGER NOT NULL REFERENCES classes (id) ON DELETE CASCADE,
+    dst INTEGER NOT NULL REFERENCES classes (id) ON DELETE CASCADE,
+    type INTEGER NOT NULL,
+    PRIMARY KEY (src, dst)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS relationships_dst ON relationships (dst);
+'''
+
+# x and y have no declared type, so whole number positions come back as ints
+_UPSERT_CLASS = '''INSERT INTO classes (id, name, x, y) VALUES (?, ?, ?, ?)
+    ON CONFLICT (id) DO UPDATE SET name = excluded.name, x = excluded.x, y = excluded.y'''
+_UPSERT_RELATIONSHIP = '''INSERT INTO relationships (src, dst, type) VALUES (?, ?, ?)
+    ON CONFLICT (src, dst) DO UPDATE SET type = excluded.type'''
+_UPSERT_MEMBER = '''INSERT INTO {} (class_id, pos, name) VALUES (?, ?, ?)
+    ON CONFLICT (class_id, pos) DO UPDATE SET name = excluded.name'''
+
+def isStoreName(filename) -> bool:
+    return filename.lower().endswith(EXTENSIONS)
+
+def isStore(filename) -> bool:
+    with open(filename, 'rb') as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+class DiagramStore:
+    # A `readonly` store is only read, and raises ValueError if the database
+    # is not a diagram store
+    def __init__(self, filename, readonly=False):
+        self.filename = filename
+        self.editor = None
+        self.rows = {}
+        if readonly:
+            uri = 'file:' + urllib.request.pathname2url(os.path.abspath(filename)) + '?mode=ro'
+            self.db = sqlite3.connect(uri, uri=True, isolation_level=None)
+            self.check()
+            return
+        # isolation_level None: transactions are begun explicitly, one per batch
+        self.db = sqlite3.connect(filename, isolation_level=None)
+        self.db.execute('PRAGMA foreign_keys = ON')
+        # Every batch is a commit, and in WAL mode a commit only appends to
+        # the log and syncs it at checkpoints
+        self.db.execute('PRAGMA journal_mode = WAL')
+        self.db.execute('PRAGMA synchronous = NORMAL')
+        self.db.executescript(SCHEMA)
+        self.db.execute(f'PRAGMA user_version = {VERSION}')
+
+    # Makes sure the database holds a diagram store, without changing it
+    def check(self):
+        tables = {row[0] for row in self.db.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        if not TABLES <= tables:
+            self.db.close()
+            raise ValueError(f'Not a diagram store: no {", ".join(sorted(TABLES - tables))} table')
+        version = self.db.execute('PRAGMA user_version').fetchone()[0]
+        if version != VERSION:
+            self.db.close()
+            raise ValueError(f'Unsupported store version {version}')
+
+    def close(self):
+        self.detach()
+        self.db.close()
+
+    # Runs the statements in the block as one transaction
+    def transaction(self):
+        return _Transaction(self.db)
+
+    #===== Following an Editor =====#
+
+    # Keeps the store in step with `editor` from now on. The editor must hold
+    # what the store holds, as it does after the store is loaded or written
+    def attach(self, editor):
+        self.detach()
+        self.editor = editor
+        rows = dict(self.db.execute('SELECT name, id FROM classes'))
+        self.rows = {clazz.id: rows[name] for name, clazz in editor.classes.items()}
+        editor.subscribe(self.onEditorChanges)
+        editor.markSaved()
+
+    def detach(self):
+        if self.editor is not None:
+            self.editor.unsubscribe(self.onEditorChanges)
+            self.editor = None
+
+    def onEditorChanges(self, events):
+        with self.transaction():
+            if events[0].kind == Change.Reset:
+                self.writeAll()
+                events = events[1:]
+            for event in events:
+                match event.kind:
+                    case Change.ClassAdded | Change.ClassDeleted | Change.ClassRenamed | Change.ClassMoved:
+                        self.writeClass(event.class_id)
+                    case Change.MembersChanged:
+                        self.writeClass(event.class_id, True)
+                    case (Change.RelationshipAdded | Change.RelationshipChanged
+                          | Change.RelationshipDeleted):
+                        self.writeRelationship(event.class_id, event.other_id)
+        # Every change is in the database now
+        self.editor.markSaved()
+
+    # Writes the class with editor id `cid` as it is now, with its members if
+    # they changed or the class is new. A class that no longer exists is deleted
+    def writeClass(self, cid, members=False):
+        clazz = self.editor.classes.byId(cid)
+        row = self.rows.get(cid)
+        if clazz is None:
+            if row is not None:
+                self.db.execute('DELETE FROM classes WHERE id = ?', (row,))
+                del self.rows[cid]
+            return
+        x, y = clazz.position if clazz.position is not None else (None, None)
+        cursor = self.db.execute(_UPSERT_CLASS, (row, clazz.name, x, y))
+        if row is None:
+            row = self.rows[cid] = cursor.lastrowid
+            members = True
+        if members:
+            self.writeMembers(row, clazz)
+
+    # Brings the member rows of a class in line with it, one row at a time
+    # The rows are compared with the members by slot, so only members that
+    # were added, renamed or deleted are written
+    def writeMembers(self, row, clazz):
+        db = self.db
+        for table, members in (('fields', clazz.fields), ('methods', clazz.methods)):
+            stored = dict(db.execute(f'SELECT pos, name FROM {table} WHERE class_id = ?', (row,)))
+            current = {slot: member.name for slot, member in members.slots()}
+            db.executemany(f'DELETE FROM {table} WHERE class_id = ? AND pos = ?',
+                           ((row, pos) for pos in stored.keys() - current.keys()))
+            db.executemany(_UPSERT_MEMBER.format(table),
+                           ((row, slot, name) for slot, name in current.items() if stored.get(slot) != name))
+        stored = {}
+        for method, name in db.execute('SELECT method, name FROM params WHERE class_id = ? ORDER BY method, pos', (row,)):
+            stored.setdefault(method, []).append(name)
+        current = {slot: method.params for slot, method in clazz.methods.slots()}
+        for slot in stored.keys() | current.keys():
+            params = current.get(slot, [])
+            if stored.get(slot, []) != params:
+                db.execute('DELETE FROM params WHERE class_id = ? AND method = ?', (row, slot))
+                db.executemany('INSERT INTO params VALUES (?, ?, ?, ?)',
+                               ((row, slot, j, param) for j, param in enumerate(params)))
+
+    def writeRelationship(self, src_id, dst_id):
+        src, dst = self.rows.get(src_id), self.rows.get(dst_id)
+        if src is None or dst is None:
+            # One of the classes is gone, and its relationships went with it
+            return
+        rel = self.editor.relationships.byIds(src_id, dst_id)
+        if rel is None:
+            self.db.execute('DELETE FROM relationships WHERE src = ? AND dst = ?', (src, dst))
+        else:
+            self.db.execute(_UPSERT_RELATIONSHIP, (src, dst, rel.typ.value))
+
+    # Replaces everything in the store with `model`, an Editor or a Snapshot,
+    # the editor the store follows by default. Rows are numbered afresh and
+    # written table by table, which is much faster than class by class
+    def writeAll(self, model=None):
+        model = model if model is not None else self.editor
+        db = self.db
+        for table in ('relationships', 'params', 'methods', 'fields', 'classes'):
+            db.execute(f'DELETE FROM {table}')
+        classes = list(model.classes.values())
+        self.rows = {clazz.id: row for row, clazz in enumerate(classes, 1)}
+        names = {clazz.name: row for row, clazz in enumerate(classes, 1)}
+        db.executemany('INSERT INTO classes VALUES (?, ?, ?, ?)',
+                       ((row, clazz.name) + (tuple(clazz.position) if clazz.position is not None else (None, None))
+                        for row, clazz in enumerate(classes, 1)))
+        db.executemany('INSERT INTO fields VALUES (?, ?, ?)',
+                       ((row, slot, field.name) for row, clazz in enumerate(classes, 1)
+                        for slot, field in clazz.fields.slots()))
+        db.executemany('INSERT INTO methods VALUES (?, ?, ?)',
+                       ((row, slot, method.name) for row, clazz in enumerate(classes, 1)
+                        for slot, method in clazz.methods.slots()))
+        db.executemany('INSERT INTO params VALUES (?, ?, ?, ?)',
+                       ((row, slot, j, param) for row, clazz in enumerate(classes, 1)
+                        for slot, method in clazz.methods.slots() for j, param in enumerate(method.params)))
+        db.executemany('INSERT INTO relationships VALUES (?, ?, ?)',
+                       ((names[rel.src], names[rel.dst], rel.typ.value) for rel in model.relationships.values()))
+
+    #===== Reading =====#
+
+    # Yields (name, fields, methods, position) for every class, in the order
+    # they were added. Each member table is read once, alongside the classes,
+    # so this costs a few scans rather than queries per class
+    def classes(self):
+        db = self.db
+        fields = _Groups(db.execute('SELECT class_id, name FROM fields ORDER BY class_id, pos'))
+        methods = _Groups(db.execute('SELECT class_id, pos, name FROM methods ORDER BY class_id, pos'))
+        params = _Groups(db.execute('SELECT class_id, method, name FROM params ORDER BY class_id, method, pos'))
+        for row, name, x, y in db.execute('SELECT id, name, x, y FROM classes ORDER BY id'):
+            class_params = {}
+            for _, method, param in params.take(row):
+                class_params.setdefault(method, []).append(param)
+            yield (name,
+                   [Field(field) for _, field in fields.take(row)],
+                   [Method(method, class_params.get(pos, [])) for _, pos, method in methods.take(row)],
+                   (x, y) if x is not None else None)
+
+    # Yields (source, destination, Type) for every relationship
+    def relationships(self):
+        for src, dst, typ in self.db.execute(
+                'SELECT s.name, d.name, r.type FROM relationships r '
+                'JOIN classes s ON s.id = r.src JOIN classes d ON d.id = r.dst'):
+            yield src, dst, Type(typ)
+
+    # Reads the diagram into a ModelLoader, see ModelLoader.add and relate
+    # The caller calls loader.finish() afterwards
+    def read(self, loader):
+        for clazz in self.classes():
+            loader.add(*clazz)
+        for src, dst, typ in self.relationships():
+            loader.relate(src, dst, typ)
+
+    # Names of the classes with a field or a method called `name`, found
+    # through the indexes on member names
+    def classesWithField(self, name):
+        return [row[0] for row in self.db.execute(
+            'SELECT DISTINCT classes.name FROM fields JOIN classes ON classes.id = fields.class_id '
+            'WHERE fields.name = ? ORDER BY classes.id', (name,))]
+
+    def classesWithMethod(self, name):
+        return [row[0] for row in self.db.execute(
+            'SELECT DISTINCT classes.name FROM methods JOIN classes ON classes.id = methods.class_id '
+            'WHERE methods.name = ? ORDER BY classes.id', (name,))]
+
+    # A read-only view of the stored diagram, for writeDiagram, so exports
+    # are generated from the store. Classes are read one at a time
+    def diagram(self):
+        return _StoredDiagram(self)
+
+class _Transaction:
+    def __init__(self, db):
+        self.db = db
+
+    def __enter__(self):
+        # Nested blocks join the transaction that is already open
+        self.outer = self.db.in_transaction
+        if not self.outer:
+            self.db.execute('BEGIN')
+        return self.db
+
+    def __exit__(self, kind, value, traceback):
+        if not self.outer:
+            self.db.execute('COMMIT' if kind is None else 'ROLLBACK')
+        return False
+
+# Rows of a query ordered by class id, taken one class at a time
+class _Groups:
+    def __init__(self, rows):
+        self.groups = itertools.groupby(rows, lambda row: row[0])
+        self.current = next(self.groups, None)
+
+    # The rows of class `row`, which must come in increasing order
+    def take(self, row):
+        current = self.current
+        if current is None or current[0] != row:
+            return ()
+        # A group can no longer be read once the next one is taken
+        rows = list(current[1])
+        self.current = next(self.groups, None)
+        return rows
+
+# Writes `model` to the store `filename`, replacing what it held
+def writeStore(model, filename):
+    store = DiagramStore(filename)
+    try:
+        with store.transaction():
+            store.writeAll(model)
+    finally:
+        store.close()
+
+# Reads the store `filename` into a ModelLoader, see DiagramStore.read
+# The database is opened read-only. One that is not a diagram store raises
+# ValueError
+def readStore(filename, loader):
+    store = None
+    try:
+        store = DiagramStore(filename, readonly=True)
+        store.read(loader)
+    except sqlite3.Error as e:
+        raise ValueError(f'Not a diagram store: {e}')
+    finally:
+        if store is not None:
+            store.close()
+
+# Makes the stored diagram look like a model to writeDiagram
+class _StoredDiagram:
+    def __init__(self, store):
+        self.classes = _Rows(store.classes, _storedClass)
+        self.relationships = _Rows(store.relationships, lambda rel: Relationship(*rel))
+
+# Rows read again each time they are iterated, as writeBinary does twice
+class _Rows:
+    def __init__(self, rows, make):
+        self.rows = rows
+        self.make = make
+
+    def values(self):
+        return self
+
+    def __iter__(self):
+        return map(self.make, self.rows())
+
+def _storedClass(row):
+    name, fields, methods, position = row
+    clazz = Class(name)
+    clazz.fields.extend(fields)
+    clazz.methods.extend(methods)
+    clazz.position = position
+    return clazz
@@ -0,0 +1,41 @@
+import os
+import tempfile
+from contextlib import contextmanager
+
+# Opens a file to replace `filename` as a whole
+# The data goes to a temporary file next to it, which takes the place of the
+# old file only once it has been written completely. Readers of the old file,
+# such as a MappedDiagram, keep seeing it unchanged, and a failed save leaves
+# it as it was
+#
+# The new file gets the permissions of the old one, or the usual permissions
+# of a new file if there was none
+@contextmanager
+def replaceFile(filename, mode='w'):
+    folder = os.path.dirname(os.path.abspath(filename))
+    fd, temp = tempfile.mkstemp(dir=folder, prefix='.' + os.path.basename(filename), suffix='.tmp')
+    try:
+        with os.fdopen(fd, mode) as f:
+            yield f
+        os.chmod(temp, _permissions(filename))
+        os.replace(temp, filename)
+    except BaseException:
+        os.unlink(temp)
+        raise
+
+# The umask can only be read by setting it, which changes it for every
+# thread. It is read once, while the module is imported, so saves on the
+# autosave thread never touch it
+_umask = os.umask(0)
+os.umask(_umask)
+
+def _permissions(filename):
+    try:
+        return os.stat(filename).st_mode & 0o777
+    except FileNotFoundError:
+        return 0o666 & ~_umask
+
+# The size and modification time of a file, which change whenever it is written
+def fileStamp(filename):
+    stat = os.stat(filename)
+    return stat.st_size, stat.st_mtime_ns
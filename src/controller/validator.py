@@ -0,0 +1,281 @@
+from model.relationship_model import Type
+
+# Checks a diagram while it is read, before any of it reaches the editor
+#
+# ModelLoader hands every class and relationship to the validator as soon as
+# it is parsed, and only changes the editor once the whole file has been read
+# without a problem. Reading goes on after a problem, so a load reports every
+# problem in the file at once, each with the JSON path of the value at fault:
+#
+#   $.classes[3].methods[0].params[1].name: expected a string
+#   $.relationships[7].destination: class `Engine` does not exist
+#
+# Each item is checked in time linear in its size, and names and pairs of
+# related classes are kept in dicts, so a file is checked in one pass, in
+# time linear in its size. Relationships may name classes that come later in
+# the file, so their endpoints are checked by finish()
+
+# Classes opened lazily, see LazyClass, are read when they are first used,
+# long after the diagram was opened. Their names and relationships are
+# checked when it is opened, and their members by lazyClassProblems or
+# lazyMemberProblems when they are read, so a malformed class raises a
+# DiagramError rather than failing somewhere in the middle of an edit
+
+# Problems listed in the message of a DiagramError. All of them are kept in
+# its `problems`
+MAX_REPORTED = 20
+
+class DiagramError(ValueError):
+    def __init__(self, problems):
+        # [(path, message)], in file order
+        self.problems = problems
+        lines = [f'{path}: {message}' for path, message in problems[:MAX_REPORTED]]
+        if len(problems) > MAX_REPORTED:
+            lines.append(f'... and {len(problems) - MAX_REPORTED} more')
+        if len(problems) == 1:
+            super().__init__(lines[0])
+        else:
+            super().__init__(f'{len(problems)} problems in the diagram:\n' + '\n'.join(lines))
+
+def _isNumber(value) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+def _isName(value) -> bool:
+    return type(value) is str and value != ''
+
+def _isNamed(item) -> bool:
+    return type(item) is dict and _isName(item.get('name'))
+
+# Whether a class given as a save file dict is correct on its own
+# The quick check every class goes through, which builds no paths
+def _correctClass(item) -> bool:
+    if not _isNamed(item):
+        return False
+    fields, methods = item.get('fields'), item.get('methods')
+    if type(fields) is not list or type(methods) is not list:
+        return False
+    if not all(map(_isNamed, fields)) or len({field['name'] for field in fields}) != len(fields):
+        return False
+    for method in methods:
+        if not _isNamed(method):
+            return False
+        params = method.get('params')
+        if type(params) is not list or not all(map(_isNamed, params)):
+            return False
+    if len({method['name'] for method in methods}) != len(methods):
+        return False
+    position = item.get('position')
+    return position is None or (type(position) is dict and _isNumber(position.get('x')) and _isNumber(position.get('y')))
+
+def _relationshipPath(at):
+    return f'{at[0]}.relationships[{at[1]}]'
+
+class Validator:
+    # `editor` is the editor the diagram is loaded into. Its classes and
+    # relationships count as already taken. Without one, class names are not
+    # checked
+    def __init__(self, editor):
+        self.editor = editor
+        self.problems = []
+        # Name of each class read -> its path, or where it is, see _classPath
+        self.names = {}
+        # (source, destination, (prefix, index)) of each relationship read
+        self.relationships = []
+        self.prefix = '$'
+        self.class_index = 0
+        self.relationship_index = 0
+
+    # Starts the paths again for the next file of a diagram made of several,
+    # see readProject. Names are still checked across files
+    def document(self, name):
+        self.prefix = f'{name}: $'
+        self.class_index = self.relationship_index = 0
+
+    def problem(self, path, message):
+        self.problems.append((path, message))
+
+    def _string(self, path, value) -> bool:
+        if not isinstance(value, str):
+            self.problem(path, 'expected a string' if value is not None else 'missing')
+            return False
+        if not value:
+            self.problem(path, 'must not be empty')
+            return False
+        return True
+
+    def _object(self, path, value) -> bool:
+        if not isinstance(value, dict):
+            self.problem(path, 'expected an object')
+            return False
+        return True
+
+    def _array(self, path, value) -> bool:
+        if not isinstance(value, list):
+            self.problem(path, 'expected an array' if value is not None else 'missing')
+            return False
+        return True
+
+    # Checks that `names` has no name twice. `names` pairs each name with its path
+    def _unique(self, kind, names):
+        seen = set()
+        for path, name in names:
+            if name in seen:
+                self.problem(path, f'{kind} `{name}` is already in this class')
+            seen.add(name)
+
+    def _className(self, path, name):
+        if self.editor is None:
+            return
+        if name in self.names:
+            self.problem(path, f'class `{name}` is already at {self._classPath(self.names[name])}')
+        elif name in self.editor.classes:
+            self.problem(path, f'class `{name}` already exists')
+        else:
+            self.names[name] = path
+
+    # The path of the name of a class, kept as (prefix, index) when it was correct
+    def _classPath(self, at):
+        return f'{at[0]}.classes[{at[1]}].name' if isinstance(at, tuple) else at
+
+    # Checks the top-level keys of a JSON file once it has been read
+    # `required` lists the keys it must have, see JsonStream.found
+    def checkDocument(self, found, required, not_arrays=()):
+        for key in required:
+            if key not in found:
+                self.problem(f'{self.prefix}.{key}', 'missing')
+        for key in sorted(not_arrays):
+            self.problem(f'{self.prefix}.{key}', 'expected an array')
+
+    # Checks a class given as a save file dict
+    # Returns whether it is correct. Paths are only built for a class with a
+    # problem, which is walked again by _classProblems to find them
+    def checkClass(self, item) -> bool:
+        index = self.class_index
+        self.class_index += 1
+        if _correctClass(item):
+            name = item['name']
+            if name in self.names or name in self.editor.classes:
+                self._className(f'{self.prefix}.classes[{index}].name', name)
+                return False
+            self.names[name] = (self.prefix, index)
+            return True
+        before = len(self.problems)
+        self._classProblems(f'{self.prefix}.classes[{index}]', item)
+        return len(self.problems) == before
+
+    def _classProblems(self, path, item):
+        if not self._object(path, item):
+            return
+        if self._string(f'{path}.name', item.get('name')):
+            self._className(f'{path}.name', item['name'])
+        fields = item.get('fields')
+        if self._array(f'{path}.fields', fields):
+            names = []
+            for i, field in enumerate(fields):
+                at = f'{path}.fields[{i}]'
+                if self._object(at, field) and self._string(f'{at}.name', field.get('name')):
+                    names.append((f'{at}.name', field['name']))
+            self._unique('field', names)
+        methods = item.get('methods')
+        if self._array(f'{path}.methods', methods):
+            names = []
+            for i, method in enumerate(methods):
+                at = f'{path}.methods[{i}]'
+                if not self._object(at, method):
+                    continue
+                if self._string(f'{at}.name', method.get('name')):
+                    names.append((f'{at}.name', method['name']))
+                params = method.get('params')
+                if self._array(f'{at}.params', params):
+                    for j, param in enumerate(params):
+                        if self._object(f'{at}.params[{j}]', param):
+                            self._string(f'{at}.params[{j}].name', param.get('name'))
+            self._unique('method', names)
+        position = item.get('position')
+        if position is not None and self._object(f'{path}.position', position):
+            for axis in ('x', 'y'):
+                if not _isNumber(position.get(axis)):
+                    self.problem(f'{path}.position.{axis}', 'expected a number')
+
+    # Checks a class built from Field and Method objects, as read from a
+    # binary file or a store, whose format already holds the structure
+    def checkMembers(self, name, fields, methods) -> bool:
+        index = self.class_index
+        self.class_index += 1
+        if (name not in self.names and name not in self.editor.classes
+                and len({field.name for field in fields}) == len(fields)
+                and len({method.name for method in methods}) == len(methods)):
+            self.names[name] = (self.prefix, index)
+            return True
+        path = f'{self.prefix}.classes[{index}]'
+        self._className(f'{path}.name', name)
+        self._unique('field', [(f'{path}.fields[{i}].name', field.name) for i, field in enumerate(fields)])
+        self._unique('method', [(f'{path}.methods[{i}].name', method.name) for i, method in enumerate(methods)])
+        return False
+
+    # Checks a relationship given as a save file dict
+    # Returns its Type, or None if it is not correct
+    def checkRelationship(self, item):
+        index = self.relationship_index
+        self.relationship_index += 1
+        if type(item) is dict and _isName(item.get('source')) and _isName(item.get('destination')):
+            typ = item.get('type')
+            typ = Type.make(typ.lower()) if type(typ) is str else None
+            if typ:
+                self.relationships.append((item['source'], item['destination'], (self.prefix, index)))
+                return typ
+        path = f'{self.prefix}.relationships[{index}]'
+        if not self._object(path, item):
+            return None
+        for end in ('source', 'destination'):
+            self._string(f'{path}.{end}', item.get(end))
+        if self._string(f'{path}.type', item.get('type')):
+            self.problem(f'{path}.type', f'invalid relationship type `{item["type"]}`')
+        return None
+
+    # Checks a relationship read from a binary file or a store
+    def checkRelated(self, src, dst):
+        self.relationships.append((src, dst, (self.prefix, self.relationship_index)))
+        self.relationship_index += 1
+
+    # Checks the relationships against every class read, then raises a
+    # DiagramError if anything in the file was wrong
+    # Relationships are undirected for the purpose of uniqueness
+    def finish(self):
+        editor = self.editor
+        names = self.names
+        pairs = {}
+        for src, dst, at in self.relationships:
+            if src not in names and src not in editor.classes or dst not in names and dst not in editor.classes:
+                for end, name in (('source', src), ('destination', dst)):
+                    if name not in names and name not in editor.classes:
+                        self.problem(f'{_relationshipPath(at)}.{end}', f'class `{name}` does not exist')
+                continue
+            pair = (src, dst) if src <= dst else (dst, src)
+            if pair in pairs:
+                self.problem(_relationshipPath(at), f'there is already a relationship between `{src}` and `{dst}` '
+                                                    f'at {_relationshipPath(pairs[pair])}')
+            elif editor.hasRelationship(src, dst) or editor.hasRelationship(dst, src):
+                self.problem(_relationshipPath(at), f'there is already a relationship between `{src}` and `{dst}`')
+            else:
+                pairs[pair] = at
+        self.relationships = []
+        if self.problems:
+            raise DiagramError(self.problems)
+
+# Problems with the members of a class given as a save file dict, read when
+# it is first used, as [(path, message)]
+def lazyClassProblems(path, item):
+    if _correctClass(item):
+        return []
+    validator = Validator(None)
+    validator._classProblems(path, item)
+    return validator.problems
+
+# Problems with the members of a class read from a binary file when it is
+# first used, given as Field and Method objects
+def lazyMemberProblems(path, fields, methods):
+    validator = Validator(None)
+    validator._unique('field', [(f'{path}.fields[{i}].name', field.name) for i, field in enumerate(fields)])
+    validator._unique('method', [(f'{path}.methods[{i}].name', method.name) for i, method in enumerate(methods)])
+    return validator.problems
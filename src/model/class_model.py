@@ -1,7 +1,21 @@
+import itertools
+import sys
+import threading
+import types
+from collections.abc import MutableMapping
+from .event_model import Change
+from .snapshot_model import CopyOnWrite
+
+# The model classes use __slots__ and interned names to stay small, since
+# large diagrams hold hundreds of thousands of fields and methods.
+# The same field and parameter names repeat across many classes, so interning
+# keeps a single copy of each name string.
 class Field:
+    __slots__ = ('name',)
+
     def __init__(self, name):
-        self.name = name
-    
+        self.name = sys.intern(name)
+
     # Using eq and hash allows us to more easily compare fields and check for list membership
     def __eq__(self, other):
         return self.name == other.name
@@ -9,14 +23,20 @@ class Field:
     def __hash__(self):
         return hash((self.name))
 
+    def copy(self):
+        return Field(self.name)
+
 # Since no types are required, parameters are just stored as a list of strings
 #   self.name => str
 #   self.params => List[str]
 class Method:
+    __slots__ = ('name', 'params')
+
     # params has the empty list as a default value, so that we can check for list membership easily
+    # The list is copied, so the method never shares it with the command that created it
     def __init__(self, name: str, params: list[str] = []):
-        self.name = name
-        self.params = params
+        self.name = sys.intern(name)
+        self.params = list(map(sys.intern, params))
 
     # Using eq and hash allows us to more easily compare fields and check for list membership
     def __eq__(self, other):
@@ -25,11 +45,422 @@ class Method:
     def __hash__(self):
         return hash((self.name))
 
+    def copy(self):
+        return Method(self.name, self.params)
+
+# Ordered container for the fields or the methods of a class
+# Members are indexed by name, so lookups, deletes and renames are O(1)
+#
+# Every member is stored under a slot number that never changes, and slots are
+# kept in insertion order. Renaming only moves the name index, so a renamed
+# member keeps its place in the declaration order.
+#
+# The list operations used before (in, append, remove, index, [i]) still work,
+# and accept either a member object or a plain name
+#
+# Most classes have few members, so an empty container shares one read-only
+# mapping and only allocates its dicts when the first member is added
+#
+# A watcher can be set to hear when the container becomes non-empty (+1)
+# or empty again (-1), which lets the editor keep running counters
+_EMPTY = types.MappingProxyType({})
+
+class Members:
+    __slots__ = ('_slots', '_names', '_next_slot', '_watcher')
+
+    def __init__(self, members=()):
+        self._slots = _EMPTY
+        self._names = _EMPTY
+        self._next_slot = 0
+        self._watcher = None
+        for member in members:
+            self.add(member)
+
+    def watch(self, watcher):
+        self._watcher = watcher
+
+    # Members can be looked up by object or by name
+    def _key(self, item):
+        return item if isinstance(item, str) else item.name
+
+    def __contains__(self, item):
+        return self._key(item) in self._names
+
+    def __iter__(self):
+        return iter(self._slots.values())
+
+    def __len__(self):
+        return len(self._slots)
+
+    # A name gives the member in O(1), an integer gives the member at that
+    # position in declaration order in O(n), like a list would
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            return self._slots[self._names[key]]
+        if key < 0:
+            key += len(self._slots)
+        if key < 0 or key >= len(self._slots):
+            raise IndexError('member index out of range')
+        return next(itertools.islice(self._slots.values(), key, None))
+
+    def __eq__(self, other):
+        if isinstance(other, Members):
+            other = list(other)
+        return list(self) == other
+
+    def __repr__(self):
+        return f'Members({[m.name for m in self]})'
+
+    def get(self, name, default=None):
+        slot = self._names.get(name)
+        return default if slot is None else self._slots[slot]
+
+    def names(self):
+        return [m.name for m in self]
+
+    # (slot, member) pairs in declaration order. A member keeps its slot for
+    # as long as it is in the container, even across renames
+    def slots(self):
+        return self._slots.items()
+
+    # Adds a member at the end. Returns False if the name is already taken
+    def add(self, member) -> bool:
+        if member.name in self._names:
+            return False
+        if self._names is _EMPTY:
+            self._slots = {}
+            self._names = {}
+        self._names[member.name] = self._next_slot
+        self._slots[self._next_slot] = member
+        self._next_slot += 1
+        if len(self._slots) == 1 and self._watcher:
+            self._watcher(1)
+        return True
+
+    def append(self, member):
+        self.add(member)
+
+    # Adds members at the end without checking each name
+    # Only for callers that have already made sure the names are all new, or
+    # that build a new container and drop it if this returns False: a name
+    # given twice keeps only one member in the name index
+    def extend(self, members) -> bool:
+        if self._names is _EMPTY:
+            self._slots = {}
+            self._names = {}
+        names = self._names
+        slots = self._slots
+        was_empty = not slots
+        slot = self._next_slot
+        for member in members:
+            names[member.name] = slot
+            slots[slot] = member
+            slot += 1
+        self._next_slot = slot
+        if was_empty and slots and self._watcher:
+            self._watcher(1)
+        return len(names) == len(slots)
+
+    # Removes a member by name and returns it, or None if it is not there
+    def pop(self, item):
+        if self._names is _EMPTY:
+            return None
+        slot = self._names.pop(self._key(item), None)
+        if slot is None:
+            return None
+        member = self._slots.pop(slot)
+        if not self._slots and self._watcher:
+            self._watcher(-1)
+        return member
+
+    def remove(self, item):
+        if self.pop(item) is None:
+            raise ValueError(f'{self._key(item)} is not a member')
+
+    # Renames a member in place. Returns False if `old` is missing or `new` is taken
+    def rename(self, old, new) -> bool:
+        if old not in self._names or new in self._names:
+            return False
+        new = sys.intern(new)
+        slot = self._names.pop(old)
+        self._names[new] = slot
+        self._slots[slot].name = new
+        return True
+
+    # Position of a member in declaration order, O(n) like list.index
+    def index(self, item):
+        slot = self._names.get(self._key(item))
+        if slot is None:
+            raise ValueError(f'{self._key(item)} is not a member')
+        for i, s in enumerate(self._slots):
+            if s == slot:
+                return i
+
+    # A new container holding copies of the members, in the same order
+    def copy(self):
+        members = Members()
+        if self._slots:
+            members.extend([member.copy() for member in self._slots.values()])
+        return members
+
+    def clear(self):
+        if self._slots and self._watcher:
+            self._watcher(-1)
+        self._slots = _EMPTY
+        self._names = _EMPTY
+
 class Class:
+    __slots__ = ('id', 'name', 'fields', 'methods', 'position')
+
     # Creates a new class object with paremeters name and an empty set list for attributes#
+    # The id is given by the ClassTable the class is added to
     def __init__(self, name):
-        self.name = name
-        self.fields = []
-        self.methods = []
-        #hidden x and y for 
+        self.id = None
+        self.name = sys.intern(name)
+        self.fields = Members()
+        self.methods = Members()
+        #hidden x and y for
         self.position = None
+
+    # A copy with the same id, and copies of the members
+    def copy(self):
+        clazz = Class(self.name)
+        clazz.id = self.id
+        clazz.fields = self.fields.copy()
+        clazz.methods = self.methods.copy()
+        clazz.position = self.position
+        return clazz
+
+    # Used by ClassTable to keep count of the classes that have methods
+    def watchMethods(self, watcher):
+        self.methods.watch(watcher)
+
+    def hasMethods(self) -> bool:
+        return len(self.methods) > 0
+
+# A class whose members are read from a save file the first time they are used
+# Only the id and the name are known up front. Reading fields, methods or
+# position calls source.loadClass(offset), which returns them, and from then
+# on they are plain attributes. Whether the class has methods is known without
+# loading it, so ClassTable can count it
+#
+# An autosave may read a class on its own thread while the UI reads it too,
+# so loading holds a lock and a class is only ever loaded once
+_loading = threading.Lock()
+
+class LazyClass(Class):
+    __slots__ = ('_source', '_offset', '_watcher', '_has_methods')
+
+    def __init__(self, name, source, offset, has_methods):
+        self.id = None
+        self.name = sys.intern(name)
+        self._source = source
+        self._offset = offset
+        self._watcher = None
+        self._has_methods = has_methods
+
+    # Only called for attributes that are not set, which are the members of a
+    # class that is not loaded yet
+    def __getattr__(self, attr):
+        if attr not in ('fields', 'methods', 'position'):
+            raise AttributeError(attr)
+        with _loading:
+            if self._source is not None:
+                self.fields, self.methods, self.position = self._source.loadClass(self._offset)
+                self._source = None
+                if self._watcher is not None:
+                    self.methods.watch(self._watcher)
+                    self._watcher = None
+        # Does not come back here, so a member that is still missing raises
+        return object.__getattribute__(self, attr)
+
+    def loaded(self) -> bool:
+        return self._source is None
+
+    def watchMethods(self, watcher):
+        with _loading:
+            if self.loaded():
+                self.methods.watch(watcher)
+            else:
+                self._watcher = watcher
+
+    def hasMethods(self) -> bool:
+        return len(self.methods) > 0 if self.loaded() else self._has_methods
+
+# Symbol table for the classes of the editor
+# Every class gets a stable integer id when it is added. Classes are stored by id
+# and `ids` maps each name to its id, so renaming a class is a single update of
+# `ids`, and relationships or views keyed by id never have to change.
+#
+# Ids are never reused, and iteration follows the order classes were added in.
+# The table still behaves like the old name -> Class dict.
+#
+# The table also counts the classes that have at least one method. The method
+# containers report when they become empty or non-empty, so the count is
+# always current without looping over the classes.
+#
+# Adding, deleting and renaming classes is reported to `events`, if given
+#
+# The table can be snapshotted in O(1), see CopyOnWrite. Code that changes a
+# class in place gets it through `edit`, which copies it first if a snapshot
+# may share it. `copied` is called with (old, new) when that happens.
+class ClassTable(CopyOnWrite, MutableMapping):
+    def __init__(self, events=None):
+        self.events = events
+        self.ids = {}
+        self._by_id = {}
+        self._next_id = 0
+        self.classes_with_methods = 0
+        self.copied = None
+        # One bound method shared by every class, rather than one per class
+        self._on_methods = self._methodsChanged
+        self._initSharing()
+
+    def _methodsChanged(self, delta):
+        self.classes_with_methods += delta
+
+    # Starts or stops counting a class in classes_with_methods
+    def _track(self, clazz, on):
+        clazz.watchMethods(self._on_methods if on else None)
+        if clazz.hasMethods():
+            self.classes_with_methods += 1 if on else -1
+
+    def __contains__(self, name):
+        return name in self.ids
+
+    def __getitem__(self, name):
+        return self._by_id[self.ids[name]]
+
+    # Adding a class under a name that is taken replaces it, but keeps the id
+    def __setitem__(self, name, clazz):
+        self._ownDicts()
+        cid = self.ids.get(name)
+        if cid is None:
+            cid = self._next_id
+            self._next_id += 1
+            self.ids[name] = cid
+            change = Change.ClassAdded
+        else:
+            self._track(self._by_id[cid], False)
+            change = Change.MembersChanged
+        clazz.id = cid
+        self._by_id[cid] = clazz
+        self._track(clazz, True)
+        self._claim(cid)
+        self._emit(change, cid)
+
+    def __delitem__(self, name):
+        self._ownDicts()
+        cid = self.ids.pop(name)
+        self._track(self._by_id.pop(cid), False)
+        self._emit(Change.ClassDeleted, cid)
+
+    def _emit(self, kind, cid=None):
+        if self.events is not None:
+            self.events.emit(kind, cid)
+
+    def __iter__(self):
+        return (clazz.name for clazz in self._by_id.values())
+
+    def __len__(self):
+        return len(self._by_id)
+
+    def get(self, name, default=None):
+        cid = self.ids.get(name)
+        return default if cid is None else self._by_id[cid]
+
+    def values(self):
+        return self._by_id.values()
+
+    # New dicts are used, since a snapshot may hold the old ones
+    def clear(self):
+        for clazz in self._by_id.values():
+            clazz.watchMethods(None)
+        self.ids = {}
+        self._by_id = {}
+        self._shared_dicts = False
+        self.classes_with_methods = 0
+        self._emit(Change.Reset)
+
+    # Adds classes whose names are known to be new and distinct, such as the
+    # classes of a file opened into an empty table. Nothing is reported for
+    # each class, so the caller reports the change as a whole
+    # The new ids are consecutive, so they are counted and claimed at once
+    def adopt(self, classes):
+        self._ownDicts()
+        ids = self.ids
+        by_id = self._by_id
+        watcher = self._on_methods
+        start = cid = self._next_id
+        with_methods = 0
+        for clazz in classes:
+            clazz.id = cid
+            ids[clazz.name] = cid
+            by_id[cid] = clazz
+            clazz.watchMethods(watcher)
+            if clazz.hasMethods():
+                with_methods += 1
+            cid += 1
+        self._next_id = cid
+        self.classes_with_methods += with_methods
+        if self._owned is not None:
+            self._owned.update(range(start, cid))
+
+    # Hands the dicts to a snapshot, see CopyOnWrite
+    def freeze(self, snapshot):
+        self._freeze(snapshot)
+        return self.ids, self._by_id
+
+    def _copyDicts(self):
+        self.ids = dict(self.ids)
+        self._by_id = dict(self._by_id)
+
+    # Puts back the classes of a snapshot, under the same ids
+    # Ids handed out since the snapshot are not reused. This is not reported as events
+    def restore(self, snapshot):
+        for clazz in self._by_id.values():
+            clazz.watchMethods(None)
+        self._freeze(snapshot)
+        self.ids = dict(snapshot.ids)
+        self._by_id = dict(snapshot.classes)
+        self._shared_dicts = False
+        self.classes_with_methods = 0
+        for clazz in self._by_id.values():
+            self._track(clazz, True)
+
+    # The class called `name`, safe to change in place
+    def edit(self, name):
+        return self.editById(self.ids[name])
+
+    def editById(self, cid):
+        clazz = self._by_id[cid]
+        if self._isShared(cid):
+            self._ownDicts()
+            copy = clazz.copy()
+            self._track(clazz, False)
+            self._track(copy, True)
+            self._by_id[cid] = copy
+            self._claim(cid)
+            if self.copied is not None:
+                self.copied(clazz, copy)
+            clazz = copy
+        return clazz
+
+    def idOf(self, name):
+        return self.ids.get(name)
+
+    def byId(self, cid):
+        return self._by_id.get(cid)
+
+    # Renames a class with one update of the symbol table
+    # Returns False if `name` is missing or `rename` is taken
+    def rename(self, name, rename) -> bool:
+        if name not in self.ids or rename in self.ids:
+            return False
+        rename = sys.intern(rename)
+        clazz = self.edit(name)
+        cid = self.ids.pop(name)
+        self.ids[rename] = cid
+        clazz.name = rename
+        self._emit(Change.ClassRenamed, cid)
+        return True
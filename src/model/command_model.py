@@ -1,5 +1,12 @@
 from model.class_model import Method
 
+# Rough bytes a command keeps alive in the undo history: a fixed cost for the
+# command, and one for each name or list item it holds
+COMMAND_BYTES = 200
+ITEM_BYTES = 64
+# Items counted for each class a bulk command holds, with its members
+CLASS_ITEMS = 8
+
 # Common interface for commands
 # All command objects track the changes in the program state 
 #
@@ -12,6 +19,15 @@ class Command:
     def undo(self, controller) -> bool:
         pass
 
+    # Estimated bytes the command keeps alive in the undo history
+    # Only attributes are counted, and lists by their length, so the estimate
+    # costs the same whatever the command holds
+    def size(self) -> int:
+        items = 0
+        for value in vars(self).values():
+            items += len(value) if isinstance(value, list) else 1
+        return COMMAND_BYTES + ITEM_BYTES * items
+
 class CommandClassAdd(Command):
     def __init__(self, name):
         self.name = name
@@ -143,11 +159,9 @@ class CommandMethodDelete(Command):
     def execute(self, controller):
         # Saving the parameters for undo
         try:
-            if self.class1 in controller.editor.classes:
-                item = controller.editor.classes[self.class1]
-            method = next(m for m in item.methods if m.name == self.method)
+            method = controller.editor.classes[self.class1].methods[self.method]
             self.params = method.params.copy()
-        except:
+        except KeyError:
             return False
         return controller.deleteMethod(self.class1, self.method)
 
@@ -176,11 +190,9 @@ class CommandParameterRemove(Command):
     def execute(self, controller):
         # Saving the parameters for undo
         try:
-            if self.class1 in controller.editor.classes:
-                item = controller.editor.classes[self.class1]
-            method = next(m for m in item.methods if m.name == self.method)
+            method = controller.editor.classes[self.class1].methods[self.method]
             self.old_params = method.params.copy()
-        except:
+        except KeyError:
             return False
         return controller.removeParameter(self.class1, self.method, self.param)
 
@@ -196,11 +208,9 @@ class CommandParameterClear(Command):
     def execute(self, controller):
         # Saving the parameters for undo
         try:
-            if self.class1 in controller.editor.classes:
-                item = controller.editor.classes[self.class1]
-            method = next(m for m in item.methods if m.name == self.method)
+            method = controller.editor.classes[self.class1].methods[self.method]
             self.old_params = method.params.copy()
-        except:
+        except KeyError:
             return False
         return controller.clearParameters(self.class1, self.method)
 
@@ -230,13 +240,59 @@ class CommandParameterChange(Command):
     def execute(self, controller):
         # Saving the parameters for undo
         try:
-            if self.class1 in controller.editor.classes:
-                item = controller.editor.classes[self.class1]
-            method = next(m for m in item.methods if m.name == self.method)
+            method = controller.editor.classes[self.class1].methods[self.method]
             self.old_params = method.params.copy()
-        except:
+        except KeyError:
             return False
         return controller.replaceParameters(self.class1, self.method, self.params)
 
     def undo(self, controller):
         return controller.replaceParameters(self.class1, self.method, self.old_params)
+
+# Adds many classes and relationships as one step, see EditorController.bulkAdd
+class CommandBulkAdd(Command):
+    def __init__(self, classes=(), relationships=()):
+        self.classes = list(classes)
+        self.relationships = list(relationships)
+
+    def execute(self, controller):
+        return controller.bulkAdd(self.classes, self.relationships)
+
+    def size(self) -> int:
+        return COMMAND_BYTES + ITEM_BYTES * (CLASS_ITEMS * len(self.classes) + 3 * len(self.relationships))
+
+    def undo(self, controller):
+        # Relationships to the new classes go away with them
+        pairs = [(src, dst) for src, dst, _ in self.relationships]
+        return controller.bulkDelete([name for name, _, _ in self.classes], pairs)
+
+# Deletes many classes and relationships as one step, see EditorController.bulkDelete
+class CommandBulkDelete(Command):
+    def __init__(self, classes=(), relationships=()):
+        self.classes = list(classes)
+        self.relationships = list(relationships)
+        self.old_classes = []
+        self.old_relationships = []
+
+    def size(self) -> int:
+        items = (len(self.classes) + 2 * len(self.relationships)
+                 + CLASS_ITEMS * len(self.old_classes) + 3 * len(self.old_relationships))
+        return COMMAND_BYTES + ITEM_BYTES * items
+
+    def execute(self, controller):
+        # Saving the deleted classes with their members, and every relationship
+        # that goes away with them, for undo
+        editor = controller.editor
+        self.old_classes = [controller.classSpec(name) for name in self.classes if name in editor.classes]
+        keys = {}
+        for class1, class2 in self.relationships:
+            keys[(class1, class2)] = None
+            keys[(class2, class1)] = None
+        for name in self.classes:
+            keys.update(dict.fromkeys(editor.relationshipKeys(name)))
+        self.old_relationships = [(src, dst, editor.getRelationshipType(src, dst))
+                                  for (src, dst) in keys if editor.hasRelationship(src, dst)]
+        return controller.bulkDelete(self.classes, self.relationships)
+
+    def undo(self, controller):
+        return controller.bulkAdd(self.old_classes, self.old_relationships)
@@ -1,18 +1,115 @@
 import json
-from .class_model import Class, Field, Method
-from .relationship_model import Relationship
+from contextlib import contextmanager
+from .class_model import Class, ClassTable, Field, Method
+from .relationship_model import Relationship, RelationshipTable
+from .event_model import Change, EventBus
+from .snapshot_model import Snapshot
+
+# Default bounds of the undo history
+HISTORY_ENTRIES = 1000
+HISTORY_BYTES = 32 * 1024 * 1024
 
 class Editor:
     def __init__(self):
-        self.classes = {}
-        self.relationships = {}
+        # Changes to the model are reported to subscribers through this bus
+        self.events = EventBus()
+        # Classes are keyed by stable integer ids, with a name -> id symbol table
+        # Relationships are keyed by pairs of class ids and keep an adjacency index
+        self.classes = ClassTable(self.events)
+        self.relationships = RelationshipTable(self.classes, self.events)
         self.action_stack = []
         self.action_idx = 0
         self.can_undo = False
         self.can_redo = False
+        # The undo history is bounded by entries and by estimated bytes, and
+        # the oldest commands are dropped first. action_sizes runs parallel
+        # to action_stack
+        self.history_entries = HISTORY_ENTRIES
+        self.history_bytes = HISTORY_BYTES
+        self.action_sizes = []
+        self.action_bytes = 0
+        # events.generation as of the last time the model was saved or loaded
+        # in full, see isDirty
+        self.saved_generation = 0
     
+    #===== Change Events =====#
+    # Subscribers get lists of ChangeEvents, coalesced per batch or per tick
+    def subscribe(self, callback):
+        return self.events.subscribe(callback)
+
+    def unsubscribe(self, callback):
+        self.events.unsubscribe(callback)
+
+    # Groups changes so subscribers hear about them once, when the batch ends
+    def batch(self):
+        return self.events.batch()
+
+    #===== Transactions =====#
+    # Changes made inside `with editor.transaction():` reach subscribers
+    # together, once it ends. If an exception escapes, the classes,
+    # relationships and action stack are put back the way they were when it
+    # began, the queued events are dropped, and the exception is raised again
+    @contextmanager
+    def transaction(self):
+        checkpoint = self.checkpoint()
+        mark = len(self.events.pending)
+        with self.events.batch():
+            try:
+                yield self
+            except BaseException:
+                self.restore(checkpoint)
+                self.events.discard(mark)
+                raise
+
+    def checkpoint(self):
+        return (self.snapshot(), list(self.action_stack), list(self.action_sizes), self.action_bytes,
+                self.action_idx, self.can_undo, self.can_redo)
+
+    def restore(self, checkpoint):
+        (snapshot, self.action_stack, self.action_sizes, self.action_bytes,
+         self.action_idx, self.can_undo, self.can_redo) = checkpoint
+        self.classes.restore(snapshot)
+        self.relationships.restore(snapshot)
+
+    #===== Snapshots =====#
+    # A frozen, read-only view of the classes and relationships as they are now
+    # Taking one is O(1): the snapshot shares every class with the editor, and
+    # the editor copies a class only when it is changed afterwards. Readers
+    # such as autosave or export can use it while the user keeps editing
+    def snapshot(self):
+        return Snapshot(self.classes, self.relationships)
+
+    #===== Dirty Tracking =====#
+    # The model is dirty once it changed since it was last saved or loaded.
+    # Every change is counted by the event bus, so this is one comparison
+    def isDirty(self) -> bool:
+        return self.events.generation != self.saved_generation
+
+    # Marks the model saved as of `generation`, the current one by default.
+    # A save of an older snapshot passes the generation it was taken at, so
+    # changes made since keep the model dirty
+    def markSaved(self, generation=None):
+        self.saved_generation = self.events.generation if generation is None else generation
+
+    # Sets where a class is drawn. Class.position is the layout that is
+    # saved, whichever UI shows it. The class is copied first if a snapshot
+    # shares it
+    def moveClass(self, class_id, position):
+        self.classes.editById(class_id).position = position
+        self.events.emit(Change.ClassMoved, class_id)
+
+    # The tables report structural changes themselves. Edits inside a class
+    # or a relationship are reported by whoever makes them
+    def membersChanged(self, name):
+        self.events.emit(Change.MembersChanged, self.classes.idOf(name))
+
+    def relationshipChanged(self, src, dst):
+        ids = self.relationships.idKey((src, dst))
+        if ids is not None:
+            self.events.emit(Change.RelationshipChanged, *ids)
+
     def getClasses(self):
-        ls = [c for c in self.classes]
+        ls = list(self.classes)
         return ls
     
     # Cannot use != as __eq__ can only be called on objects of the same type here
@@ -25,21 +122,28 @@ class Editor:
 
     #===== State Checkers =====#
     # These functions check what actions can be performed from the state of the editor
+    # They only read counters that the class and relationship tables keep up to date,
+    # so every check is O(1)
+    def classCount(self):
+        return len(self.classes)
+
+    def classesWithMethodsCount(self):
+        return self.classes.classes_with_methods
+
+    def relationshipCount(self):
+        return len(self.relationships)
+
     def canAddField(self):
-        return len(self.classes) > 0
+        return self.classCount() > 0
 
     def canAddMethod(self):
-        return len(self.classes) > 0
+        return self.classCount() > 0
 
     def canDoParams(self):
-        for clazz in self.classes:
-            item = self.classes[clazz]
-            if len(item.methods) > 0:
-                return True
-        return False
+        return self.classesWithMethodsCount() > 0
 
     def canAddRelationship(self):
-        return len(self.classes) > 1
+        return self.classCount() > 1
 
     def canUndo(self):
         return self.can_undo
@@ -54,44 +158,146 @@ class Editor:
         relationship = self.getRelationship(class1, class2)
         return relationship.typ if relationship else None
 
+    # The relationship holds the Class objects, so it follows class renames
     def addRelationship(self, src, dst, typ):
-        if (src, dst) not in self.relationships:
-            self.relationships[(src, dst)] = Relationship(src, dst, typ)
-            return True
-        return False
+        ids = self.relationships.idKey((src, dst))
+        if ids is None or self.relationships.byIds(*ids) is not None:
+            return False
+        self.relationships.link(ids, Relationship(self.classes[src], self.classes[dst], typ))
+        return True
 
     def removeRelationship(self, src, dst):
-        return self.relationships.pop((src, dst), None) is not None
+        ids = self.relationships.idKey((src, dst))
+        if ids is None or self.relationships.byIds(*ids) is None:
+            return False
+        self.relationships.unlink(ids)
+        return True
+
+    def clearRelationships(self):
+        self.relationships.clear()
 
+    # Every (src, dst) name pair with `name` on either end, in O(degree)
+    # A relationship from a class to itself is only listed once
+    def relationshipKeys(self, name):
+        cid = self.classes.idOf(name)
+        if cid is None:
+            return []
+        by_id = self.classes.byId
+        return [(by_id(s).name, by_id(d).name) for (s, d) in self.relationships.idPairs(cid)]
+
+    #===== Undo History =====#
+    # Pushing a command after some undos discards the commands that could have
+    # been redone, since they no longer follow from the current state
     def pushCmd(self, cmd):
+        if self.action_stack:
+            self.truncateHistory(self.action_idx + 1)
+        size = cmd.size()
         self.action_stack.append(cmd)
+        self.action_sizes.append(size)
+        self.action_bytes += size
         self.action_idx = len(self.action_stack) - 1
+        self.can_redo = False
+        self.evictHistory()
 
     def popCmd(self):
+        self.action_bytes -= self.action_sizes.pop()
         return self.action_stack.pop()
 
+    # Drops every command from index `start` on
+    def truncateHistory(self, start):
+        start = max(start, 0)
+        self.action_bytes -= sum(self.action_sizes[start:])
+        del self.action_stack[start:]
+        del self.action_sizes[start:]
+
+    # Drops commands until the history fits its bounds. Commands that were
+    # undone go first, since the oldest can only be dropped from a history
+    # that ends with the current state. Then the oldest commands go, but the
+    # newest is always kept, even if it is larger than the budget
+    def evictHistory(self):
+        if len(self.action_stack) <= self.history_entries and self.action_bytes <= self.history_bytes:
+            return
+        if self.action_idx + 1 < len(self.action_stack):
+            self.truncateHistory(self.action_idx + 1)
+            self.can_redo = False
+        count = 0
+        entries = len(self.action_stack)
+        size = self.action_bytes
+        while entries - count > 1 and (entries - count > self.history_entries or size > self.history_bytes):
+            size -= self.action_sizes[count]
+            count += 1
+        if count:
+            del self.action_stack[:count]
+            del self.action_sizes[:count]
+            self.action_bytes = size
+            self.action_idx = max(self.action_idx - count, -1)
+            self.can_undo = self.action_idx >= 0
+
+    # Changes the bounds of the undo history, dropping old commands if needed
+    def setHistoryLimit(self, entries=None, max_bytes=None):
+        if entries is not None:
+            self.history_entries = max(entries, 1)
+        if max_bytes is not None:
+            self.history_bytes = max_bytes
+        self.evictHistory()
+
+    # The number of commands in the undo history, and their estimated bytes
+    def historySize(self):
+        return len(self.action_stack), self.action_bytes
+
+# The saved form of a class and a relationship, as plain JSON values
+# They read only the model, and Class.position is the layout that is saved
+def serializeClass(clazz):
+    position = {'x': clazz.position[0], 'y': clazz.position[1]} if clazz.position is not None else None
+    return {
+        'name': clazz.name,
+        'fields': [{'name': field.name} for field in clazz.fields],
+        # Method params are a list of strings, so we map them to objects with a
+        # name field in order to comply with the JSON specification
+        'methods': [{'name': method.name, 'params': [{'name': param} for param in method.params]}
+                    for method in clazz.methods],
+        'position': position
+    }
+
+def serializeRelationship(rel):
+    return {'source': rel.src, 'destination': rel.dst, 'type': rel.typ.display()}
+
+# The saved form of a class in a canonical save, which is the same for the
+# same class whatever order its members were added in. Fields and methods
+# are sorted by name, parameters keep their order, and a position is saved
+# as whole numbers when it is whole, so 1173.0 is saved as 1173
+def canonicalClass(clazz):
+    position = clazz.position
+    if position is not None:
+        position = {'x': _canonicalNumber(position[0]), 'y': _canonicalNumber(position[1])}
+    return {
+        'name': clazz.name,
+        'fields': [{'name': name} for name in sorted(field.name for field in clazz.fields)],
+        'methods': [{'name': method.name, 'params': [{'name': param} for param in method.params]}
+                    for method in sorted(clazz.methods, key=lambda method: method.name)],
+        'position': position
+    }
+
+def _canonicalNumber(value):
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
 class EditorEncoder(json.JSONEncoder):
     def default(self, obj):
-        if isinstance(obj, Editor):
+        # A snapshot is saved the same way as the editor it was taken from
+        if isinstance(obj, (Editor, Snapshot)):
             return {
-                'classes': list(obj.classes.values()),
-                'relationships': list(obj.relationships.values())  # Convert dictionary values to a list
+                'classes': [serializeClass(clazz) for clazz in obj.classes.values()],
+                'relationships': [serializeRelationship(rel) for rel in obj.relationships.values()]
             }
-
         if isinstance(obj, Class):
-           # Create a position dictionary if it exists
-            position = {'x': obj.position[0], 'y': obj.position[1]} if hasattr(obj, 'position') and obj.position is not None else None
-            # return {'name': obj.name, 'attributes': list(obj.attributtesSets)}
-            return {'name': obj.name, 'fields': obj.fields, 'methods': obj.methods, 'position': position}
-        
+            return serializeClass(obj)
         if isinstance(obj, Field):
             return {'name': obj.name}
         if isinstance(obj, Method):
-            # Obj.params is a list of strings, so we map them to objects with a string field
-            # in order to comply with the JSON specification
-            l = list(map(lambda x: {'name': x}, obj.params))
-            return {'name': obj.name, 'params': l}
+            return {'name': obj.name, 'params': [{'name': param} for param in obj.params]}
         if isinstance(obj, Relationship):
-            return {'source': obj.src, 'destination': obj.dst, 'type': obj.typ.display()}
+            return serializeRelationship(obj)
         
         return json.JSONEncoder.default(self, obj)
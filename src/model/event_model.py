@@ -0,0 +1,119 @@
+from enum import Enum
+from contextlib import contextmanager
+from typing import NamedTuple
+
+# Kinds of changes the editor reports to its subscribers
+class Change(Enum):
+    ClassAdded = 1
+    ClassDeleted = 2
+    ClassRenamed = 3
+    MembersChanged = 4
+    RelationshipAdded = 5
+    RelationshipDeleted = 6
+    RelationshipChanged = 7
+    # The whole model was cleared, subscribers should rebuild from scratch
+    Reset = 8
+    # A class was given a new position
+    ClassMoved = 9
+
+# A single change to the editor's model
+#   kind => Change
+#   class_id => id of the class, or of the source class for relationships
+#   other_id => id of the destination class for relationships, otherwise None
+# Ids are used instead of names so events stay valid across renames
+# Events are tuples, so hashing and comparing them while coalescing is cheap
+class ChangeEvent(NamedTuple):
+    kind: Change
+    class_id: int = None
+    other_id: int = None
+
+    def __repr__(self):
+        return f'ChangeEvent({self.kind.name}, {self.class_id}, {self.other_id})'
+
+# Merges a list of events into the shortest list with the same meaning
+# Duplicates are dropped, keeping the first one, and a Reset makes every
+# event before it irrelevant
+def coalesce(events):
+    for i in range(len(events) - 1, -1, -1):
+        if events[i].kind == Change.Reset:
+            events = events[i:]
+            break
+    return list(dict.fromkeys(events))
+
+# Delivers change events to subscribers in coalesced lists
+#
+# Subscribers are callables taking a list of ChangeEvents. Events are queued and
+# delivered together:
+#   - inside `batch()`, once the outermost batch ends
+#   - otherwise through `scheduler` if one is set (the GUI uses Tk's after_idle,
+#     so subscribers hear once per tick), or right away if not
+class EventBus:
+    def __init__(self):
+        self.subscribers = []
+        self.pending = []
+        self.batch_depth = 0
+        self.scheduler = None
+        self.scheduled = False
+        # Counts every change, whether or not anybody is listening, so
+        # callers can tell whether the model changed since they last looked
+        self.generation = 0
+
+    def subscribe(self, callback):
+        self.subscribers.append(callback)
+        return callback
+
+    def unsubscribe(self, callback):
+        if callback in self.subscribers:
+            self.subscribers.remove(callback)
+
+    def emit(self, kind, class_id=None, other_id=None):
+        self.generation += 1
+        # Nothing is recorded when nobody is listening
+        if not self.subscribers:
+            return
+        self.pending.append(ChangeEvent(kind, class_id, other_id))
+        self.deliver()
+
+    # Reports a list of ChangeEvents at once, for changes made without
+    # reporting each one, see EditorController.bulkApply
+    def emitAll(self, events):
+        self.generation += len(events)
+        if not self.subscribers:
+            return
+        self.pending.extend(events)
+        self.deliver()
+
+    # Flushes now, or asks the scheduler to flush later, unless a batch is open
+    def deliver(self):
+        if self.batch_depth > 0 or not self.pending:
+            return
+        if self.scheduler is None:
+            self.flush()
+        elif not self.scheduled:
+            self.scheduled = True
+            self.scheduler(self.flush)
+
+    @contextmanager
+    def batch(self):
+        self.batch_depth += 1
+        try:
+            yield self
+        finally:
+            self.batch_depth -= 1
+            self.deliver()
+
+    # Drops the events queued after the first `mark` ones, so subscribers never
+    # hear about changes that were rolled back
+    def discard(self, mark):
+        del self.pending[mark:]
+
+    # Sends every pending event now. Safe to call when nothing is pending
+    # Inside a batch this waits for the batch to end
+    def flush(self):
+        self.scheduled = False
+        if not self.pending or self.batch_depth > 0:
+            return
+        events = coalesce(self.pending)
+        self.pending = []
+        for callback in list(self.subscribers):
+            callback(events)
@@ -1,4 +1,8 @@
+import sys
 from enum import Enum
+from collections.abc import MutableMapping
+from .event_model import Change
+from .snapshot_model import CopyOnWrite
 
 class Type(Enum):
     Aggregate = 1
@@ -43,10 +47,16 @@ class Type(Enum):
             'Realization',
         ]
     
+# src and dst can be given as class names or as the Class objects themselves
+# The editor gives Class objects, so src and dst always show the current
+# class names, even after a class is renamed
 class Relationship:
+    __slots__ = ('_src', '_dst', 'typ')
+
+    # Class names are interned so they share the string held by the Class objects
     def __init__(self, src, dst, typ):
-        self.src = src
-        self.dst = dst
+        self._src = sys.intern(src) if isinstance(src, str) else src
+        self._dst = sys.intern(dst) if isinstance(dst, str) else dst
 
         #makes sure typ is Type
         if isinstance(typ, str):
@@ -57,6 +67,14 @@ class Relationship:
         self.typ = typ
 
     
+    @property
+    def src(self):
+        return self._src if isinstance(self._src, str) else self._src.name
+
+    @property
+    def dst(self):
+        return self._dst if isinstance(self._dst, str) else self._dst.name
+
     def __str__(self):
         if isinstance(self.typ, Type):
             return f'{{Src: {self.src}, Dst: {self.dst}, Typ: {self.typ.name}}}'
@@ -68,3 +86,181 @@ class Relationship:
 
     def __hash__(self):
         return hash((self.src, self.dst, self.typ))
+
+# Relationships of the editor, stored by the (src id, dst id) of their classes
+# Keys are small int pairs, so they stay valid when a class is renamed.
+# Keys given as (src name, dst name) still work and go through the class table,
+# and iterating gives (src name, dst name) pairs like the old dict did.
+#
+# The table also keeps an adjacency index, so the relationships touching
+# one class can be found in O(degree) instead of scanning every relationship
+#   outgoing[src id] => {dst id: None, ...}
+#   incoming[dst id] => {src id: None, ...}
+# Dicts are used as ordered sets so listings keep insertion order
+#
+# Adding and removing relationships is reported to `events`, if given
+#
+# Like the class table, this can be snapshotted in O(1), see CopyOnWrite.
+# The adjacency index is never shared. A relationship is changed in place
+# through `edit`, and relationships are moved over to the copy when a class
+# they point to is copied.
+class RelationshipTable(CopyOnWrite, MutableMapping):
+    def __init__(self, classes, events=None):
+        self.events = events
+        self.classes = classes
+        self._by_ids = {}
+        self.outgoing = {}
+        self.incoming = {}
+        self._initSharing()
+        classes.copied = self._classCopied
+
+    # Translates a (src name, dst name) key into class ids, None if a class is missing
+    def idKey(self, key):
+        src, dst = key
+        s = self.classes.ids.get(src)
+        d = self.classes.ids.get(dst)
+        if s is None or d is None:
+            return None
+        return (s, d)
+
+    def __contains__(self, key):
+        return self.idKey(key) in self._by_ids
+
+    def __getitem__(self, key):
+        ids = self.idKey(key)
+        if ids not in self._by_ids:
+            raise KeyError(key)
+        return self._by_ids[ids]
+
+    def __setitem__(self, key, rel):
+        ids = self.idKey(key)
+        if ids is None:
+            raise KeyError(key)
+        self.link(ids, rel)
+
+    def __delitem__(self, key):
+        ids = self.idKey(key)
+        if ids not in self._by_ids:
+            raise KeyError(key)
+        self.unlink(ids)
+
+    def __iter__(self):
+        by_id = self.classes.byId
+        return ((by_id(s).name, by_id(d).name) for (s, d) in self._by_ids)
+
+    def __len__(self):
+        return len(self._by_ids)
+
+    def values(self):
+        return self._by_ids.values()
+
+    # A new dict is used, since a snapshot may hold the old one
+    def clear(self):
+        self._by_ids = {}
+        self._shared_dicts = False
+        self.outgoing.clear()
+        self.incoming.clear()
+        self._emit(Change.Reset)
+
+    def _emit(self, kind, ids=(None, None)):
+        if self.events is not None:
+            self.events.emit(kind, *ids)
+
+    # Hands the dict to a snapshot, see CopyOnWrite
+    def freeze(self, snapshot):
+        self._freeze(snapshot)
+        return self._by_ids
+
+    def _copyDicts(self):
+        self._by_ids = dict(self._by_ids)
+
+    # Puts back the relationships of a snapshot, taken together with the
+    # snapshot the class table was restored to. This is not reported as events
+    def restore(self, snapshot):
+        self._freeze(snapshot)
+        self._by_ids = dict(snapshot.relationships)
+        self._shared_dicts = False
+        self.outgoing.clear()
+        self.incoming.clear()
+        for (src, dst) in self._by_ids:
+            self.outgoing.setdefault(src, {})[dst] = None
+            self.incoming.setdefault(dst, {})[src] = None
+
+    # The relationship under a (src name, dst name) key, safe to change in place
+    def edit(self, key):
+        ids = self.idKey(key)
+        if ids not in self._by_ids:
+            raise KeyError(key)
+        return self.editIds(ids)
+
+    def editIds(self, ids):
+        rel = self._by_ids[ids]
+        if self._isShared(ids):
+            self._ownDicts()
+            rel = Relationship(rel._src, rel._dst, rel.typ)
+            self._by_ids[ids] = rel
+            self._claim(ids)
+        return rel
+
+    # The live relationships of a class that was copied on write point to the copy
+    def _classCopied(self, old, new):
+        for ids in self.idPairs(new.id):
+            rel = self.editIds(ids)
+            if rel._src is old:
+                rel._src = new
+            if rel._dst is old:
+                rel._dst = new
+
+    def byIds(self, src, dst):
+        return self._by_ids.get((src, dst))
+
+    # Every (src id, dst id) key, in the order the relationships were added
+    def idKeys(self):
+        return self._by_ids.keys()
+
+    # Stores a relationship under a (src id, dst id) key
+    def link(self, ids, rel):
+        src, dst = ids
+        change = Change.RelationshipChanged if ids in self._by_ids else Change.RelationshipAdded
+        self._ownDicts()
+        self._by_ids[ids] = rel
+        self._claim(ids)
+        self.outgoing.setdefault(src, {})[dst] = None
+        self.incoming.setdefault(dst, {})[src] = None
+        self._emit(change, ids)
+
+    # Stores relationships given as ((src id, dst id), Relationship), whose keys
+    # are known to be new and distinct. Nothing is reported for each one, so
+    # the caller reports the change as a whole
+    def adopt(self, relationships):
+        self._ownDicts()
+        by_ids = self._by_ids
+        outgoing = self.outgoing
+        incoming = self.incoming
+        for ids, rel in relationships:
+            src, dst = ids
+            by_ids[ids] = rel
+            outgoing.setdefault(src, {})[dst] = None
+            incoming.setdefault(dst, {})[src] = None
+        if self._owned is not None:
+            self._owned.update(ids for ids, _ in relationships)
+
+    # Removes the relationship under a (src id, dst id) key
+    def unlink(self, ids):
+        src, dst = ids
+        self._ownDicts()
+        del self._by_ids[ids]
+        self.outgoing[src].pop(dst, None)
+        if not self.outgoing[src]:
+            del self.outgoing[src]
+        self.incoming[dst].pop(src, None)
+        if not self.incoming[dst]:
+            del self.incoming[dst]
+        self._emit(Change.RelationshipDeleted, ids)
+
+    # Every (src id, dst id) key with the class `cid` on either end, in O(degree)
+    # A relationship from a class to itself is only listed once
+    def idPairs(self, cid):
+        keys = [(cid, dst) for dst in self.outgoing.get(cid, ())]
+        keys += [(src, cid) for src in self.incoming.get(cid, ()) if src != cid]
+        return keys
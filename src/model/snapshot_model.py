@@ -0,0 +1,81 @@
+import weakref
+from types import MappingProxyType
+
+# Copy-on-write bookkeeping for the class and relationship tables
+#
+# Taking a snapshot hands the table's dicts to the snapshot as they are, so it
+# costs O(1). From then on the table never changes those dicts or the objects
+# in them in place:
+#   - the dicts are copied on the first write after a snapshot
+#   - an object is copied the first time it is edited, and the copy replaces
+#     it in the table. Objects that are not edited stay shared
+# `_owned` holds the keys of objects created or copied since the last snapshot,
+# which are the only ones the table can change in place. Snapshots are held
+# weakly, and once they are all gone the table changes everything in place again
+class CopyOnWrite:
+    def _initSharing(self):
+        self._snapshots = weakref.WeakSet()
+        self._owned = None
+        self._shared_dicts = False
+
+    def _freeze(self, snapshot):
+        self._snapshots.add(snapshot)
+        self._owned = set()
+        self._shared_dicts = True
+
+    # True while some snapshot may share the table's dicts or objects
+    def _sharing(self):
+        if self._owned is not None and not self._snapshots:
+            self._owned = None
+            self._shared_dicts = False
+        return self._owned is not None
+
+    # True if the object under `key` has to be copied before it is changed
+    def _isShared(self, key):
+        return self._sharing() and key not in self._owned
+
+    def _claim(self, key):
+        if self._owned is not None:
+            self._owned.add(key)
+
+    # Makes the table's dicts private before they are changed
+    def _ownDicts(self):
+        if self._shared_dicts and self._sharing():
+            self._copyDicts()
+        self._shared_dicts = False
+
+    def _copyDicts(self):
+        pass
+
+# A frozen view of the editor's model, see Editor.snapshot
+#   ids => class name -> class id
+#   classes => class id -> Class, in the order the classes were added
+#   relationships => (src id, dst id) -> Relationship
+# Everything in it is shared with the editor until the editor changes it, and
+# must be treated as read-only. A class the editor has not changed since is
+# the very same object in both, so comparing snapshots is cheap
+class Snapshot:
+    def __init__(self, classes, relationships):
+        ids, by_id = classes.freeze(self)
+        self.ids = MappingProxyType(ids)
+        self.classes = MappingProxyType(by_id)
+        self.relationships = MappingProxyType(relationships.freeze(self))
+
+    def getClass(self, name):
+        cid = self.ids.get(name)
+        return None if cid is None else self.classes[cid]
+
+    def getClasses(self):
+        return [clazz.name for clazz in self.classes.values()]
+
+    def getRelationshipType(self, src, dst):
+        rel = self.relationships.get((self.ids.get(src), self.ids.get(dst)))
+        return rel.typ if rel else None
+
+    # Ids of the classes added, deleted and changed in a later snapshot
+    def diff(self, later):
+        added = [cid for cid in later.classes if cid not in self.classes]
+        deleted = [cid for cid in self.classes if cid not in later.classes]
+        changed = [cid for cid, clazz in later.classes.items()
+                   if cid in self.classes and self.classes[cid] is not clazz]
+        return added, deleted, changed
@@ -5,6 +5,7 @@ from tests.test_editor_controller import testEditorController
 from tests.test_class_model import testModelClass
 from tests.test_singleton import testSingleton
 from tests.test_ui_cli import testCLI
+from tests.test_json_stream import testJsonStream
 
 if __name__ == '__main__':
     unittest.main()
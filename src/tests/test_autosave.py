@@ -0,0 +1,92 @@
+import unittest
+import unittest.mock
+import os
+import pytest
+from model.editor_model import Editor
+from model.command_model import *
+from controller.backend import FileBackend
+from controller.editor_controller import EditorController
+from controller.loader import loadFile
+from view.ui_cli import CLI
+
+class testAutosave(unittest.TestCase):
+    # Each test runs in a directory of its own, which is removed afterwards
+    @pytest.fixture(autouse=True)
+    def inTmpPath(self, tmp_path, monkeypatch):
+        monkeypatch.chdir(tmp_path)
+
+    def testAutosave(self):
+        editor = Editor()
+        ui = CLI()
+        ctrl = EditorController(ui, editor)
+        now = [0.0]
+        ctrl.storage.autosaver.clock = lambda: now[0]
+        ctrl.storage.autosaver.last = now[0]
+        ctrl.storage.autosaver.interval = 30
+        ctrl.classAdd('Foo')
+        b1 = editor.isDirty()
+        path = 'autosave.JSON'
+        with unittest.mock.patch.object(ctrl.ui, 'uiChooseSaveLocation', lambda: path):
+            ctrl.save()
+        b2 = not editor.isDirty()
+
+        # Changes made without a command are not in the journal, and are
+        # written once the interval has passed
+        ctrl.classAdd('Bar')
+        ctrl.autosave()
+        b3 = not ctrl.storage.autosaver.busy()
+        now[0] += 30
+        ctrl.autosave()
+        ctrl.finishAutosave(True)
+        with open(path) as f:
+            b4 = 'Bar' in f.read() and not editor.isDirty()
+        b5 = not any(name.startswith('.' + path) for name in os.listdir('.'))
+
+        # Nothing is written while the editor is clean
+        mtime = os.stat(path).st_mtime_ns
+        now[0] += 30
+        ctrl.autosave()
+        b6 = not ctrl.storage.autosaver.busy() and os.stat(path).st_mtime_ns == mtime
+
+        # Commands are in the journal, so they need no write
+        cmd = CommandClassAdd('Baz')
+        if cmd.execute(ctrl):
+            ctrl.pushCmd(cmd)
+        now[0] += 30
+        ctrl.autosave()
+        b7 = not ctrl.storage.autosaver.busy() and not editor.isDirty() and not ctrl.storage.journal.unsynced
+
+        # A step taken during a write is not in the file it replaces, so the
+        # journal starts again with only that step
+        ctrl.classAdd('Qux')
+        now[0] += 30
+        ctrl.autosave()
+        cmd = CommandClassAdd('Quux')
+        if cmd.execute(ctrl):
+            ctrl.pushCmd(cmd)
+        ctrl.finishAutosave(True)
+        reader = Editor()
+        loadFile(reader, path)
+        b8 = list(reader.classes) == ['Foo', 'Bar', 'Baz', 'Qux', 'Quux'] and ctrl.storage.journal.follows()
+        with open(path + '.journal') as f:
+            b8 = b8 and len(f.readlines()) == 2
+        ctrl.storage.close()
+        assert b1 and b2 and b3 and b4 and b5 and b6 and b7 and b8, 'Autosave did not write exactly the unsaved changes'
+
+    def testAutosaveLeavesUmask(self):
+        editor = Editor()
+        ui = CLI()
+        ctrl = EditorController(ui, editor)
+        ctrl.storage.autosaver.interval = 0
+        ctrl.classAdd('Foo')
+        path = 'umask.JSON'
+        ctrl.storage.attach(FileBackend(ctrl.storage, path, journal=False))
+        umask = os.umask(0)
+        os.umask(umask)
+        # A new file written on the autosave thread gets the usual
+        # permissions, without the process umask being changed
+        with unittest.mock.patch('os.umask', side_effect=AssertionError('umask changed')):
+            ctrl.autosave()
+            ctrl.finishAutosave(True)
+        b1 = os.path.exists(path) and os.stat(path).st_mode & 0o777 == 0o666 & ~umask
+        assert b1, 'Autosave changed the umask, or gave a new file the wrong permissions'
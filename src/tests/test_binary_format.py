@@ -0,0 +1,54 @@
+import unittest
+import io
+import pytest
+from model.editor_model import Editor
+from model.class_model import Class
+from controller.binary_format import MAGIC, VERSION, MappedDiagram, readBinary, writeBinary
+
+class testBinaryFormat(unittest.TestCase):
+    # Each test runs in a directory of its own, which is removed afterwards
+    @pytest.fixture(autouse=True)
+    def inTmpPath(self, tmp_path, monkeypatch):
+        monkeypatch.chdir(tmp_path)
+
+    def testHeaderCountsChecked(self):
+        def varint(n):
+            out = bytearray()
+            while n >= 0x80:
+                out.append(n & 0x7f | 0x80)
+                n >>= 7
+            out.append(n)
+            return bytes(out)
+        editor = Editor()
+        editor.classes['Foo'] = Class('Foo')
+        out = io.BytesIO()
+        writeBinary(out, editor.classes.values(), editor.relationships.values())
+        valid = out.getvalue()
+        header = MAGIC + bytes([VERSION]) + varint(1) + varint(1) + varint(0)
+        body = valid[len(header):]
+
+        # Counts the file is far too short for, or more classes than strings,
+        # are rejected before anything is allocated for them
+        headers = [(10 ** 15, 1, 0), (1, 10 ** 15, 0), (1, 1, 10 ** 15), (1, 2, 0)]
+        results = []
+        for counts in headers:
+            data = MAGIC + bytes([VERSION]) + b''.join(varint(n) for n in counts) + body
+            try:
+                readBinary(io.BytesIO(data), None)
+                results.append(False)
+            except ValueError:
+                results.append(True)
+            with open('test.umlb', 'wb') as f:
+                f.write(data)
+            try:
+                MappedDiagram('test.umlb')
+                results.append(False)
+            except ValueError:
+                results.append(True)
+        b1 = all(results)
+
+        # The file the bodies come from passes
+        with open('test.umlb', 'wb') as f:
+            f.write(valid)
+        b2 = valid.startswith(header) and MappedDiagram('test.umlb').names == ['Foo']
+        assert b1 and b2, 'A header with counts the file cannot hold was not rejected'
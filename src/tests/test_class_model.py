@@ -2,7 +2,7 @@ import unittest
 import unittest.mock
 import os
 from model.editor_model import Editor
-from model.class_model import Class, Field, Method
+from model.class_model import Class, Field, Method, Members
 from model.relationship_model import Type, Relationship
 from model.command_model import *
 from controller.editor_controller import EditorController
@@ -21,3 +21,25 @@ class testModelClass(unittest.TestCase):
         b3 = methods[Method('run')]
         b4 = Method('run').__hash__() == hash(('run'))
         assert b1 and b2 and b3 and b4, 'Hashes not working as intended'
+
+    def testMembersLookup(self):
+        members = Members([Field('a'), Field('b')])
+        b1 = 'a' in members and Field('b') in members and 'c' not in members
+        b2 = members['b'].name == 'b' and members[1].name == 'b' and members.get('c') is None
+        b3 = members.index(Field('b')) == 1 and len(members) == 2
+        assert b1 and b2 and b3, 'Members lookup not working as intended'
+
+    def testMembersRenameKeepsOrder(self):
+        members = Members([Field('a'), Field('b'), Field('c')])
+        b1 = members.rename('a', 'z')
+        b2 = not members.rename('b', 'c')
+        b3 = members.names() == ['z', 'b', 'c'] and 'a' not in members
+        assert b1 and b2 and b3, 'Rename did not keep the declaration order'
+
+    def testMembersRemove(self):
+        members = Members([Method('run', ['a']), Method('walk')])
+        m = members.pop('run')
+        b1 = m.params == ['a'] and members.pop('run') is None
+        members.add(Method('run'))
+        b2 = members.names() == ['walk', 'run']
+        assert b1 and b2, 'Members removal not working as intended'
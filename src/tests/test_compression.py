@@ -0,0 +1,46 @@
+import unittest
+import unittest.mock
+import os
+import json
+import pytest
+from model.editor_model import Editor, EditorEncoder
+from model.relationship_model import Type
+from controller.editor_controller import EditorController
+from view.ui_cli import CLI
+
+class testCompression(unittest.TestCase):
+    # Each test runs in a directory of its own, which is removed afterwards
+    @pytest.fixture(autouse=True)
+    def inTmpPath(self, tmp_path, monkeypatch):
+        monkeypatch.chdir(tmp_path)
+
+    def testSaveCompressedRoundTrip(self):
+        editor = Editor()
+        ui = CLI()
+        ctrl = EditorController(ui, editor)
+        ctrl.classAdd('Foo')
+        ctrl.classAdd('Bar')
+        ctrl.addField('Foo', 'size')
+        ctrl.addMethod('Bar', 'run', ['speed'])
+        ctrl.relationshipAdd('Foo', 'Bar', Type.Realization)
+        expected = json.dumps(editor, cls=EditorEncoder)
+        magic = {'.gz': b'\x1f\x8b', '.bz2': b'BZh', '.xz': b'\xfd7zXZ\x00'}
+        results = []
+        for base in ('compressed.JSON', 'compressed.umlb'):
+            for extension, head in magic.items():
+                path = base + extension
+                with unittest.mock.patch.object(ctrl.ui, 'uiChooseSaveLocation', lambda: path):
+                    ctrl.save()
+                ctrl.storage.close()
+                with open(path, 'rb') as f:
+                    compressed = f.read().startswith(head)
+                # Loading goes by the first bytes, not the name
+                renamed = 'compressed.data'
+                os.replace(path, renamed)
+                loaded = Editor()
+                ctrl2 = EditorController(ui, loaded)
+                with unittest.mock.patch.object(ctrl2.ui, 'uiChooseLoadLocation', lambda: renamed):
+                    ctrl2.open()
+                ctrl2.storage.close()
+                results.append(compressed and json.dumps(loaded, cls=EditorEncoder) == expected)
+        assert all(results), 'Compressed files did not load back the same diagram'
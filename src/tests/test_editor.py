@@ -1,11 +1,20 @@
 import unittest
-from model.editor_model import Editor
+import unittest.mock
+import os
+import json
+import shutil
+from model.editor_model import Editor, EditorEncoder
 from model.class_model import Class, Field, Method
 from model.relationship_model import Type, Relationship
+from model.event_model import Change, ChangeEvent
 from model.command_model import *
 from controller.editor_controller import EditorController
-from view.ui_cli import CLI
+from controller.loader import loadFile, openFile
+from controller.memento import Memento
+from controller.validator import DiagramError
+from view.ui_cli import CLI, Completions
 from view.ui_gui import GUI
+from view.ui_interface import UI
 
 class testEditor(unittest.TestCase):
 
@@ -653,6 +662,23 @@ class testEditor(unittest.TestCase):
         b2 = ctrl.editor.classes['Foo'].methods[idx].params == ['d', 'e', 'f']
         assert b1 and b2, 'Parameters were not replaced'
 
+    def testReplaceParametersCopies(self):
+        editor = Editor()
+        ui = CLI()
+        ctrl = EditorController(ui, editor)
+        ctrl.classAdd('Foo')
+        ctrl.addMethod('Foo', 'run', ['a'])
+
+        # The method never shares its list with the command
+        cmd = CommandParameterChange('Foo', 'run', ['d', 'e'])
+        cmd.execute(ctrl)
+        cmd.params.append('x')
+        b1 = editor.classes['Foo'].methods['run'].params == ['d', 'e']
+        cmd.undo(ctrl)
+        cmd.old_params.append('y')
+        b2 = editor.classes['Foo'].methods['run'].params == ['a']
+        assert b1 and b2, 'The method shares its parameter list with a command'
+
     def testReplaceParametersFailure1(self):
         editor = Editor()
         ui = CLI()
@@ -759,3 +785,654 @@ class testEditor(unittest.TestCase):
         b1 = Method('run') in ctrl.editor.classes['Foo'].methods
         b2 = 'Baz' not in ctrl.editor.classes
         assert b1 and b2, 'Redo failed on double undo'
+
+    def testAdjacencyIndex(self):
+        editor = Editor()
+        ui = CLI()
+        ctrl = EditorController(ui, editor)
+
+        ctrl.classAdd('Foo')
+        ctrl.classAdd('Bar')
+        ctrl.classAdd('Baz')
+        ctrl.relationshipAdd('Foo', 'Bar', Type.Aggregate)
+        ctrl.relationshipAdd('Baz', 'Foo', Type.Inheritance)
+        b1 = editor.relationshipKeys('Foo') == [('Foo', 'Bar'), ('Baz', 'Foo')]
+        b2 = [(c, d) for c, d, _ in ctrl.findRelationships('Foo')] == [('Bar', True), ('Baz', False)]
+
+        ctrl.relationshipDelete('Bar', 'Foo')
+        b3 = editor.relationshipKeys('Bar') == [] and editor.classes.idOf('Bar') not in editor.relationships.incoming
+        assert b1 and b2 and b3, 'Adjacency index was not kept up to date'
+
+    def testAdjacencyClassDelete(self):
+        editor = Editor()
+        ui = CLI()
+        ctrl = EditorController(ui, editor)
+
+        ctrl.classAdd('Foo')
+        ctrl.classAdd('Bar')
+        ctrl.classAdd('Baz')
+        ctrl.relationshipAdd('Foo', 'Bar', Type.Aggregate)
+        ctrl.relationshipAdd('Bar', 'Baz', Type.Composition)
+        ctrl.relationshipAdd('Foo', 'Foo', Type.Realization)
+        b1 = len(ctrl.findRelationships('Foo')) == 2
+
+        ctrl.classDelete('Foo')
+        b2 = list(editor.relationships) == [('Bar', 'Baz')]
+        b3 = editor.relationshipKeys('Foo') == [] and editor.relationshipKeys('Bar') == [('Bar', 'Baz')]
+        assert b1 and b2 and b3, 'Relationships of a deleted class were not removed'
+
+    def testClassRenameKeepsRelationships(self):
+        editor = Editor()
+        ui = CLI()
+        ctrl = EditorController(ui, editor)
+
+        ctrl.classAdd('Foo')
+        ctrl.classAdd('Bar')
+        cid = editor.classes.idOf('Foo')
+        ctrl.relationshipAdd('Foo', 'Bar', Type.Aggregate)
+
+        ctrl.classRename('Foo', 'Baz')
+        b1 = editor.classes.idOf('Baz') == cid and editor.classes.byId(cid).name == 'Baz'
+        b2 = ('Baz', 'Bar') in editor.relationships and ('Foo', 'Bar') not in editor.relationships
+        b3 = editor.relationships[('Baz', 'Bar')].src == 'Baz' and list(editor.relationships) == [('Baz', 'Bar')]
+        b4 = editor.getClasses() == ['Baz', 'Bar']
+        assert b1 and b2 and b3 and b4, 'Relationships did not follow the renamed class'
+
+    def testStateCounters(self):
+        editor = Editor()
+        ui = CLI()
+        ctrl = EditorController(ui, editor)
+
+        ctrl.classAdd('Foo')
+        ctrl.classAdd('Bar')
+        b1 = not editor.canDoParams() and editor.canAddRelationship()
+
+        ctrl.addMethod('Foo', 'run', [])
+        ctrl.addMethod('Foo', 'walk', [])
+        ctrl.addMethod('Bar', 'run', [])
+        b2 = editor.classesWithMethodsCount() == 2 and editor.canDoParams()
+
+        ctrl.deleteMethod('Foo', 'run')
+        ctrl.classDelete('Bar')
+        b3 = editor.classesWithMethodsCount() == 1
+
+        ctrl.deleteMethod('Foo', 'walk')
+        b4 = not editor.canDoParams() and editor.classCount() == 1 and not editor.canAddRelationship()
+        assert b1 and b2 and b3 and b4, 'State counters were not kept up to date'
+
+    def testEventsCoalesced(self):
+        editor = Editor()
+        ui = CLI()
+        ctrl = EditorController(ui, editor)
+        received = []
+        editor.subscribe(received.append)
+
+        ctrl.classAdd('Foo')
+        b1 = received == [[ChangeEvent(Change.ClassAdded, editor.classes.idOf('Foo'))]]
+
+        received.clear()
+        with editor.batch():
+            ctrl.classAdd('Bar')
+            ctrl.addField('Bar', 'x')
+            ctrl.addField('Bar', 'y')
+            ctrl.relationshipAdd('Foo', 'Bar', Type.Aggregate)
+        bar = editor.classes.idOf('Bar')
+        b2 = len(received) == 1 and received[0] == [ChangeEvent(Change.ClassAdded, bar),
+                                                    ChangeEvent(Change.MembersChanged, bar),
+                                                    ChangeEvent(Change.RelationshipAdded, editor.classes.idOf('Foo'), bar)]
+
+        received.clear()
+        with editor.batch():
+            ctrl.classAdd('Baz')
+            editor.classes.clear()
+            ctrl.classAdd('Qux')
+        b3 = len(received) == 1 and received[0][0].kind == Change.Reset and len(received[0]) == 2
+        assert b1 and b2 and b3, 'Events were not coalesced per batch'
+
+    def testEventsScheduled(self):
+        editor = Editor()
+        ui = CLI()
+        ctrl = EditorController(ui, editor)
+        received = []
+        scheduled = []
+        editor.subscribe(received.append)
+        editor.events.scheduler = scheduled.append
+
+        ctrl.classAdd('Foo')
+        ctrl.classRename('Foo', 'Bar')
+        ctrl.classDelete('Bar')
+        b1 = received == [] and len(scheduled) == 1
+
+        scheduled[0]()
+        b2 = len(received) == 1 and [e.kind for e in received[0]] == [Change.ClassAdded, Change.ClassRenamed, Change.ClassDeleted]
+        assert b1 and b2, 'Events were not delivered once per tick'
+
+    def testClassCompletionsCache(self):
+        editor = Editor()
+        ui = CLI()
+        ctrl = EditorController(ui, editor)
+        completions = Completions.instance()
+
+        ctrl.classAdd('Foo')
+        completions.class_completions(ctrl)
+        b1 = completions.get_tab_completions() == ['Foo']
+
+        ctrl.addField('Foo', 'x')
+        b2 = completions.class_names == ['Foo']
+
+        ctrl.classRename('Foo', 'Bar')
+        completions.class_completions(ctrl)
+        b3 = completions.get_tab_completions() == ['Bar']
+
+        other = EditorController(CLI(), Editor())
+        completions.class_completions(other)
+        b4 = completions.get_tab_completions() == [] and completions.onEditorChanges not in editor.events.subscribers
+        assert b1 and b2 and b3 and b4, 'Class completions were not invalidated by editor events'
+
+    def testBulkAdd(self):
+        editor = Editor()
+        ui = CLI()
+        ctrl = EditorController(ui, editor)
+        received = []
+        editor.subscribe(received.append)
+        ctrl.classAdd('Foo')
+        received.clear()
+
+        cmd = CommandBulkAdd([('Bar', ['x', 'y'], [('run', ['a'])]), ('Baz', [], [])],
+                             [('Foo', 'Bar', Type.Aggregate), ('Bar', 'Baz', 'composition')])
+        b1 = cmd.execute(ctrl)
+        ctrl.pushCmd(cmd)
+        b2 = editor.classes['Bar'].fields.names() == ['x', 'y'] and editor.classes['Bar'].methods['run'].params == ['a']
+        b3 = editor.getRelationshipType('Bar', 'Baz') == Type.Composition and editor.classesWithMethodsCount() == 1
+        b4 = len(received) == 1 and len(editor.action_stack) == 1
+
+        ctrl.undo()
+        b5 = editor.getClasses() == ['Foo'] and len(editor.relationships) == 0
+        assert b1 and b2 and b3 and b4 and b5, 'Bulk add did not apply as one step'
+
+    def testBulkAddEvents(self):
+        editor = Editor()
+        ui = CLI()
+        ctrl = EditorController(ui, editor)
+        received = []
+        editor.subscribe(received.append)
+
+        # Into an empty editor, the batch is reported as one Reset
+        ctrl.bulkAdd([('Foo', [], []), ('Bar', [], [])], [('Foo', 'Bar', Type.Aggregate)])
+        b1 = received == [[ChangeEvent(Change.Reset)]]
+
+        # Otherwise only what is new is reported
+        received.clear()
+        ctrl.bulkAdd([('Baz', ['x'], [])], [('Baz', 'Foo', Type.Inheritance)])
+        baz, foo = editor.classes.idOf('Baz'), editor.classes.idOf('Foo')
+        b2 = received == [[ChangeEvent(Change.ClassAdded, baz), ChangeEvent(Change.RelationshipAdded, baz, foo)]]
+        b3 = editor.relationshipKeys('Foo') == [('Foo', 'Bar'), ('Baz', 'Foo')] and editor.classes['Baz'].id == baz
+        assert b1 and b2 and b3, 'Bulk add did not report its changes at once'
+
+    def testBulkAddInvalid(self):
+        editor = Editor()
+        ui = CLI()
+        ctrl = EditorController(ui, editor)
+        ctrl.classAdd('Foo')
+
+        with unittest.mock.patch.object(ctrl.ui, 'uiError') as error:
+            b1 = not ctrl.bulkAdd([('Bar', [], []), ('Foo', [], [])])
+            b2 = not ctrl.bulkAdd([('Bar', ['x', 'x'], [])])
+            b2 = b2 and not ctrl.bulkAdd([('Bar', [], [('run', []), ('run', ['a'])])])
+            b3 = not ctrl.bulkAdd([('Bar', [], [])], [('Bar', 'Qux', Type.Aggregate)])
+            b3 = b3 and not ctrl.bulkAdd([('Bar', [], [])], [('Bar', 'Foo', 'friend')])
+            b4 = not ctrl.bulkAdd([('Bar', [], [])], [('Bar', 'Foo', Type.Aggregate), ('Foo', 'Bar', Type.Inheritance)])
+        b5 = editor.getClasses() == ['Foo'] and len(editor.relationships) == 0
+        b5 = b5 and [call.args[0] for call in error.call_args_list] == [
+            'Class Foo already exists', 'Class Bar has the same field more than once',
+            'Class Bar has the same method more than once', 'class `Qux` does not exist',
+            'Invalid relationship type: friend', 'There is already a relationship between `Foo` and `Bar`']
+        assert b1 and b2 and b3 and b4 and b5, 'Invalid bulk add changed the editor'
+
+    def testBulkDelete(self):
+        editor = Editor()
+        ui = CLI()
+        ctrl = EditorController(ui, editor)
+        ctrl.bulkAdd([('Foo', ['x'], [('run', ['a', 'b'])]), ('Bar', [], []), ('Baz', [], [])],
+                     [('Foo', 'Bar', Type.Aggregate), ('Baz', 'Bar', Type.Inheritance)])
+
+        b1 = not ctrl.bulkDelete(['Foo', 'Qux'])
+        cmd = CommandBulkDelete(['Foo'], [('Bar', 'Baz')])
+        b2 = cmd.execute(ctrl)
+        b3 = editor.getClasses() == ['Bar', 'Baz'] and len(editor.relationships) == 0
+
+        cmd.undo(ctrl)
+        b4 = editor.classes['Foo'].methods['run'].params == ['a', 'b'] and editor.classes['Foo'].fields.names() == ['x']
+        b5 = editor.getRelationshipType('Foo', 'Bar') == Type.Aggregate and editor.getRelationshipType('Baz', 'Bar') == Type.Inheritance
+        assert b1 and b2 and b3 and b4 and b5, 'Bulk delete did not restore on undo'
+
+    def testTransactionRollback(self):
+        editor = Editor()
+        ui = CLI()
+        ctrl = EditorController(ui, editor)
+        ctrl.classAdd('Foo')
+        ctrl.addMethod('Foo', 'run', ['a'])
+        ctrl.classAdd('Bar')
+        ctrl.relationshipAdd('Foo', 'Bar', Type.Aggregate)
+        foo = editor.classes.idOf('Foo')
+        received = []
+        editor.subscribe(received.append)
+
+        try:
+            with ctrl.transaction():
+                ctrl.classRename('Foo', 'Baz')
+                ctrl.removeParameter('Baz', 'run', 'a')
+                ctrl.classDelete('Bar')
+                ctrl.classAdd('Qux')
+                raise ValueError('malformed')
+        except ValueError:
+            pass
+        b1 = editor.getClasses() == ['Foo', 'Bar'] and editor.classes.idOf('Foo') == foo
+        b2 = editor.classes['Foo'].methods['run'].params == ['a'] and editor.classesWithMethodsCount() == 1
+        b3 = editor.getRelationshipType('Foo', 'Bar') == Type.Aggregate and editor.relationshipKeys('Bar') == [('Foo', 'Bar')]
+        b4 = received == []
+        assert b1 and b2 and b3 and b4, 'Transaction was not rolled back'
+
+    def testTransactionCommit(self):
+        editor = Editor()
+        ui = CLI()
+        ctrl = EditorController(ui, editor)
+        received = []
+        editor.subscribe(received.append)
+
+        with unittest.mock.patch.object(ui, 'uiFeedback') as feedback, unittest.mock.patch.object(ui, 'uiError') as error:
+            with ctrl.transaction():
+                ctrl.classAdd('Foo')
+                ctrl.classAdd('Foo')
+                ctrl.addField('Foo', 'x')
+                ctrl.addField('Bar', 'x')
+            b1 = feedback.call_count == 0 and error.call_count == 1
+        b2 = len(received) == 1 and editor.classes['Foo'].fields.names() == ['x']
+        assert b1 and b2, 'Transaction did not report once on commit'
+
+    def testLoadMalformedRollsBack(self):
+        editor = Editor()
+        ui = CLI()
+        ctrl = EditorController(ui, editor)
+        ctrl.classAdd('Foo')
+        path = 'malformed.JSON'
+        with open(path, 'w') as f:
+            f.write('{"classes": [{"name": "Bar", "fields": [], "methods": []}, {"name": "Baz"}], "relationships": []}')
+
+        with unittest.mock.patch.object(ctrl.ui, 'uiChooseLoadLocation', lambda: path):
+            ctrl.load()
+        os.remove(path)
+        assert editor.getClasses() == ['Foo'], 'Malformed file was partly loaded'
+
+    def testSnapshotSharesClasses(self):
+        editor = Editor()
+        ui = CLI()
+        ctrl = EditorController(ui, editor)
+        ctrl.bulkAdd([('Foo', ['x'], [('run', ['a'])]), ('Bar', [], []), ('Baz', [], [])],
+                     [('Foo', 'Bar', Type.Aggregate)])
+        foo, bar, baz = editor.classes.idOf('Foo'), editor.classes.idOf('Bar'), editor.classes.idOf('Baz')
+
+        snap = editor.snapshot()
+        b1 = snap.classes[foo] is editor.classes.byId(foo) and snap.relationships[(foo, bar)] is editor.relationships.byIds(foo, bar)
+
+        ctrl.classRename('Foo', 'Qux')
+        ctrl.removeParameter('Qux', 'run', 'a')
+        ctrl.relationshipEdit('Qux', 'Bar', Type.Composition)
+        ctrl.classDelete('Baz')
+        b2 = snap.getClasses() == ['Foo', 'Bar', 'Baz'] and snap.getClass('Foo').methods['run'].params == ['a']
+        b3 = snap.relationships[(foo, bar)].src == 'Foo' and snap.getRelationshipType('Foo', 'Bar') == Type.Aggregate
+        b4 = editor.relationships[('Qux', 'Bar')].src == 'Qux' and editor.getRelationshipType('Qux', 'Bar') == Type.Composition
+        b5 = snap.classes[bar] is editor.classes.byId(bar)
+        b6 = snap.diff(editor.snapshot()) == ([], [baz], [foo])
+        assert b1 and b2 and b3 and b4 and b5 and b6, 'Snapshot did not stay frozen while sharing unchanged classes'
+
+    def testSnapshotReleased(self):
+        editor = Editor()
+        ui = CLI()
+        ctrl = EditorController(ui, editor)
+        ctrl.classAdd('Foo')
+        clazz = editor.classes['Foo']
+
+        snap = editor.snapshot()
+        del snap
+        ctrl.addField('Foo', 'x')
+        assert editor.classes['Foo'] is clazz, 'Class was copied with no snapshot left'
+
+    def testPushCmdTruncatesRedo(self):
+        editor = Editor()
+        ui = CLI()
+        ctrl = EditorController(ui, editor)
+        for name in ['Foo', 'Bar', 'Baz']:
+            cmd = CommandClassAdd(name)
+            cmd.execute(ctrl)
+            ctrl.pushCmd(cmd)
+
+        ctrl.undo()
+        ctrl.undo()
+        cmd = CommandClassAdd('Qux')
+        cmd.execute(ctrl)
+        ctrl.pushCmd(cmd)
+        b1 = len(editor.action_stack) == 2 and editor.action_idx == 1 and not editor.canRedo()
+        b2 = editor.historySize() == (2, sum(editor.action_sizes)) and len(editor.action_sizes) == 2
+
+        ctrl.redo()
+        ctrl.undo()
+        b3 = editor.getClasses() == ['Foo']
+        assert b1 and b2 and b3, 'Pushing a command did not discard the redo branch'
+
+    def testHistoryBounded(self):
+        editor = Editor()
+        ui = CLI()
+        ctrl = EditorController(ui, editor)
+        editor.setHistoryLimit(entries=3)
+        for i in range(5):
+            cmd = CommandClassAdd(f'Foo{i}')
+            cmd.execute(ctrl)
+            ctrl.pushCmd(cmd)
+        b1 = [cmd.name for cmd in editor.action_stack] == ['Foo2', 'Foo3', 'Foo4'] and editor.action_idx == 2
+
+        editor.setHistoryLimit(max_bytes=editor.action_sizes[-1])
+        b2 = editor.historySize() == (1, editor.action_sizes[0]) and editor.action_idx == 0
+
+        ctrl.undo()
+        ctrl.undo()
+        b3 = editor.getClasses() == ['Foo0', 'Foo1', 'Foo2', 'Foo3'] and not editor.canUndo()
+        assert b1 and b2 and b3, 'Undo history was not bounded oldest first'
+
+    def testHistoryLimitDropsRedo(self):
+        editor = Editor()
+        ui = CLI()
+        ctrl = EditorController(ui, editor)
+        for name in 'ABCDEF':
+            cmd = CommandClassAdd(name)
+            cmd.execute(ctrl)
+            ctrl.pushCmd(cmd)
+        for i in range(3):
+            ctrl.undo()
+        editor.setHistoryLimit(entries=2)
+        b1 = [cmd.name for cmd in editor.action_stack] == ['B', 'C'] and editor.action_idx == 1
+        b2 = editor.canUndo() and not editor.canRedo()
+
+        ctrl.redo()
+        b3 = editor.getClasses() == ['A', 'B', 'C']
+        ctrl.undo()
+        ctrl.undo()
+        b4 = editor.getClasses() == ['A'] and not editor.canUndo()
+        assert b1 and b2 and b3 and b4, 'Bounding the history did not drop the undone commands first'
+
+    def testLoadBuildsModelDirectly(self):
+        editor = Editor()
+        ui = CLI()
+        ctrl = EditorController(ui, editor)
+        received = []
+        editor.subscribe(received.append)
+        path = 'direct.JSON'
+        with open(path, 'w') as f:
+            f.write('{"relationships": [{"source": "Bar", "destination": "Foo", "type": "Composition"}], '
+                    '"classes": [{"name": "Foo", "fields": [{"name": "x"}], "methods": '
+                    '[{"name": "run", "params": [{"name": "a"}]}], "position": {"x": 5, "y": 6}}, '
+                    '{"name": "Bar", "fields": [], "methods": []}]}')
+
+        with unittest.mock.patch.object(ctrl.ui, 'uiChooseLoadLocation', lambda: path), \
+             unittest.mock.patch.object(ctrl.ui, 'uiFeedback') as feedback:
+            ctrl.load()
+        os.remove(path)
+        foo = editor.classes['Foo']
+        b1 = editor.getClasses() == ['Foo', 'Bar'] and foo.fields.names() == ['x'] and foo.methods['run'].params == ['a']
+        b2 = foo.position == (5, 6) and editor.getRelationshipType('Bar', 'Foo') == Type.Composition
+        b3 = len(received) == 1 and feedback.call_count == 1 and editor.classes.classes_with_methods == 1
+        assert b1 and b2 and b3, 'Load did not build the model in one batch'
+
+    def testLoadRejectsDuplicates(self):
+        editor = Editor()
+        ui = CLI()
+        ctrl = EditorController(ui, editor)
+        path = 'duplicates.JSON'
+        files = [
+            '{"classes": [{"name": "Foo", "fields": [{"name": "x"}, {"name": "x"}], "methods": []}], "relationships": []}',
+            '{"classes": [{"name": "Foo", "fields": [], "methods": []}, {"name": "Foo", "fields": [], "methods": []}], "relationships": []}',
+            '{"classes": [{"name": "Foo", "fields": [], "methods": []}], "relationships": '
+            '[{"source": "Foo", "destination": "Bar", "type": "Composition"}]}',
+            '{"classes": [{"name": "Foo", "fields": [], "methods": []}, {"name": "Bar", "fields": [], "methods": []}], "relationships": '
+            '[{"source": "Foo", "destination": "Bar", "type": "Composition"}, {"source": "Bar", "destination": "Foo", "type": "Inheritance"}]}',
+        ]
+        errors = 0
+        for text in files:
+            with open(path, 'w') as f:
+                f.write(text)
+            with unittest.mock.patch.object(ctrl.ui, 'uiChooseLoadLocation', lambda: path), \
+                 unittest.mock.patch.object(ctrl.ui, 'uiError') as error:
+                ctrl.load()
+            errors += error.call_count
+        os.remove(path)
+        assert errors == len(files) and len(editor.classes) == 0, 'Invalid files were loaded'
+
+    def testSaveCompactRoundTrip(self):
+        editor = Editor()
+        ui = CLI()
+        ctrl = EditorController(ui, editor)
+        ctrl.classAdd('Foo')
+        ctrl.classAdd('Bar')
+        ctrl.addField('Foo', 'size')
+        ctrl.addMethod('Bar', 'run', ['energy', 'speed'])
+        ctrl.relationshipAdd('Foo', 'Bar', Type.Aggregate)
+        sizes = []
+        b1 = True
+        path = 'compact.JSON'
+        for compact in (False, True):
+            with unittest.mock.patch.object(ctrl.ui, 'uiChooseSaveLocation', lambda: path):
+                ctrl.save(compact)
+            with open(path) as f:
+                text = f.read()
+            sizes.append(len(text))
+            b1 = b1 and json.loads(text) == json.loads(json.dumps(editor, cls=EditorEncoder))
+
+        loaded = Editor()
+        ctrl = EditorController(ui, loaded)
+        with unittest.mock.patch.object(ctrl.ui, 'uiChooseLoadLocation', lambda: path):
+            ctrl.load()
+        os.remove(path)
+        b2 = sizes[1] < sizes[0] and '\n' not in text
+        b3 = loaded.getClasses() == ['Foo', 'Bar'] and loaded.getRelationshipType('Foo', 'Bar') == Type.Aggregate
+        assert b1 and b2 and b3, 'Compact save did not round trip'
+
+    def testSaveBinaryRoundTrip(self):
+        editor = Editor()
+        ui = CLI()
+        ctrl = EditorController(ui, editor)
+        ctrl.classAdd('Foo')
+        ctrl.classAdd('Bär')
+        ctrl.addField('Foo', 'size')
+        ctrl.addMethod('Bär', 'run', ['energy', 'size'])
+        ctrl.relationshipAdd('Foo', 'Bär', Type.Aggregate)
+        editor.classes.edit('Foo').position = (-300, 200)
+        editor.classes.edit('Bär').position = (1.5, 2.25)
+        path = 'binary.umlb'
+        with unittest.mock.patch.object(ctrl.ui, 'uiChooseSaveLocation', lambda: path):
+            ctrl.save()
+        with open(path, 'rb') as f:
+            data = f.read()
+
+        loaded = Editor()
+        ctrl = EditorController(ui, loaded)
+        with unittest.mock.patch.object(ctrl.ui, 'uiChooseLoadLocation', lambda: path):
+            ctrl.load()
+        b1 = data.startswith(b'UMLB') and data.count(b'size') == 1
+        b2 = json.dumps(loaded, cls=EditorEncoder) == json.dumps(editor, cls=EditorEncoder)
+
+        # A cut off file is rejected and leaves the editor as it was
+        with open(path, 'wb') as f:
+            f.write(data[:-2])
+        with unittest.mock.patch.object(ctrl.ui, 'uiChooseLoadLocation', lambda: path), \
+             unittest.mock.patch.object(ctrl.ui, 'uiError') as error:
+            ctrl.load()
+        os.remove(path)
+        b3 = error.call_count == 1 and loaded.getClasses() == ['Foo', 'Bär']
+        assert b1 and b2 and b3, 'Binary file did not round trip'
+
+    def testOpenBinaryIsLazy(self):
+        editor = Editor()
+        ui = CLI()
+        ctrl = EditorController(ui, editor)
+        ctrl.bulkAdd([('Foo', ['size'], [('run', ['energy'])]), ('Bar', [], []), ('Baz', ['x'], [])],
+                     [('Foo', 'Bar', Type.Composition)])
+        editor.classes.edit('Foo').position = (10, -20)
+        path = 'lazy.umlb'
+        with unittest.mock.patch.object(ctrl.ui, 'uiChooseSaveLocation', lambda: path):
+            ctrl.save()
+
+        opened = Editor()
+        ctrl = EditorController(ui, opened)
+        with unittest.mock.patch.object(ctrl.ui, 'uiChooseLoadLocation', lambda: path):
+            ctrl.open()
+        b1 = opened.getClasses() == ['Foo', 'Bar', 'Baz'] and opened.classes.classes_with_methods == 1
+        b2 = opened.getRelationshipType('Foo', 'Bar') == Type.Composition
+        b3 = not any(clazz.loaded() for clazz in opened.classes.values())
+
+        # Only the classes that are used are read
+        foo = opened.classes['Foo']
+        b4 = foo.methods['run'].params == ['energy'] and foo.position == (10, -20)
+        b5 = foo.loaded() and not opened.classes['Baz'].loaded()
+
+        # Changes work as usual, and saving over the mapped file is safe
+        ctrl.deleteMethod('Foo', 'run')
+        ctrl.addField('Baz', 'y')
+        with unittest.mock.patch.object(ctrl.ui, 'uiChooseSaveLocation', lambda: path):
+            ctrl.save()
+        b6 = opened.classes.classes_with_methods == 0 and opened.classes['Baz'].fields.names() == ['x', 'y']
+        reloaded = Editor()
+        ctrl = EditorController(ui, reloaded)
+        with unittest.mock.patch.object(ctrl.ui, 'uiChooseLoadLocation', lambda: path):
+            ctrl.load()
+        os.remove(path)
+        b7 = json.dumps(reloaded, cls=EditorEncoder) == json.dumps(opened, cls=EditorEncoder)
+        assert b1 and b2 and b3 and b4 and b5 and b6 and b7, 'Opening a binary file was not lazy'
+
+    def testOpenChecksLazyClasses(self):
+        from types import SimpleNamespace
+        from controller.binary_format import writeBinary
+        from controller.project import writeProject
+        # A binary class with the same field twice
+        path = 'broken.umlb'
+        broken = SimpleNamespace(name='Foo', fields=[Field('x'), Field('x')], methods=[], position=None,
+                                 hasMethods=lambda: False)
+        with open(path, 'wb') as f:
+            writeBinary(f, [broken, Class('Bar')], [])
+        opened = Editor()
+        openFile(opened, path)
+        b1 = opened.classes['Bar'].fields.names() == []
+        try:
+            opened.classes['Foo'].fields
+            b2 = False
+        except DiagramError as e:
+            b2 = e.problems == [(f'{path}: class `Foo`.fields[1].name', 'field `x` is already in this class')]
+
+        # A project shard with a field that is not a string
+        folder = 'broken.umlproj'
+        model = Editor()
+        model.classes['Foo'] = Class('Foo')
+        model.classes['Bar'] = Class('Bar')
+        writeProject(model, folder)
+        shard = os.path.join(folder, 'shard-0000.json')
+        with open(shard) as f:
+            data = json.load(f)
+        data['classes'][1]['fields'] = [{'name': 5}]
+        with open(shard, 'w') as f:
+            json.dump(data, f)
+        opened = Editor()
+        openFile(opened, folder)
+        try:
+            opened.classes['Foo'].fields
+            b3 = False
+        except DiagramError as e:
+            b3 = e.problems == [('shard-0000.json: $.classes[1].fields[0].name', 'expected a string')]
+        os.remove(path)
+        shutil.rmtree(folder)
+        assert b1 and b2 and b3, 'A malformed lazy class did not raise a DiagramError'
+
+    def testSaveKeepsLayoutWithoutGUI(self):
+        editor = Editor()
+        ui = CLI()
+        ctrl = EditorController(ui, editor)
+        ctrl.classAdd('Foo')
+        ctrl.classAdd('Bar')
+        ctrl.relationshipAdd('Foo', 'Bar', Type.Composition)
+        editor.moveClass(editor.classes.idOf('Foo'), (120.0, 40.0))
+        b1 = editor.isDirty()
+
+        # Saving from the CLI and through the GUI's memento writes the same file
+        path = 'layout.JSON'
+        with unittest.mock.patch.object(ctrl.ui, 'uiChooseSaveLocation', lambda: path):
+            ctrl.save()
+        ctrl.storage.close()
+        with open(path) as f:
+            saved = f.read()
+        Memento(editor, UI()).save_to_file(path)
+        with open(path) as f:
+            b2 = f.read() == saved
+        b3 = Memento(editor, UI()).get_serialized_state() == json.loads(saved)
+
+        loaded = Editor()
+        ctrl2 = EditorController(ui, loaded)
+        with unittest.mock.patch.object(ctrl2.ui, 'uiChooseLoadLocation', lambda: path):
+            ctrl2.load()
+        ctrl2.storage.close()
+        b4 = loaded.classes['Foo'].position == (120.0, 40.0) and loaded.classes['Bar'].position is None
+        b5 = loaded.getRelationshipType('Foo', 'Bar') == Type.Composition
+        os.remove(path)
+        assert b1 and b2 and b3 and b4 and b5, 'Saving without a GUI lost the layout or a relationship'
+
+    def testLoadReportsEveryProblem(self):
+        editor = Editor()
+        ui = CLI()
+        ctrl = EditorController(ui, editor)
+        ctrl.classAdd('Foo')
+        before = json.dumps(editor, cls=EditorEncoder)
+        path = 'test_invalid.JSON'
+        with open(path, 'w') as f:
+            json.dump({'classes': [
+                {'name': 'Bar', 'fields': [{'name': 'a'}, {'name': 'a'}], 'methods': [{'name': 'run', 'params': [{'name': 1}]}]},
+                {'name': 'Foo', 'fields': [], 'methods': []},
+                {'name': 'Baz', 'methods': [], 'position': {'x': 'left', 'y': 3}},
+                'Qux',
+            ], 'relationships': [
+                {'source': 'Bar', 'destination': 'Nope', 'type': 'Aggregate'},
+                {'source': 'Bar', 'destination': 'Baz', 'type': 'Friendship'},
+                {'source': 'Bar', 'destination': 'Foo', 'type': 'Composition'},
+                {'source': 'Foo', 'destination': 'Bar', 'type': 'Realization'},
+            ]}, f)
+        try:
+            loadFile(editor, path, ('classes', 'relationships'))
+            problems = []
+        except DiagramError as e:
+            problems = e.problems
+        os.remove(path)
+        b1 = [path for path, _ in problems] == [
+            '$.classes[0].fields[1].name', '$.classes[0].methods[0].params[0].name', '$.classes[1].name',
+            '$.classes[2].fields', '$.classes[2].position.x', '$.classes[3]',
+            '$.relationships[1].type', '$.relationships[0].destination', '$.relationships[3]']
+        # Nothing was added, not even the classes that were correct
+        b2 = json.dumps(editor, cls=EditorEncoder) == before
+        assert b1 and b2, 'The load did not report every problem before changing the editor'
+
+    def testHistorySizeIsCheap(self):
+        # A list that cannot be walked, so the size of a command holding it
+        # can only come from its length
+        class Unwalkable(list):
+            def __iter__(self):
+                raise AssertionError('size() walked the payload')
+            def __getitem__(self, index):
+                raise AssertionError('size() walked the payload')
+        editor = Editor()
+        cmd = CommandBulkAdd()
+        cmd.classes = Unwalkable([(f'Class{i}', [f'field{i}'], [('run', ['speed'])]) for i in range(100000)])
+        cmd.relationships = Unwalkable([(f'Class{i}', f'Class{i + 1}', Type.Inheritance) for i in range(99999)])
+        try:
+            editor.pushCmd(cmd)
+            b1 = True
+        except AssertionError:
+            b1 = False
+        b2 = editor.historySize()[1] >= 199999
+        small = CommandMethodAdd('Foo', 'run', ['speed', 'time'])
+        b3 = 0 < small.size() < cmd.size()
+        assert b1 and b2 and b3, 'Estimating the size of a command walked everything it holds'
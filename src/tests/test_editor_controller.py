@@ -1,6 +1,7 @@
 import unittest
 import unittest.mock
 import os
+import json
 from model.editor_model import Editor
 from model.class_model import Class, Field, Method
 from model.relationship_model import Type, Relationship
@@ -37,6 +38,20 @@ class testEditorController(unittest.TestCase):
         b = os.path.exists(path)
         assert not b, 'File was not saved properly'
 
+    def testSaveEmptyInTransaction(self):
+        editor = Editor()
+        ui = CLI()
+        ctrl = EditorController(ui, editor)
+        ui.uiError = unittest.mock.Mock()
+
+        # The CLI still reports a cancelled save while a transaction stands in for it
+        with unittest.mock.patch.object(ui, 'uiChooseSaveLocation', lambda: ''):
+            with ctrl.transaction():
+                ctrl.save()
+                b1 = not ui.uiError.called
+        b2 = ui.uiError.call_args_list == [unittest.mock.call('Could not save to ``')]
+        assert b1 and b2, 'A cancelled save in a transaction was not reported once'
+
     def testSaveGui(self):
         editor = Editor()
         ui = GUI()
@@ -204,3 +219,45 @@ class testEditorController(unittest.TestCase):
         b = ctrl.ui.showHelp()
 
         assert b is None, 'An error occured'
+
+    def testRedrawLeavesModelClean(self):
+        editor = Editor()
+        ui = GUI()
+        ctrl = EditorController(ui, editor)
+        ui.controller = ctrl
+        ctrl.ui.uiFeedback = unittest.mock.Mock()
+        ctrl.ui.uiError = unittest.mock.Mock()
+        ctrl.classAdd('Foo')
+        ctrl.classAdd('Bar')
+        editor.events.flush()
+        editor.markSaved()
+        generation = editor.events.generation
+
+        # Boxes without a position are placed by the view alone
+        ui.redrawCanvas()
+        b1 = editor.events.generation == generation and not editor.isDirty()
+        b2 = editor.classes['Foo'].position is None and editor.classes.idOf('Foo') in ui.box_positions
+        assert b1 and b2, 'Drawing the canvas changed the model'
+
+    def testSaveGuiKeepsLayout(self):
+        editor = Editor()
+        ui = GUI()
+        ctrl = EditorController(ui, editor)
+        ui.controller = ctrl
+        ctrl.ui.uiFeedback = unittest.mock.Mock()
+        ctrl.ui.uiError = unittest.mock.Mock()
+        path = 'test_layout.json'
+        ctrl.classAdd('Foo')
+        ctrl.classAdd('Bar')
+        editor.moveClass(editor.classes.idOf('Bar'), (300, 200))
+
+        # A box that was never dragged is saved where the view drew it
+        with unittest.mock.patch.object(ctrl.ui, 'uiChooseSaveLocation', lambda: path):
+            ctrl.saveGUI()
+        with open(path) as f:
+            saved = {clazz['name']: clazz['position'] for clazz in json.load(f)['classes']}
+        os.remove(path)
+        position = ui.box_positions[editor.classes.idOf('Foo')]["position"]
+        b1 = saved == {'Foo': {'x': position[0], 'y': position[1]}, 'Bar': {'x': 300, 'y': 200}}
+        b2 = not editor.isDirty() and ui.defaultPositions() == {}
+        assert b1 and b2, 'A box that was never dragged was saved without its position'
@@ -0,0 +1,69 @@
+import unittest
+import unittest.mock
+import os
+import json
+import pytest
+from model.editor_model import Editor, EditorEncoder
+from model.relationship_model import Type
+from model.command_model import *
+from controller.editor_controller import EditorController
+from controller.loader import loadFile
+from view.ui_cli import CLI
+
+class testJournal(unittest.TestCase):
+    # Each test runs in a directory of its own, which is removed afterwards
+    @pytest.fixture(autouse=True)
+    def inTmpPath(self, tmp_path, monkeypatch):
+        monkeypatch.chdir(tmp_path)
+
+    def testJournalRecovery(self):
+        editor = Editor()
+        ui = CLI()
+        ctrl = EditorController(ui, editor)
+        ctrl.classAdd('Foo')
+        path = 'journal.JSON'
+        with unittest.mock.patch.object(ctrl.ui, 'uiChooseSaveLocation', lambda: path):
+            ctrl.save()
+        cmd = CommandClassAdd('Bar')
+        if cmd.execute(ctrl):
+            ctrl.pushCmd(cmd)
+
+        # Saving after a small edit leaves the file alone, and every reader
+        # replays the journal after it
+        with unittest.mock.patch.object(ctrl.ui, 'uiChooseSaveLocation', lambda: path):
+            ctrl.save()
+        with open(path) as f:
+            saved = f.read()
+        b1 = 'Bar' not in saved and os.path.exists(path + '.journal') and not editor.isDirty()
+        reader = Editor()
+        loadFile(reader, path)
+        b1 = b1 and list(reader.classes) == ['Foo', 'Bar']
+
+        # Steps after the save are only in the journal until the next one
+        for cmd in [CommandRelationshipAdd('Foo', 'Bar', Type.Inheritance),
+                    CommandMethodAdd('Bar', 'run', ['speed']), CommandFieldAdd('Foo', 'size')]:
+            if cmd.execute(ctrl):
+                ctrl.pushCmd(cmd)
+        ctrl.undo()
+        with open(path) as f:
+            b1 = b1 and f.read() == saved and os.path.exists(path + '.journal')
+
+        # A crash leaves a half written line, which is skipped
+        with open(path + '.journal', 'a') as f:
+            f.write('{"step":"do","comm')
+        recovered = Editor()
+        ctrl2 = EditorController(ui, recovered)
+        with unittest.mock.patch.object(ctrl2.ui, 'uiChooseLoadLocation', lambda: path):
+            ctrl2.load()
+        b2 = json.dumps(recovered, cls=EditorEncoder) == json.dumps(editor, cls=EditorEncoder)
+        b3 = recovered.getRelationshipType('Foo', 'Bar') == Type.Inheritance and 'size' not in recovered.classes['Foo'].fields
+
+        # Past the size limit, saving folds the journal into the file
+        ctrl.storage.journal.limit = 0
+        with unittest.mock.patch.object(ctrl.ui, 'uiChooseSaveLocation', lambda: path):
+            ctrl.save()
+        with open(path) as f:
+            b4 = 'Bar' in f.read() and not os.path.exists(path + '.journal')
+        ctrl.storage.close()
+        ctrl2.storage.close()
+        assert b1 and b2 and b3 and b4, 'Journal did not recover the unsaved steps'
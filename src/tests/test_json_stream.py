@@ -0,0 +1,53 @@
+import unittest
+import io
+import json
+from controller.json_stream import JsonStream, streamArrays, writeArrays
+
+class testJsonStream(unittest.TestCase):
+    def testStreamMatchesJson(self):
+        data = {
+            'version': {'major': 1, 'tags': ['a', 'b]']},
+            'classes': [{'name': 'Foo "x"', 'fields': [{'name': 'f'}], 'size': 12345},
+                        {'name': 'Bar', 'fields': [], 'ratio': -1.5e-3}],
+            'relationships': [{'source': 'Foo "x"', 'destination': 'Bar', 'type': 'Realization'}],
+        }
+        text = json.dumps(data, indent=4)
+        # Small chunks split names, numbers and brackets across reads
+        results = []
+        for chunk_size in (1, 2, 3, 7, 4096):
+            results.append(list(streamArrays(io.StringIO(text), ('classes', 'relationships'), chunk_size)))
+        expected = [('classes', c) for c in data['classes']] + [('relationships', r) for r in data['relationships']]
+        b1 = all(result == expected for result in results)
+        b2 = list(streamArrays(io.StringIO(json.dumps(data)), ('relationships',), 5)) == expected[2:]
+        assert b1 and b2, 'Streamed elements do not match the parsed file'
+
+    def testStreamFoundKeys(self):
+        stream = JsonStream(io.StringIO('{"classes": [], "other": 3}'), 2)
+        b1 = list(stream.items(('classes', 'relationships'))) == []
+        b2 = stream.found == {'classes', 'other'}
+        b3 = list(streamArrays(io.StringIO(' {} '), ('classes',))) == []
+        assert b1 and b2 and b3, 'Stream did not report the keys it found'
+
+    def testStreamMalformed(self):
+        bad = ['', '[]', '{"classes": [1, 2', '{"classes": [1 2]}', '{"classes": []} x', '{classes: []}']
+        errors = 0
+        for text in bad:
+            try:
+                list(streamArrays(io.StringIO(text), ('classes',), 3))
+            except ValueError:
+                errors += 1
+        assert errors == len(bad), 'Malformed files were not rejected'
+
+    def testWriteMatchesJson(self):
+        data = {'classes': [{'name': 'Foo\nBar', 'fields': [], 'methods': [{'name': 'run', 'params': [{'name': 'a'}]}]}, {}],
+                'relationships': []}
+        pretty = io.StringIO()
+        writeArrays(pretty, list(data.items()))
+        compact = io.StringIO()
+        writeArrays(compact, [(key, iter(value)) for key, value in data.items()], None)
+        empty = io.StringIO()
+        writeArrays(empty, [], None)
+        b1 = pretty.getvalue() == json.dumps(data, indent=4)
+        b2 = compact.getvalue() == json.dumps(data, separators=(',', ':'))
+        b3 = empty.getvalue() == '{}'
+        assert b1 and b2 and b3, 'Written file does not match json.dump'
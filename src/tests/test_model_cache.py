@@ -0,0 +1,57 @@
+import unittest
+import unittest.mock
+import os
+import shutil
+import json
+import pytest
+from model.editor_model import Editor, EditorEncoder
+from model.relationship_model import Type
+from controller.editor_controller import EditorController
+from controller.loader import loadFile
+from controller.memento import Memento
+from view.ui_cli import CLI
+
+class testModelCache(unittest.TestCase):
+    # Each test runs in a directory of its own, which is removed afterwards
+    @pytest.fixture(autouse=True)
+    def inTmpPath(self, tmp_path, monkeypatch):
+        monkeypatch.chdir(tmp_path)
+
+    def testLoadCache(self):
+        editor = Editor()
+        ui = CLI()
+        ctrl = EditorController(ui, editor)
+        ctrl.classAdd('Foo')
+        ctrl.classAdd('Bar')
+        ctrl.addMethod('Bar', 'run', ['speed'])
+        ctrl.relationshipAdd('Foo', 'Bar', Type.Realization)
+        editor.moveClass(editor.classes.idOf('Foo'), (10, 20))
+        path = 'test_cache.JSON'
+        Memento(editor, ui).save_to_file(path)
+        folder = 'test_cache'
+        def load():
+            loaded = Editor()
+            loadFile(loaded, path, ('classes', 'relationships'))
+            return json.dumps(loaded, cls=EditorEncoder)
+        with unittest.mock.patch('controller.model_cache.CACHE_DIR', folder), \
+             unittest.mock.patch('controller.model_cache.CACHE_MIN_BYTES', 0):
+            b1 = load() == json.dumps(editor, cls=EditorEncoder) and len(os.listdir(folder)) == 1
+
+            # The file is not read again while it is unchanged
+            with unittest.mock.patch('controller.loader._load', side_effect=AssertionError):
+                b2 = load() == json.dumps(editor, cls=EditorEncoder)
+
+            # A changed file is read again, even with the same size and time
+            stat = os.stat(path)
+            with open(path) as f:
+                text = f.read()
+            with open(path, 'w') as f:
+                f.write(text.replace('"Foo"', '"Baz"'))
+            os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+            b3 = '"Baz"' in load()
+
+            # The cache can be turned off from the environment
+            shutil.rmtree(folder)
+            with unittest.mock.patch.dict(os.environ, {'UML_EDITOR_NO_CACHE': '1'}):
+                b4 = '"Baz"' in load() and not os.path.exists(folder)
+        assert b1 and b2 and b3 and b4, 'The cache was not used while valid, or was used once stale'
@@ -0,0 +1,122 @@
+import unittest
+import unittest.mock
+import os
+import json
+import pytest
+from model.editor_model import Editor, EditorEncoder
+from model.relationship_model import Type
+from controller.editor_controller import EditorController
+from controller.loader import loadFile, openFile
+from view.ui_cli import CLI
+
+class testProject(unittest.TestCase):
+    # Each test runs in a directory of its own, which is removed afterwards
+    @pytest.fixture(autouse=True)
+    def inTmpPath(self, tmp_path, monkeypatch):
+        monkeypatch.chdir(tmp_path)
+
+    def testProject(self):
+        editor = Editor()
+        ui = CLI()
+        ctrl = EditorController(ui, editor)
+        for name in ('A', 'B', 'C', 'D', 'E'):
+            ctrl.classAdd(name)
+        ctrl.addField('C', 'size')
+        ctrl.relationshipAdd('A', 'E', Type.Composition)
+        path = 'test.umlproj'
+        def files():
+            contents = {}
+            for name in os.listdir(path):
+                with open(os.path.join(path, name)) as f:
+                    contents[name] = f.read()
+            return contents
+        def listed():
+            with open(os.path.join(path, 'manifest.json')) as f:
+                manifest = json.load(f)
+            return manifest, sorted([shard['file'] for shard in manifest['shards']] + [manifest['relationships']])
+        with unittest.mock.patch('controller.project.SHARD_CLASSES', 2):
+            with unittest.mock.patch.object(ctrl.ui, 'uiChooseSaveLocation', lambda: path):
+                ctrl.save()
+                before = files()
+                b1 = sorted(before) == ['manifest.json', 'relationships-0000.json', 'shard-0000.json', 'shard-0001.json', 'shard-0002.json']
+
+                # Saving again only writes the shard of the changed class, under
+                # a new name, and deletes the one it replaced
+                ctrl.addField('D', 'weight')
+                ctrl.save()
+                after = files()
+                b2 = (sorted(set(before) - set(after)) == ['shard-0001.json']
+                      and sorted(set(after) - set(before)) == ['shard-0003.json']
+                      and [name for name in before if name in after and before[name] != after[name]] == ['manifest.json'])
+                ctrl.addMethod('A', 'run', [])
+                ctrl.classAdd('F')
+                ctrl.classAdd('G')
+                ctrl.save()
+                manifest, names = listed()
+                b3 = not editor.isDirty() and len(manifest['shards']) == 4 and sorted(files()) == sorted(names + ['manifest.json'])
+
+            # Opening reads a shard when one of its classes is first used
+            opened = Editor()
+            ctrl2 = EditorController(ui, opened)
+            with unittest.mock.patch.object(ctrl2.ui, 'uiChooseLoadLocation', lambda: path):
+                ctrl2.open()
+            b4 = 'size' in opened.classes.get('C').fields
+            b5 = opened.classes.get('C').loaded() and not opened.classes.get('A').loaded() and not opened.classes.get('E').loaded()
+            b6 = json.dumps(opened, cls=EditorEncoder) == json.dumps(editor, cls=EditorEncoder)
+
+            # Loading reads every shard, and deleting a class empties its shard
+            loaded = Editor()
+            ctrl3 = EditorController(ui, loaded)
+            with unittest.mock.patch.object(ctrl3.ui, 'uiChooseLoadLocation', lambda: os.path.join(path, 'manifest.json')):
+                ctrl3.load()
+            b7 = json.dumps(loaded, cls=EditorEncoder) == json.dumps(editor, cls=EditorEncoder)
+            shard = next(shard['file'] for shard in manifest['shards'] if shard['classes'] == ['G'])
+            ctrl.classDelete('G')
+            with unittest.mock.patch.object(ctrl.ui, 'uiChooseSaveLocation', lambda: path):
+                ctrl.save()
+            b8 = shard not in os.listdir(path) and len(listed()[0]['shards']) == 3
+        ctrl.storage.close()
+        ctrl2.storage.close()
+        ctrl3.storage.close()
+        assert b1 and b2 and b3 and b4 and b5 and b6 and b7 and b8, 'The project was not saved shard by shard'
+
+    def testProjectSaveCrash(self):
+        editor = Editor()
+        ui = CLI()
+        ctrl = EditorController(ui, editor)
+        for name in ('A', 'B', 'C'):
+            ctrl.classAdd(name)
+        ctrl.relationshipAdd('A', 'C', Type.Composition)
+        path = 'test_crash.umlproj'
+        with unittest.mock.patch('controller.project.SHARD_CLASSES', 2):
+            ctrl.storage.save(path)
+            saved = json.dumps(editor, cls=EditorEncoder)
+
+            # A crash after the shards and relationships are written, before
+            # the manifest is, leaves the project as it was saved
+            ctrl.addField('A', 'size')
+            ctrl.relationshipDelete('A', 'C')
+            ctrl.classAdd('D')
+            with unittest.mock.patch('controller.project._writeManifest', side_effect=OSError('crash')):
+                try:
+                    ctrl.storage.save(path)
+                    b1 = False
+                except OSError:
+                    b1 = True
+            for read in (loadFile, openFile):
+                model = Editor()
+                read(model, path)
+                b1 = b1 and json.dumps(model, cls=EditorEncoder) == saved
+
+            # Saving again writes everything that changed, and deletes the
+            # files the crash left
+            ctrl.storage.save(path)
+            model = Editor()
+            loadFile(model, path)
+            b2 = json.dumps(model, cls=EditorEncoder) == json.dumps(editor, cls=EditorEncoder)
+            with open(os.path.join(path, 'manifest.json')) as f:
+                manifest = json.load(f)
+            b3 = sorted(os.listdir(path)) == sorted([shard['file'] for shard in manifest['shards']]
+                                                    + [manifest['relationships'], 'manifest.json'])
+        ctrl.storage.close()
+        assert b1 and b2 and b3, 'A save that crashed before writing the manifest broke the project'
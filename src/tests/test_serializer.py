@@ -0,0 +1,145 @@
+import unittest
+import unittest.mock
+import json
+import pytest
+from model.editor_model import Editor, EditorEncoder
+from model.relationship_model import Type
+from model.command_model import CommandClassAdd
+from controller import serializer
+from controller.editor_controller import EditorController
+from controller.loader import loadFile
+from controller.serializer import DiagramTexts, writeDiagram
+from view.ui_cli import CLI
+
+class testSerializer(unittest.TestCase):
+    # Each test runs in a directory of its own, which is removed afterwards
+    @pytest.fixture(autouse=True)
+    def inTmpPath(self, tmp_path, monkeypatch):
+        monkeypatch.chdir(tmp_path)
+
+    def testSaveSkipsUnchanged(self):
+        editor = Editor()
+        ui = CLI()
+        ctrl = EditorController(ui, editor)
+        for name in ('Foo', 'Bar', 'Baz'):
+            ctrl.classAdd(name)
+        ctrl.addField('Foo', 'size')
+        ctrl.relationshipAdd('Foo', 'Bar', Type.Inheritance)
+        path = 'test_skip.JSON'
+        with unittest.mock.patch.object(ctrl.ui, 'uiChooseSaveLocation', lambda: path):
+            ctrl.save()
+            # Saving an unchanged model writes nothing
+            with unittest.mock.patch('controller.backend.writeDiagram', side_effect=AssertionError):
+                ctrl.save()
+                b1 = True
+
+            # Only the changed class is encoded again
+            ctrl.addMethod('Baz', 'run', ['speed'])
+            with unittest.mock.patch('controller.serializer.serializeClass', wraps=serializer.serializeClass) as encode:
+                ctrl.save()
+                b2 = encode.call_count == 1
+            with open(path) as f:
+                b3 = f.read() == json.dumps(editor, cls=EditorEncoder, indent=4)
+
+            # A file changed by something else is written again
+            with open(path, 'w') as f:
+                f.write('{}')
+            ctrl.save()
+            with open(path) as f:
+                b4 = f.read() == json.dumps(editor, cls=EditorEncoder, indent=4)
+        ctrl.storage.close()
+        assert b1 and b2 and b3 and b4, 'Saving wrote an unchanged file, or encoded unchanged classes'
+
+    def testCanonicalSave(self):
+        # The same diagram, built in two different orders
+        def build(order):
+            editor = Editor()
+            ctrl = EditorController(CLI(), editor)
+            ctrl.setCanonical(True)
+            for name in order:
+                ctrl.classAdd(name)
+            fields = ['size', 'age'] if order[0] == 'Foo' else ['age', 'size']
+            for field in fields:
+                ctrl.addField('Foo', field)
+            methods = [('run', ['a', 'b']), ('jump', [])]
+            for method, params in (methods if order[0] == 'Foo' else methods[::-1]):
+                ctrl.addMethod('Bar', method, params)
+            relationships = [('Foo', 'Bar'), ('Baz', 'Foo')]
+            for src, dst in (relationships if order[0] == 'Foo' else relationships[::-1]):
+                ctrl.relationshipAdd(src, dst, Type.Inheritance)
+            editor.moveClass(editor.classes.idOf('Baz'), (50, 20.5) if order[0] == 'Foo' else (50.0, 20.5))
+            return ctrl
+
+        first, second = build(['Foo', 'Bar', 'Baz']), build(['Baz', 'Bar', 'Foo'])
+        paths = []
+        contents = []
+        for name in ('test_canonical.json', 'test_canonical.json.gz'):
+            for i, ctrl in enumerate((first, second)):
+                path = f'{i}_{name}'
+                paths.append(path)
+                with unittest.mock.patch.object(ctrl.ui, 'uiChooseSaveLocation', lambda: path):
+                    ctrl.save()
+                ctrl.storage.close()
+                with open(path, 'rb') as f:
+                    contents.append(f.read())
+        b1 = contents[0] == contents[1]
+        b2 = contents[2] == contents[3]
+
+        # Saving without DiagramTexts gives the same bytes
+        writeDiagram(second.editor, 'test_canonical_plain.json', canonical=True)
+        writeDiagram(first.editor, 'test_canonical_texts.json', texts=DiagramTexts(), canonical=True)
+        with open('test_canonical_plain.json', 'rb') as f:
+            b3 = f.read() == contents[0]
+        with open('test_canonical_texts.json', 'rb') as f:
+            b4 = f.read() == contents[0]
+        data = json.loads(contents[0])
+        b5 = ([clazz['name'] for clazz in data['classes']] == ['Bar', 'Baz', 'Foo']
+              and data['classes'][1]['position'] == {'x': 50, 'y': 20.5})
+
+        # A canonical file loads like any other
+        editor = Editor()
+        loadFile(editor, paths[0])
+        b6 = editor.hasRelationship('Baz', 'Foo') and len(editor.classes['Foo'].fields) == 2
+        assert b1 and b2 and b3 and b4 and b5 and b6, 'Canonical saves of the same diagram differ'
+
+    def testCanonicalRewritesLoadedFile(self):
+        path = 'test_loaded.json'
+        editor = Editor()
+        ctrl = EditorController(CLI(), editor)
+        for name in ('Foo', 'Bar'):
+            ctrl.classAdd(name)
+        writeDiagram(editor, path)
+        ctrl.setCanonical(True)
+        with open(path) as f:
+            plain = f.read()
+
+        # A file loaded while saves are canonical is written in full by the
+        # next save, even with nothing changed
+        loaded = Editor()
+        ctrl2 = EditorController(CLI(), loaded)
+        ctrl2.setCanonical(True)
+        with unittest.mock.patch.object(ctrl2.ui, 'uiChooseLoadLocation', lambda: path):
+            ctrl2.load()
+        with unittest.mock.patch.object(ctrl2.ui, 'uiChooseSaveLocation', lambda: path):
+            ctrl2.save()
+        with open(path) as f:
+            saved = f.read()
+        b1 = saved != plain and [clazz['name'] for clazz in json.loads(saved)['classes']] == ['Bar', 'Foo']
+
+        # and not only synced to its journal after a command
+        ctrl2.storage.close()
+        writeDiagram(editor, path)
+        loaded = Editor()
+        ctrl3 = EditorController(CLI(), loaded)
+        ctrl3.setCanonical(True)
+        with unittest.mock.patch.object(ctrl3.ui, 'uiChooseLoadLocation', lambda: path):
+            ctrl3.load()
+        cmd = CommandClassAdd('Baz')
+        if cmd.execute(ctrl3):
+            ctrl3.pushCmd(cmd)
+        with unittest.mock.patch.object(ctrl3.ui, 'uiChooseSaveLocation', lambda: path):
+            ctrl3.save()
+        with open(path) as f:
+            b2 = [clazz['name'] for clazz in json.load(f)['classes']] == ['Bar', 'Baz', 'Foo']
+        ctrl3.storage.close()
+        assert b1 and b2, 'A loaded file that was not canonical was kept by a canonical save'
@@ -0,0 +1,108 @@
+import unittest
+import unittest.mock
+import os
+import json
+import sqlite3
+import pytest
+from model.editor_model import Editor, EditorEncoder
+from model.relationship_model import Type
+from controller.editor_controller import EditorController
+from controller.loader import loadFile
+from view.ui_cli import CLI
+
+class testSqliteStore(unittest.TestCase):
+    # Each test runs in a directory of its own, which is removed afterwards
+    @pytest.fixture(autouse=True)
+    def inTmpPath(self, tmp_path, monkeypatch):
+        monkeypatch.chdir(tmp_path)
+
+    def testSqliteStore(self):
+        editor = Editor()
+        ui = CLI()
+        ctrl = EditorController(ui, editor)
+        ctrl.classAdd('Foo')
+        ctrl.classAdd('Bar')
+        ctrl.addField('Foo', 'size')
+        ctrl.addMethod('Bar', 'run', ['speed'])
+        ctrl.relationshipAdd('Foo', 'Bar', Type.Aggregate)
+        editor.moveClass(editor.classes.idOf('Foo'), (10, 20))
+        path = 'store.db'
+        with unittest.mock.patch.object(ctrl.ui, 'uiChooseSaveLocation', lambda: path):
+            ctrl.save()
+        db = sqlite3.connect(path)
+        row = db.execute("SELECT id FROM classes WHERE name = 'Bar'").fetchone()
+
+        # Edits go straight to the store, and only touch their own rows
+        ctrl.classAdd('Baz')
+        ctrl.addField('Baz', 'size')
+        ctrl.classRename('Bar', 'Qux')
+        ctrl.relationshipAdd('Baz', 'Qux', Type.Inheritance)
+        editor.moveClass(editor.classes.idOf('Qux'), (5.5, 6))
+        b1 = db.execute("SELECT id, x, y FROM classes WHERE name = 'Qux'").fetchone() == row + (5.5, 6)
+        b2 = ctrl.classesWithField('size') == ['Foo', 'Baz'] and ctrl.classesWithMethod('run') == ['Qux']
+        ctrl.classDelete('Foo')
+        b3 = db.execute('SELECT COUNT(*) FROM relationships').fetchone() == (1,) and ctrl.classesWithField('size') == ['Baz']
+        b4 = not editor.isDirty()
+        db.close()
+
+        # Loading the store gives back the editor, and exports come from it
+        # while the editor stays attached to the store
+        loaded = Editor()
+        ctrl2 = EditorController(ui, loaded)
+        with unittest.mock.patch.object(ctrl2.ui, 'uiChooseLoadLocation', lambda: path):
+            ctrl2.load()
+        b5 = json.dumps(loaded, cls=EditorEncoder) == json.dumps(editor, cls=EditorEncoder)
+        export = 'store.JSON'
+        with unittest.mock.patch.object(ctrl.ui, 'uiChooseSaveLocation', lambda: export):
+            ctrl.save()
+        with open(export) as f:
+            b6 = f.read() == json.dumps(editor, cls=EditorEncoder, indent=4) and ctrl.storage.backend.holds(path)
+        ctrl.storage.close()
+        ctrl2.storage.close()
+        assert b1 and b2 and b3 and b4 and b5 and b6, 'The store did not follow the editor'
+
+    def testStoreWrites(self):
+        # Loading another SQLite database fails and leaves it as it was
+        other = 'other.db'
+        db = sqlite3.connect(other)
+        db.execute('CREATE TABLE notes (text TEXT)')
+        db.commit()
+        db.close()
+        with open(other, 'rb') as f:
+            before = f.read()
+        try:
+            loadFile(Editor(), other)
+            b1 = False
+        except ValueError:
+            b1 = True
+        with open(other, 'rb') as f:
+            b1 = b1 and f.read() == before and not os.path.exists(other + '-wal')
+
+        # A member change only writes the rows of that member
+        editor = Editor()
+        ui = CLI()
+        ctrl = EditorController(ui, editor)
+        ctrl.classAdd('Foo')
+        for field in ('a', 'b', 'c'):
+            ctrl.addField('Foo', field)
+        ctrl.addMethod('Foo', 'run', ['speed'])
+        ctrl.addMethod('Foo', 'stop', [])
+        path = 'writes.db'
+        with unittest.mock.patch.object(ctrl.ui, 'uiChooseSaveLocation', lambda: path):
+            ctrl.save()
+        statements = []
+        ctrl.storage.backend.store.db.set_trace_callback(statements.append)
+        ctrl.deleteField('Foo', 'a')
+        ctrl.renameField('Foo', 'c', 'd')
+        ctrl.renameParameter('Foo', 'run', 'speed', 'pace')
+        member_writes = [sql for sql in statements
+                         if sql.startswith(('INSERT', 'DELETE')) and 'classes' not in sql.split('(')[0]]
+        b2 = len(member_writes) == 4 and not any('stop' in sql or "'b'" in sql for sql in member_writes)
+        ctrl.storage.backend.store.db.set_trace_callback(None)
+
+        loaded = Editor()
+        loadFile(loaded, path)
+        b3 = (loaded.classes['Foo'].fields.names() == ['b', 'd']
+              and loaded.classes['Foo'].methods['run'].params == ['pace'])
+        ctrl.storage.close()
+        assert b1 and b2 and b3, 'Loading wrote to a database, or a member change rewrote its class'
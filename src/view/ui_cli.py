@@ -2,6 +2,7 @@ import prompt_toolkit
 
 from . import ui_interface
 from model.relationship_model import Type
+from model.event_model import Change
 from model.command_model import *
 from .singleton import Singleton
 
@@ -12,6 +13,10 @@ from .singleton import Singleton
 class Completions(prompt_toolkit.completion.Completer):
     def __init__(self):
         self.tab_completions = []
+        # Class names are cached per editor, and dropped when the editor
+        # reports that classes were added, deleted or renamed
+        self.class_editor = None
+        self.class_names = None
 
     def get_tab_completions(self):
         return self.tab_completions
@@ -20,7 +25,22 @@ class Completions(prompt_toolkit.completion.Completer):
         self.tab_completions = lst
     
     def class_completions(self, controller):
-        self.set_tab_completions(controller.editor.getClasses())
+        editor = controller.editor
+        if editor is not self.class_editor:
+            if self.class_editor is not None:
+                self.class_editor.unsubscribe(self.onEditorChanges)
+            editor.subscribe(self.onEditorChanges)
+            self.class_editor = editor
+            self.class_names = None
+        if self.class_names is None:
+            self.class_names = editor.getClasses()
+        self.set_tab_completions(self.class_names)
+
+    def onEditorChanges(self, events):
+        for event in events:
+            if event.kind in (Change.ClassAdded, Change.ClassDeleted, Change.ClassRenamed, Change.Reset):
+                self.class_names = None
+                return
 
     def field_completions(self, controller, class_name):
         if class_name in controller.editor.classes:
@@ -40,10 +60,8 @@ class Completions(prompt_toolkit.completion.Completer):
 
     def param_completions(self, controller, class_name, method_name):
         if class_name in controller.editor.classes:
-            class1 = controller.editor.classes[class_name]
-            if Method(method_name) in class1.methods:
-                idx = class1.methods.index(Method(method_name))
-                method = class1.methods[idx]
+            method = controller.editor.classes[class_name].methods.get(method_name)
+            if method is not None:
                 self.set_tab_completions(method.params)
             else:
                 self.set_tab_completions([])
@@ -70,7 +88,7 @@ class CLI(ui_interface.UI):
         print(f'ERROR: {text}')
 
     def uiChooseSaveLocation(self) -> str:
-        filename = self.uiQuery('Save As (Saves to JSON format): ')
+        filename = self.uiQuery('Save As (Saves to JSON format, or binary for .umlb names; add .gz, .bz2 or .xz to compress): ')
         return filename
 
     def uiChooseLoadLocation(self) -> str:
@@ -81,9 +99,12 @@ class CLI(ui_interface.UI):
         print('Welcome to our Unified Modeling Language (UML) program! Please enter a valid command.')
         
         # This is not an amazing solution, have to repeat changes
-        tab_commands = ['class', 'relationship', 'field', 'method', 'parameter', 'save', 'load', 'undo', 'redo', 'list', 'help', 'exit', 'switch']
+        tab_commands = ['class', 'relationship', 'field', 'method', 'parameter', 'save', 'load', 'open', 'canonical', 'undo', 'redo', 'list', 'help', 'exit', 'switch']
         quit = False
         while not quit:
+            # Changes are written in the background between commands, see
+            # EditorController.autosave
+            self.controller.autosave()
             Completions.instance().set_tab_completions(tab_commands)
 
             command = Completions.instance().tab_input('Enter UML Command: ')
@@ -102,8 +123,16 @@ class CLI(ui_interface.UI):
                     self.parameterCommands(self.controller)
                 case 'save':
                     self.controller.save()
+                case 'save compact':
+                    self.controller.save(compact=True)
+                case 'canonical on':
+                    self.controller.setCanonical(True)
+                case 'canonical off':
+                    self.controller.setCanonical(False)
                 case 'load':
                     self.controller.load()
+                case 'open':
+                    self.controller.open()
                 case 'undo':
                     self.controller.undo()
                 case 'redo':
@@ -111,9 +140,11 @@ class CLI(ui_interface.UI):
                 case 'list':
                     self.listCommands(self.controller)
                 case 'help':
-                    print('These are valid commands: class, relationship, field, method, parameter, save, load, undo, redo, list, switch, exit.')
+                    print('These are valid commands: class, relationship, field, method, parameter, save, load, open, canonical, undo, redo, list, switch, exit.')
                     self.controller.editorHelp()
                 case 'exit':
+                    # An autosave that is still writing is finished first
+                    self.controller.finishAutosave(True)
                     quit = True
                     break
                 case 'switch':
@@ -135,21 +166,21 @@ class CLI(ui_interface.UI):
             case 'add':
                 name = input('  Class Name to Add: ')
                 cmd = CommandClassAdd(name)
-                cmd.execute(controller)
-                controller.editor.pushCmd(cmd)
+                if cmd.execute(controller):
+                    controller.pushCmd(cmd)
             case 'delete':
                 Completions.instance().class_completions(controller)
                 name = Completions.instance().tab_input('  Class to Delete: ')
                 cmd = CommandClassDelete(name)
-                cmd.execute(controller)
-                controller.editor.pushCmd(cmd)
+                if cmd.execute(controller):
+                    controller.pushCmd(cmd)
             case 'rename':
                 Completions.instance().class_completions(controller)
                 name = Completions.instance().tab_input('  Class to change: ')
                 rename = input('    New name: ')
                 cmd = CommandClassRename(name, rename)
-                cmd.execute(controller)
-                controller.editor.pushCmd(cmd)
+                if cmd.execute(controller):
+                    controller.pushCmd(cmd)
             case _:
                 print('Print an error here')
     
@@ -175,15 +206,15 @@ class CLI(ui_interface.UI):
                     self.uiError(f'Cannot determine relationship type from `{text}`')
                     return
                 cmd = CommandRelationshipAdd(class1, class2, typ)
-                cmd.execute(controller)
-                controller.editor.pushCmd(cmd)
+                if cmd.execute(controller):
+                    controller.pushCmd(cmd)
             case 'delete':
                 Completions.instance().class_completions(controller)
                 class1 = Completions.instance().tab_input('  First Class in Relationship to Delete: ')
                 class2 = Completions.instance().tab_input('  Second Class in Relationship to Delete: ')
                 cmd = CommandRelationshipDelete(class1, class2)
-                cmd.execute(controller)
-                controller.editor.pushCmd(cmd)
+                if cmd.execute(controller):
+                    controller.pushCmd(cmd)
             case 'edit':
                 Completions.instance().class_completions(controller)
                 class1 = Completions.instance().tab_input('  First Class in Relationship: ')
@@ -200,8 +231,8 @@ class CLI(ui_interface.UI):
                     self.uiError(f'Cannot determine relationship type from `{text}`')
                     return
                 cmd = CommandRelationshipEdit(class1, class2, typ)
-                cmd.execute(controller)
-                controller.editor.pushCmd(cmd)
+                if cmd.execute(controller):
+                    controller.pushCmd(cmd)
             case _:
                 print('Print an error here')
     
@@ -215,8 +246,8 @@ class CLI(ui_interface.UI):
                 class1 = Completions.instance().tab_input('  Class to Add Field To: ')
                 field1 = input('  Field Name: ')
                 cmd = CommandFieldAdd(class1, field1)
-                cmd.execute(controller)
-                controller.editor.pushCmd(cmd)
+                if cmd.execute(controller):
+                    controller.pushCmd(cmd)
             case 'delete':
                 Completions.instance().class_completions(controller)
                 class1 = Completions.instance().tab_input('  Class to delete field from: ')
@@ -225,8 +256,8 @@ class CLI(ui_interface.UI):
                 field1 = Completions.instance().tab_input('  Field to delete: ')
 
                 cmd = CommandFieldDelete(class1, field1)
-                cmd.execute(controller)
-                controller.editor.pushCmd(cmd)
+                if cmd.execute(controller):
+                    controller.pushCmd(cmd)
             case 'rename':
                 Completions.instance().class_completions(controller)
                 class1 = Completions.instance().tab_input('  Class who\'s field you would like to rename: ')
@@ -236,8 +267,8 @@ class CLI(ui_interface.UI):
                 field2 = input('  Field name you would like to change to: ')
 
                 cmd = CommandFieldRename(class1, field1, field2)
-                cmd.execute(controller)
-                controller.editor.pushCmd(cmd)
+                if cmd.execute(controller):
+                    controller.pushCmd(cmd)
             case _:
                 print('Print an error here')
 
@@ -259,8 +290,8 @@ class CLI(ui_interface.UI):
                         break
                     params.append(param)
                 cmd = CommandMethodAdd(class1, method, params)
-                cmd.execute(controller)
-                controller.editor.pushCmd(cmd)
+                if cmd.execute(controller):
+                    controller.pushCmd(cmd)
             case 'delete':
                 Completions.instance().class_completions(controller)
                 class1 = Completions.instance().tab_input('  Class to delete method from: ')
@@ -269,8 +300,8 @@ class CLI(ui_interface.UI):
                 method = Completions.instance().tab_input('  Method to delete: ')
 
                 cmd = CommandMethodDelete(class1, method)
-                cmd.execute(controller)
-                controller.editor.pushCmd(cmd)
+                if cmd.execute(controller):
+                    controller.pushCmd(cmd)
             case 'rename':
                 Completions.instance().class_completions(controller)
                 class1 = Completions.instance().tab_input('  Class who\'s method you would like to rename: ')
@@ -279,8 +310,8 @@ class CLI(ui_interface.UI):
                 method1 = Completions.instance().tab_input('  Method you would like to rename: ')
                 method2 = input('  Method name you would like to change to: ')
                 cmd = CommandMethodRename(class1, method1, method2)
-                cmd.execute(controller)
-                controller.editor.pushCmd(cmd)
+                if cmd.execute(controller):
+                    controller.pushCmd(cmd)
             case _:
                 print('Print an error here')
 
@@ -300,8 +331,8 @@ class CLI(ui_interface.UI):
                 param = Completions.instance().tab_input('  Parameter to remove: ')
 
                 cmd = CommandParameterRemove(class1, method, param)
-                cmd.execute(controller)
-                controller.editor.pushCmd(cmd)
+                if cmd.execute(controller):
+                    controller.pushCmd(cmd)
             case 'clear':
                 Completions.instance().class_completions(controller)
                 class1 = Completions.instance().tab_input('  Class with the desired Method: ')
@@ -310,8 +341,8 @@ class CLI(ui_interface.UI):
                 method = Completions.instance().tab_input('  Method to clear parameters from: ')
 
                 cmd = CommandParameterClear(class1, method)
-                cmd.execute(controller)
-                controller.editor.pushCmd(cmd)
+                if cmd.execute(controller):
+                    controller.pushCmd(cmd)
             case 'rename':
                 Completions.instance().class_completions(controller)
                 class1 = Completions.instance().tab_input('  Class with the desired Method: ')
@@ -324,8 +355,8 @@ class CLI(ui_interface.UI):
 
                 param2 = input('  New parameter name: ')
                 cmd = CommandParameterRename(class1, method, param1, param2)
-                cmd.execute(controller)
-                controller.editor.pushCmd(cmd)
+                if cmd.execute(controller):
+                    controller.pushCmd(cmd)
             case 'change':
                 Completions.instance().class_completions(controller)
                 class1 = Completions.instance().tab_input('  Class with the desired Method: ')
@@ -341,13 +372,13 @@ class CLI(ui_interface.UI):
                         break
                     params.append(param)
                 cmd = CommandParameterChange(class1, method, params)
-                cmd.execute(controller)
-                controller.editor.pushCmd(cmd)
+                if cmd.execute(controller):
+                    controller.pushCmd(cmd)
             case _:
                 print('Print an error here')
     
     def listCommands(self, controller):
-        Completions.instance().set_tab_completions(['classes', 'class', 'relationships'])
+        Completions.instance().set_tab_completions(['classes', 'class', 'relationships', 'field', 'method'])
 
         command = Completions.instance().tab_input('  Enter List Command: ')
         match command:
@@ -361,6 +392,21 @@ class CLI(ui_interface.UI):
                 Completions.instance().class_completions(controller)
                 name = Completions.instance().tab_input("     Class to check relationships: ")
                 controller.listRelationships(name)
+            case 'field':
+                name = input('  Field name to find: ')
+                self.listClassesWith('field', name, controller.classesWithField(name))
+            case 'method':
+                name = input('  Method name to find: ')
+                self.listClassesWith('method', name, controller.classesWithMethod(name))
+
+    # Prints the classes found by `list field` or `list method`
+    def listClassesWith(self, kind, name, classes):
+        if classes:
+            print(f'Classes with a {kind} named {name}:')
+            for class_name in classes:
+                print(f'  {class_name}')
+        else:
+            print(f'No class has a {kind} named {name}')
 
     # Function that lists options and explanations for the basic commands
     # Must be implemented per UI interface
@@ -376,6 +422,7 @@ class CLI(ui_interface.UI):
                     'parameter help',
                     'save help',
                     'load help',
+                    'open help',
                     'undo help',
                     'redo help',
                     'list help',
@@ -420,9 +467,29 @@ class CLI(ui_interface.UI):
                     print()
                 case 'save help':
                     print('Saves to a JSON format')
+                    print('     save compact: Saves without indentation, for smaller files')
+                    print('     canonical on: Later JSON saves sort classes, members and relationships by name, so the')
+                    print('     same diagram always gives the same file, whatever order it was built in. canonical off undoes it')
+                    print('     Names ending in .umlb are saved in a compact binary format')
+                    print('     Adding .gz, .bz2 or .xz to a name compresses the file, as in diagram.json.gz')
+                    print('     Names ending in .db, .sqlite or .sqlite3 are SQLite databases. The diagram stays')
+                    print('     attached to the database, and every change is written to it right away')
+                    print('     Names ending in .umlproj are project folders, with a manifest and one file per group')
+                    print('     of classes. Saving the project again only rewrites the groups that changed')
+                    print('     Changes are kept in a journal next to the saved file, so saving again is quick')
+                    print('     and loading the file recovers changes that were not saved before a crash')
+                    print('     The last file saved, loaded or opened is also saved again in the background while it has unsaved changes')
                     print()
                 case 'load help':
-                    print('Loads from a JSON format')
+                    print('Loads from a JSON format, or from the binary format')
+                    print('     Compressed files (gzip, bz2 or xz) are recognized and read as they are')
+                    print('     Loading a SQLite database into an empty diagram attaches the diagram to it')
+                    print('     A project is loaded from its folder or its manifest.json')
+                    print()
+                case 'open help':
+                    print('Opens a binary (.umlb) file, reading each class only when it is first used')
+                    print('     A project reads each group of classes only when one of them is first used')
+                    print('     Replaces the current diagram. Other files are loaded in full')
                     print()
                 case 'undo help':
                     print('Reverts the latest change in the workspace')
@@ -435,6 +502,8 @@ class CLI(ui_interface.UI):
                     print('     classes: Lists all classes and their contents')
                     print('     class: Lists a specific class and its contents')
                     print('     relationships: Lists all relationships a class has with others')
+                    print('     field: Lists the classes that have a field with a given name')
+                    print('     method: Lists the classes that have a method with a given name')
                     print()
                 case 'exit':
                     quit = True
@@ -2,11 +2,20 @@ from . import ui_interface
 import tkinter as tk
 from tkinter import messagebox, simpledialog, filedialog
 from model.relationship_model import Type
+from model.event_model import Change
 from model.class_model import Field, Method
 from model.command_model import *
 import json
 import math
 
+# Milliseconds between checks for an autosave
+AUTOSAVE_POLL_MS = 1000
+
+# Choices in the save and load dialogs
+DIAGRAM_FILETYPES = [("JSON files", "*.JSON"), ("Binary diagrams", "*.umlb"),
+                     ("Compressed diagrams", "*.gz *.bz2 *.xz"), ("SQLite databases", "*.db *.sqlite *.sqlite3"),
+                     ("Project manifests", "manifest.json")]
+
 class GUI(ui_interface.UI):
     def __init__(self):
         self.silent_mode = False
@@ -25,13 +34,17 @@ class GUI(ui_interface.UI):
         self.create_toolbar()
 
         # Track positions for placing boxes on the canvas
+        # Boxes and relationship lines are keyed by class id, so renaming a class
+        # does not move any entries
         self.box_positions = {}
         self.next_x, self.next_y = 50, 50  # Initial position for the first box
 
         # Variable to track the selected item for dragging
         self.selected_item = None
+        self.selected_class = None
         self.offset_x = 0
         self.offset_y = 0
+        self.drag_start = None
 
         self.relationship_lines = {}
 
@@ -44,15 +57,15 @@ class GUI(ui_interface.UI):
                 class_name = self.uiQuery("Class Name to Add:")
                 if class_name:
                     cmd = CommandClassAdd(class_name)
-                    cmd.execute(self.controller)
-                    self.controller.pushCmd(cmd)
+                    if cmd.execute(self.controller):
+                        self.controller.pushCmd(cmd)
 
             case 'delete':
                 class_name = self.uiClassQuery("Class to Delete:")
                 if class_name:
                     cmd = CommandClassDelete(class_name)
-                    cmd.execute(self.controller)
-                    self.controller.pushCmd(cmd)
+                    if cmd.execute(self.controller):
+                        self.controller.pushCmd(cmd)
 
             case 'rename':
                 old_name = self.uiClassQuery("Class to change:")
@@ -60,8 +73,8 @@ class GUI(ui_interface.UI):
                     new_name = self.uiQuery("New name:")
                     if new_name:
                         cmd = CommandClassRename(old_name, new_name)
-                        cmd.execute(self.controller)
-                        self.controller.pushCmd(cmd)
+                        if cmd.execute(self.controller):
+                            self.controller.pushCmd(cmd)
 
             case _:
                 self.uiError("Invalid action.")
@@ -75,8 +88,8 @@ class GUI(ui_interface.UI):
                     field_name = self.uiQuery("Field name:")
                     if field_name:
                         cmd = CommandFieldAdd(class_name, field_name)
-                        cmd.execute(self.controller)
-                        self.controller.pushCmd(cmd)
+                        if cmd.execute(self.controller):
+                            self.controller.pushCmd(cmd)
 
             case 'delete':
                 class_name = self.uiClassQuery("Class to delete field from:")
@@ -84,8 +97,8 @@ class GUI(ui_interface.UI):
                     field_name = self.uiQuery("Field to delete:")
                     if field_name:
                         cmd = CommandFieldDelete(class_name, field_name)
-                        cmd.execute(self.controller)
-                        self.controller.pushCmd(cmd)
+                        if cmd.execute(self.controller):
+                            self.controller.pushCmd(cmd)
 
             case 'rename':
                 class_name = self.uiClassQuery("Class with field to rename:")
@@ -95,8 +108,8 @@ class GUI(ui_interface.UI):
                         new_field_name = self.uiQuery("Field name you would like to change to:")
                         if new_field_name:
                             cmd = CommandFieldRename(class_name, old_field_name, new_field_name)
-                            cmd.execute(self.controller)
-                            self.controller.pushCmd(cmd)
+                            if cmd.execute(self.controller):
+                                self.controller.pushCmd(cmd)
 
             case _:
                 self.uiError("Invalid action.")
@@ -114,8 +127,8 @@ class GUI(ui_interface.UI):
                         # definitely enter in anyway
                         param_list = list(map(lambda s: s.strip(), params.split(","))) if params else []
                         cmd = CommandMethodAdd(class_name, method_name, param_list)
-                        cmd.execute(self.controller)
-                        self.controller.pushCmd(cmd)
+                        if cmd.execute(self.controller):
+                            self.controller.pushCmd(cmd)
 
             case 'delete':
                 class_name = self.uiClassQuery("Class to Delete method from:")
@@ -123,8 +136,8 @@ class GUI(ui_interface.UI):
                     method_name = self.uiQuery("Method to delete:")
                     if method_name:
                         cmd = CommandMethodDelete(class_name, method_name)
-                        cmd.execute(self.controller)
-                        self.controller.pushCmd(cmd)
+                        if cmd.execute(self.controller):
+                            self.controller.pushCmd(cmd)
 
             case 'rename':
                 class_name = self.uiClassQuery("Class with method to rename:")
@@ -134,8 +147,8 @@ class GUI(ui_interface.UI):
                         new_method_name = self.uiQuery("Method name you would like to change to:")
                         if new_method_name:
                             cmd = CommandMethodRename(class_name, old_method_name, new_method_name)
-                            cmd.execute(self.controller)
-                            self.controller.pushCmd(cmd)
+                            if cmd.execute(self.controller):
+                                self.controller.pushCmd(cmd)
 
             case _:
                 self.uiError("Invalid action.")         
@@ -150,16 +163,16 @@ class GUI(ui_interface.UI):
                     param_name = self.uiQuery("Parameter to remove:")
                     if param_name:
                         cmd = CommandParameterRemove(class_name, method_name, param_name)
-                        cmd.execute(self.controller)
-                        self.controller.pushCmd(cmd)
+                        if cmd.execute(self.controller):
+                            self.controller.pushCmd(cmd)
 
             case 'clear':
                 class_name = self.uiClassQuery("Class with the desired method:")
                 method_name = self.uiQuery("Method to clear parameters from:")
                 if class_name and method_name:
                     cmd = CommandParameterClear(class_name, method_name)
-                    cmd.execute(self.controller)
-                    self.controller.pushCmd(cmd)
+                    if cmd.execute(self.controller):
+                        self.controller.pushCmd(cmd)
 
             case 'rename':
                 class_name = self.uiClassQuery("Class with the desired method:")
@@ -169,8 +182,8 @@ class GUI(ui_interface.UI):
                     new_param_name = self.uiQuery("New parameter name:")
                     if old_param_name and new_param_name:
                         cmd = CommandParameterRename(class_name, method_name, old_param_name, new_param_name)
-                        cmd.execute(self.controller)
-                        self.controller.pushCmd(cmd)
+                        if cmd.execute(self.controller):
+                            self.controller.pushCmd(cmd)
 
             case 'change':
                 class_name = self.uiClassQuery("Class with the desired method:")
@@ -178,8 +191,8 @@ class GUI(ui_interface.UI):
                 if class_name and method_name:
                     param_list = self.uiQuery("Input a list of parameters in order (comma-separated):").split(",")
                     cmd = CommandParameterChange(class_name, method_name, [param.strip() for param in param_list])
-                    cmd.execute(self.controller)
-                    self.controller.pushCmd(cmd)
+                    if cmd.execute(self.controller):
+                        self.controller.pushCmd(cmd)
 
             case _:
                 self.uiError("Invalid action.")        
@@ -199,8 +212,8 @@ class GUI(ui_interface.UI):
                     relationship_type_enum = Type.make(relationship_type)
                     if relationship_type_enum:
                         cmd = CommandRelationshipAdd(class1, class2, relationship_type_enum)
-                        cmd.execute(self.controller)
-                        self.controller.pushCmd(cmd)
+                        if cmd.execute(self.controller):
+                            self.controller.pushCmd(cmd)
                     else:
                         self.uiError(f'Invalid relationship type: {relationship_type}')
             case 'delete':
@@ -208,8 +221,8 @@ class GUI(ui_interface.UI):
                 class2 = self.uiClassQuery("Second Class in Relationship: ")
                 if class1 and class2:
                     cmd = CommandRelationshipDelete(class1, class2)
-                    cmd.execute(self.controller)
-                    self.controller.pushCmd(cmd)
+                    if cmd.execute(self.controller):
+                        self.controller.pushCmd(cmd)
             case 'edit':
                 class1 = self.uiClassQuery("First Class in Relationship: ")
                 class2 = self.uiClassQuery("Second Class in Relationship: ")
@@ -222,8 +235,8 @@ class GUI(ui_interface.UI):
                     relationship_type_enum = Type.make(relationship_type)
                     if relationship_type_enum:
                         cmd = CommandRelationshipEdit(class1, class2, relationship_type_enum)
-                        cmd.execute(self.controller)
-                        self.controller.pushCmd(cmd)
+                        if cmd.execute(self.controller):
+                            self.controller.pushCmd(cmd)
                     else:
                         self.uiError(f'Invalid relationship type: {relationship_type}')
             case _:
@@ -298,130 +311,183 @@ class GUI(ui_interface.UI):
 
         button_export = tk.Button(self.toolbar, name="export image", text="Export Image", command=lambda: self.controller.export_image())
         button_export.pack(side=tk.LEFT, padx=2, pady=2)
+
+        # Direct references to the widgets that get grayed out, and their last state
+        self.access_widgets = {
+            "fields": field_menu,
+            "methods": method_menu,
+            "parameters": param_menu,
+            "relationships": relationship_menu,
+            "undo": button_undo,
+            "redo": button_redo,
+        }
+        self.access_states = {}
     
+    # Boxes of classes that were never dragged are at the spot addClassBox
+    # picked, which only the view knows
+    def defaultPositions(self) -> dict:
+        classes = self.controller.editor.classes
+        return {class_id: entry["position"] for class_id, entry in self.box_positions.items()
+                if classes.byId(class_id) is not None and classes.byId(class_id).position is None}
+
+    # Runs after every command, so it only reads the editor's O(1) state checks
+    # and reconfigures a widget only when its state actually changes
     def updateAccess(self):
-        if self.controller.editor.canAddField():
-            b = self.toolbar.nametowidget("fields")
-            b.config(state=tk.NORMAL)
-        else:
-            b = self.toolbar.nametowidget("fields")
-            b.config(state=tk.DISABLED)
-
-        if self.controller.editor.canAddMethod():
-            b = self.toolbar.nametowidget("methods")
-            b.config(state=tk.NORMAL)
-        else:
-            b = self.toolbar.nametowidget("methods")
-            b.config(state=tk.DISABLED)
-
-        if self.controller.editor.canDoParams():
-            b = self.toolbar.nametowidget("parameters")
-            b.config(state=tk.NORMAL)
-        else:
-            b = self.toolbar.nametowidget("parameters")
-            b.config(state=tk.DISABLED)
-
-        if self.controller.editor.canAddRelationship():
-            b = self.toolbar.nametowidget("relationships")
-            b.config(state=tk.NORMAL)
-        else:
-            b = self.toolbar.nametowidget("relationships")
-            b.config(state=tk.DISABLED)
+        editor = self.controller.editor
+        self.setAccess("fields", editor.canAddField())
+        self.setAccess("methods", editor.canAddMethod())
+        self.setAccess("parameters", editor.canDoParams())
+        self.setAccess("relationships", editor.canAddRelationship())
+        self.setAccess("undo", editor.canUndo())
+        self.setAccess("redo", editor.canRedo())
 
-        if self.controller.editor.canUndo():
-            b = self.toolbar.nametowidget("undo")
-            b.config(state=tk.NORMAL)
-        else:
-            b = self.toolbar.nametowidget("undo")
-            b.config(state=tk.DISABLED)
-
-        if self.controller.editor.canRedo():
-            b = self.toolbar.nametowidget("redo")
-            b.config(state=tk.NORMAL)
-        else:
-            b = self.toolbar.nametowidget("redo")
-            b.config(state=tk.DISABLED)
+    def setAccess(self, name, enabled):
+        state = tk.NORMAL if enabled else tk.DISABLED
+        if self.access_states.get(name) != state:
+            self.access_widgets[name].config(state=state)
+            self.access_states[name] = state
 
 
 # -------------- CLASS VISUALS START ---------------------------------------------------------------------------------------
 
-    # Creates a new box for a class. Leaves space for fields
-    def addClassBox(self, class_name, fields=None, methods=None):
-        if fields is None:
-            fields = []
-
-        if methods is None:
-            methods = []
+    # Looks up the id the editor gave to a class, None if there is no such class
+    def classId(self, class_name):
+        return self.controller.editor.classes.idOf(class_name)
+
+    # The canvas is drawn from the editor's change events, so every command,
+    # undo, redo and load updates it the same way. Events are delivered once
+    # Tk is idle, so a batch of changes is redrawn once
+    def attachEditor(self, editor):
+        editor.events.scheduler = self.root.after_idle
+        editor.subscribe(self.onEditorChanges)
+
+    def onEditorChanges(self, events):
+        # Events before a Reset were already dropped, so redraw everything
+        if events[0].kind == Change.Reset:
+            self.redrawCanvas()
+            return
+
+        classes = self.controller.editor.classes
+        added = set()
+        resized = {}
+        for event in events:
+            match event.kind:
+                case Change.ClassAdded:
+                    # The class may already be gone again by the time we hear about it
+                    if classes.byId(event.class_id) is not None and event.class_id not in self.box_positions:
+                        self.addClassBox(event.class_id)
+                        added.add(event.class_id)
+                case Change.ClassDeleted:
+                    self.deleteClassBox(event.class_id)
+                case Change.ClassRenamed:
+                    self.renameClassBox(event.class_id)
+                case Change.MembersChanged:
+                    # A box added in this batch already shows the current members
+                    if event.class_id not in added:
+                        self.updateAttributesBox(event.class_id)
+                        resized[event.class_id] = None
+                case Change.RelationshipAdded | Change.RelationshipChanged:
+                    self.deleteRelationshipLine(event.class_id, event.other_id)
+                    self.drawRelationshipLine(event.class_id, event.other_id)
+                case Change.RelationshipDeleted:
+                    self.deleteRelationshipLine(event.class_id, event.other_id)
+                case Change.ClassMoved:
+                    # Boxes dragged on the canvas are already where the class is
+                    clazz = classes.byId(event.class_id)
+                    if (clazz is not None and clazz.position is not None and event.class_id in self.box_positions
+                            and self.box_positions[event.class_id]["position"] != clazz.position):
+                        self.updateBoxPosition(clazz.name, *clazz.position)
+                        self.updateRelationshipLines(event.class_id)
+
+        # Boxes that changed size need their lines moved, once each
+        for class_id in resized:
+            self.updateRelationshipLines(class_id)
+
+    # Clears the canvas and draws every class and relationship of the editor
+    def redrawCanvas(self):
+        editor = self.controller.editor
+        self.canvas.delete("all")
+        self.box_positions.clear()
+        self.relationship_lines.clear()
+        self.next_x, self.next_y = 50, 50
+        for clazz in editor.classes.values():
+            self.addClassBox(clazz.id)
+        for (src, dst) in editor.relationships.idKeys():
+            self.drawRelationshipLine(src, dst)
+
+    # Creates a new box for a class, showing its current fields and methods
+    # A class that has a position (set when loading a file or moving its box)
+    # is drawn there, otherwise the box goes in the next free spot. That spot
+    # is only kept by the view: drawing never changes the model, so redrawing
+    # after a load leaves nothing to save. Dragging the box moves the class
+    def addClassBox(self, class_id):
+        clazz = self.controller.editor.classes.byId(class_id)
+        fields = clazz.fields
+        methods = clazz.methods
 
         # Calculate box dimensions
         box_width = 150
         # Height adjusts based on the number of attributes, each attribute taking 20 pixels of height
         box_height = 50 + (len(fields) + len(methods)) * 20
 
+        if clazz.position is not None:
+            x, y = clazz.position
+        else:
+            x, y = self.next_x, self.next_y
+            # Store the position for the next box
+            self.next_x += box_width + 20
+            if self.next_x > self.canvas.winfo_width() - box_width:
+                self.next_x = 50
+                self.next_y += box_height + 20
+
         # Draw the rectangle (box) for the class and its attributes
-        box = self.canvas.create_rectangle(self.next_x, self.next_y,
-                                        self.next_x + box_width, self.next_y + box_height,
-                                        fill="lightblue")
+        box = self.canvas.create_rectangle(x, y, x + box_width, y + box_height, fill="lightblue")
 
         # Draw the class name at the top of the box
-        text_class = self.canvas.create_text(self.next_x + box_width / 2, self.next_y + 25,
-                                            text=class_name, font=('Helvetica', 10, 'bold'))
+        text_class = self.canvas.create_text(x + box_width / 2, y + 25,
+                                            text=clazz.name, font=('Helvetica', 10, 'bold'))
+        self.bindBoxItem(text_class, box, class_id)
+
+        text_fields, text_methods = self.drawMembers(box, fields, methods)
+
+        # Store as a dictionary entry with "box" and "position"
+        self.box_positions[class_id] = {
+            "box": (box, text_class, text_fields, text_methods),
+            "position": (x, y)
+        }
+        self.bindBoxItem(box, box, class_id)
+        for text in text_fields + text_methods:
+            self.bindBoxItem(text, box, class_id)
+
+    # Draws the field and method texts of a class below its name
+    def drawMembers(self, box, fields, methods):
+        box_coords = self.canvas.coords(box)
+        center_x = (box_coords[0] + box_coords[2]) / 2
 
-        # Draw the fields below the class name
         text_fields = []
         for i, field in enumerate(fields):
-            text_y = self.next_y + 50 + i * 20  # Starting below the class name
-            field_text = self.canvas.create_text(self.next_x + box_width / 2, text_y, text=f"Field: {field.name}")
-            text_fields.append(field_text)
+            text_y = box_coords[1] + 50 + i * 20  # Starting below the class name
+            text_fields.append(self.canvas.create_text(center_x, text_y, text=f"Field: {field.name}"))
 
         # Draw the methods and parameters below the fields
         text_methods = []
         for i, method in enumerate(methods):
             method_params = ', '.join(method.params)
-            text_y = self.next_y + 50 + (len(fields) + i) * 20  # Starting below the fields
-            method_text = self.canvas.create_text(self.next_x + box_width / 2, text_y,
-                                                text=f"Method: {method.name}({method_params})")
-            text_methods.append(method_text)
-
-        # Store as a dictionary entry with "box" and "position"
-        self.box_positions[class_name] = {
-            "box": (box, text_class, text_fields, text_methods),
-            "position": (self.next_x, self.next_y)
-        }
-
-        # Bind mouse events for dragging (move box and all texts together)
-        self.canvas.tag_bind(box, '<Button-1>', lambda event, item=box: self.on_box_click(event, item))
-        self.canvas.tag_bind(text_class, '<Button-1>', lambda event, item=box: self.on_box_click(event, item))  # Link text to the box
-        for text_field in text_fields:
-            self.canvas.tag_bind(text_field, '<Button-1>', lambda event, item=box: self.on_box_click(event, item))  # Link fields to the box
-        for text_method in text_methods:
-            self.canvas.tag_bind(text_method, '<Button-1>', lambda event, item=box: self.on_box_click(event, item))  # Link methods to the box
-
-        # Drag event to move box and all related texts
-        self.canvas.tag_bind(box, '<B1-Motion>', lambda event, name=class_name: self.on_box_drag(event, name))
-        self.canvas.tag_bind(text_class, '<B1-Motion>', lambda event, name=class_name: self.on_box_drag(event, name))
-        for text_field in text_fields:
-            self.canvas.tag_bind(text_field, '<B1-Motion>', lambda event, name=class_name: self.on_box_drag(event, name))
-        for text_method in text_methods:
-            self.canvas.tag_bind(text_method, '<B1-Motion>', lambda event, name=class_name: self.on_box_drag(event, name))
-
-        # Release event (for all elements)
-        self.canvas.tag_bind(box, '<ButtonRelease-1>', self.on_box_release)
-        self.canvas.tag_bind(text_class, '<ButtonRelease-1>', self.on_box_release)
-        for text_field in text_fields:
-            self.canvas.tag_bind(text_field, '<ButtonRelease-1>', self.on_box_release)
-        for text_method in text_methods:
-            self.canvas.tag_bind(text_method, '<ButtonRelease-1>', self.on_box_release)
-
-        # Store the position for the next box
-        self.next_x += box_width + 20
-        if self.next_x > self.canvas.winfo_width() - box_width:
-            self.next_x = 50
-            self.next_y += box_height + 20
-
-    def deleteClassBox(self, class_name):
-        if class_name in self.box_positions:
-            box, text_class, text_fields, text_methods = self.box_positions[class_name]["box"]
+            text_y = box_coords[1] + 50 + (len(fields) + i) * 20  # Starting below the fields
+            text_methods.append(self.canvas.create_text(center_x, text_y,
+                                                        text=f"Method: {method.name}({method_params})"))
+        return text_fields, text_methods
+
+    # Bind mouse events for dragging, so the box and all its texts move together
+    # The bindings hold the class id, so they stay valid when the class is renamed
+    def bindBoxItem(self, item, box, class_id):
+        self.canvas.tag_bind(item, '<Button-1>', lambda event, item=box, cid=class_id: self.on_box_click(event, item, cid))
+        self.canvas.tag_bind(item, '<B1-Motion>', lambda event, cid=class_id: self.on_box_drag(event, cid))
+        self.canvas.tag_bind(item, '<ButtonRelease-1>', self.on_box_release)
+
+    def deleteClassBox(self, class_id):
+        if class_id in self.box_positions:
+            box, text_class, text_fields, text_methods = self.box_positions[class_id]["box"]
 
             # Delete the class box and all associated texts (class name + fields + methods)
             self.canvas.delete(box)  # Delete the box itself
@@ -431,69 +497,28 @@ class GUI(ui_interface.UI):
             for text_method in text_methods:  # Delete all the fields text
                 self.canvas.delete(text_method)
 
-            # Collect relationships to delete
-            to_delete = [
-                (class1, class2) for (class1, class2) in self.relationship_lines.keys()
-                if class1 == class_name or class2 == class_name
-            ]
-
-            # Safely delete relationships
-            for (class1, class2) in to_delete:
-                self.deleteRelationshipLine(class1, class2)
-                self.relationship_lines.pop((class1, class2), None)
+            # Relationship lines touching this class get their own events
 
             # Remove the class from the dictionary
-            del self.box_positions[class_name]
-            self.uiFeedback(f'Class "{class_name}" deleted.')
-        else:
-            self.uiError(f'Class "{class_name}" does not exist.')
+            del self.box_positions[class_id]
 
-    # Used in controller's renameClass to change class name
-    def renameClassBox(self, name, rename):
-        if name in self.box_positions:
-            box, text_class, text_attributes, text_methods = self.box_positions[name]["box"]
+    # Boxes are keyed by class id, so only the name text changes
+    def renameClassBox(self, class_id):
+        clazz = self.controller.editor.classes.byId(class_id)
+        if clazz is not None and class_id in self.box_positions:
+            box, text_class, text_attributes, text_methods = self.box_positions[class_id]["box"]
             
             # Update the class name text
-            self.canvas.itemconfig(text_class, text=rename)
-
-            # Update the dictionary with the new name, preserving both "box" and "position"
-            self.box_positions[rename] = {
-                "box": (box, text_class, text_attributes, text_methods),
-                "position": self.box_positions[name]["position"]
-            }
-            del self.box_positions[name]  # Remove the old entry
-            
-            # Reapply the event bindings to the new name
-            self.canvas.tag_bind(box, '<Button-1>', lambda event, item=box: self.on_box_click(event, item))
-            self.canvas.tag_bind(text_class, '<Button-1>', lambda event, item=box: self.on_box_click(event, item))
-            for text_attr in text_attributes:
-                self.canvas.tag_bind(text_attr, '<Button-1>', lambda event, item=box: self.on_box_click(event, item))
-            
-            self.canvas.tag_bind(box, '<B1-Motion>', lambda event, class_name=rename: self.on_box_drag(event, class_name))
-            self.canvas.tag_bind(text_class, '<B1-Motion>', lambda event, class_name=rename: self.on_box_drag(event, class_name))
-            for text_attr in text_attributes:
-                self.canvas.tag_bind(text_attr, '<B1-Motion>', lambda event, class_name=rename: self.on_box_drag(event, class_name))
-
-            self.canvas.tag_bind(box, '<ButtonRelease-1>', self.on_box_release)
-            self.canvas.tag_bind(text_class, '<ButtonRelease-1>', self.on_box_release)
-            for text_attr in text_attributes:
-                self.canvas.tag_bind(text_attr, '<ButtonRelease-1>', self.on_box_release)
-
-            self.uiFeedback(f'Class "{name}" renamed to "{rename}".')
-        else:
-            self.uiError(f'Class "{name}" does not exist.')
+            self.canvas.itemconfig(text_class, text=clazz.name)
 
     # -------------------- ATTRIBUTE VISUALS START ---------------------------------------------------------------------------
 
     # Redraw the class box and attributes in the canvas after changes.
-    def updateAttributesBox(self, class_name):
-        if class_name in self.box_positions:
+    def updateAttributesBox(self, class_id):
+        clazz = self.controller.editor.classes.byId(class_id)
+        if clazz is not None and class_id in self.box_positions:
             # Get the current class data (including fields and methods)
-            box, text_class, text_fields, text_methods = self.box_positions[class_name]["box"]
-
-            # Get the current fields and methods from the editor model
-            fields = self.controller.editor.classes[class_name].fields
-            methods = self.controller.editor.classes[class_name].methods
+            box, text_class, text_fields, text_methods = self.box_positions[class_id]["box"]
 
             # Clear the old fields and methods text from the canvas
             for text_field in text_fields:
@@ -502,48 +527,28 @@ class GUI(ui_interface.UI):
                 self.canvas.delete(text_method)
 
             # Calculate new height based on the number of fields and methods
-            box_height = 50 + (len(fields) + len(methods)) * 20
+            box_height = 50 + (len(clazz.fields) + len(clazz.methods)) * 20
             box_coords = self.canvas.coords(box)
-            box_width = box_coords[2] - box_coords[0]
 
             # Resize the box to accommodate the new number of fields and methods
-            self.canvas.coords(box, box_coords[0], box_coords[1], box_coords[0] + box_width, box_coords[1] + box_height)
+            self.canvas.coords(box, box_coords[0], box_coords[1], box_coords[2], box_coords[1] + box_height)
 
             # Redraw the fields and methods
-            text_fields = []
-            for i, field in enumerate(fields):
-                text_y = box_coords[1] + 50 + i * 20  # Starting below the class name
-                field_text = self.canvas.create_text(box_coords[0] + box_width / 2, text_y, text=f"Field: {field.name}")
-                text_fields.append(field_text)
-
-            text_methods = []
-            for i, method in enumerate(methods):
-                method_params = ', '.join(method.params)
-                text_y = box_coords[1] + 50 + (len(fields) + i) * 20  # Starting below the fields
-                method_text = self.canvas.create_text(box_coords[0] + box_width / 2, text_y,
-                                                    text=f"Method: {method.name}({method_params})")
-                text_methods.append(method_text)
+            text_fields, text_methods = self.drawMembers(box, clazz.fields, clazz.methods)
+            for text in text_fields + text_methods:
+                self.bindBoxItem(text, box, class_id)
 
             # Update the box_positions dictionary to store the new fields and methods
-            self.box_positions[class_name] = {
-                "box": (box, text_class, text_fields, text_methods),
-                "position": self.box_positions[class_name]["position"]
-            }
-        else:
-            self.uiError(f'Class "{class_name}" does not exist.')
+            self.box_positions[class_id]["box"] = (box, text_class, text_fields, text_methods)
 
     # -------------------- Relationship Visuals START ----------------------------------------------------
     
-    def drawRelationshipLine(self, class1, class2, relationship_type):
-        # Ensure the relationship_type is converted from string to Type if necessary
-
-        if isinstance(relationship_type, str):
-            relationship_type = Type.make(relationship_type)
-            if not relationship_type:
-                self.uiError(f"Invalid relationship type: {relationship_type}")
-                return
-            
-        # Draws a relationship line between two classes.
+    # Draws the line of the relationship between two classes, given by their ids
+    def drawRelationshipLine(self, class1, class2):
+        relationship = self.controller.editor.relationships.byIds(class1, class2)
+        if relationship is None:
+            return
+        relationship_type = relationship.typ
         if class1 in self.box_positions and class2 in self.box_positions:
             box1, _, _, _ = self.box_positions[class1]["box"]
             box2, _, _, _ = self.box_positions[class2]["box"]
@@ -697,37 +702,15 @@ class GUI(ui_interface.UI):
         
         return triangle
     
-    def updateRelationshipLines(self, class_name):
-        # Get the relationships associated with the class
-        related_classes = self.controller.findRelationships(class_name)
-
-        # Loop through the related classes
-        for related_class, direction, relationship_type in related_classes:
-            # Convert the relationship type string back to Type before updating, if needed
-            if isinstance(relationship_type, str):
-                relationship_type = Type.make(relationship_type)
-                if not relationship_type:
-                    self.uiError(f"Invalid relationship type: {relationship_type}")
-                    continue
-
-            # Delete and redraw the visual lines for each relationship
-            if (class_name, related_class) in self.relationship_lines:
-                # Delete the existing visual line and shape
-                line, shape = self.relationship_lines[(class_name, related_class)]
-                self.canvas.delete(line)
-                self.canvas.delete(shape)
-
-                # Redraw the relationship line
-                self.drawRelationshipLine(class_name, related_class, relationship_type)
-
-            elif (related_class, class_name) in self.relationship_lines:
-                # Delete the existing visual line and shape for the inverse direction
-                line, shape = self.relationship_lines[(related_class, class_name)]
-                self.canvas.delete(line)
-                self.canvas.delete(shape)
-
-                # Redraw the relationship line
-                self.drawRelationshipLine(related_class, class_name, relationship_type)
+    def updateRelationshipLines(self, class_id):
+        # Get the relationships associated with the class from the editor's adjacency index
+        relationships = self.controller.editor.relationships
+
+        # Delete and redraw the visual lines for each relationship
+        for (src, dst) in relationships.idPairs(class_id):
+            if (src, dst) in self.relationship_lines:
+                self.deleteRelationshipLine(src, dst)
+                self.drawRelationshipLine(src, dst)
 
     # ------------------- HELP BUTTON FUNCTION ------------------------------------------------------------
 
@@ -774,10 +757,16 @@ class GUI(ui_interface.UI):
         change: Specifies a new list of parameters for a method
 
     Save Command:
-        Saves to a JSON format
+        Saves to a JSON format, or to a compact binary format for .umlb files
+        Adding .gz, .bz2 or .xz to a name compresses the file
+        .db, .sqlite and .sqlite3 files are SQLite databases, which every
+        later change is written to right away
+        Names ending in .umlproj are project folders, split into one file
+        per group of classes. Saving again only rewrites the changed groups
 
     Load Command:
-        Loads from a JSON format
+        Loads from a JSON format, the binary format, or a compressed file
+        A project is loaded by choosing its manifest.json
         """
 
         # Insert the help content into the text box
@@ -802,20 +791,22 @@ class GUI(ui_interface.UI):
         y_center = (coords[1] + coords[3]) / 2  # The y-coordinate of the vertical center
         return x_left, y_center
 
-    def on_box_click(self, event, item):
+    def on_box_click(self, event, item, class_id=None):
         # Called when the user clicks on a box. Store the selected item and the offset
         self.selected_item = item
+        self.selected_class = class_id
+        self.drag_start = self.box_positions.get(class_id, {}).get("position")
         self.offset_x = event.x - self.canvas.coords(item)[0]
         self.offset_y = event.y - self.canvas.coords(item)[1]
 
-    def on_box_drag(self, event, class_name):
+    def on_box_drag(self, event, class_id):
         # Called when the user drags a box. Update the position of the selected item and its text.
         if self.selected_item:
             x = event.x - self.offset_x
             y = event.y - self.offset_y
 
             # Move the box
-            box, text_class, text_fields, text_methods = self.box_positions[class_name]["box"]
+            box, text_class, text_fields, text_methods = self.box_positions[class_id]["box"]
             box_coords = self.canvas.coords(box)
             box_width = box_coords[2] - box_coords[0]
             box_height = box_coords[3] - box_coords[1]
@@ -837,37 +828,31 @@ class GUI(ui_interface.UI):
                 self.canvas.coords(text_method, x + box_width / 2, text_y)
 
             # Update the position in the box_positions dictionary
-            self.box_positions[class_name]["position"] = (x, y)
+            self.box_positions[class_id]["position"] = (x, y)
 
             # Continuously update the relationship lines as the box moves
-            self.updateRelationshipLines(class_name)
-
-            # Continuously update the relationship lines as the box moves
-            if class_name:
-                self.updateRelationshipLines(class_name)
+            self.updateRelationshipLines(class_id)
 
     def on_box_release(self, event):
         # Called when the user releases the mouse after dragging a box
         if self.selected_item:
-            class_name = None
-            # Find the class name associated with the selected item
-            for name, data in self.box_positions.items():
-                box, _, _, _ = data["box"]
-                if box == self.selected_item:
-                    class_name = name
-                    break
-
             # Update the relationship lines connected to the moved box
-            if class_name:
-                self.updateRelationshipLines(class_name)
+            if self.selected_class is not None:
+                self.updateRelationshipLines(self.selected_class)
+                # The model keeps the layout, so saves see where the box went
+                position = self.box_positions.get(self.selected_class, {}).get("position")
+                if position != self.drag_start:
+                    self.controller.editor.moveClass(self.selected_class, position)
             
             self.selected_item = None
+            self.selected_class = None
 
 # -------------- SAVE/LOAD FUNCIONS START ----------------------------------------------------------------    
     
     def updateBoxPosition(self, class_name, x, y):
-        if class_name in self.box_positions:
-            box, text_class, text_fields, text_methods = self.box_positions[class_name]["box"]
+        class_id = self.classId(class_name)
+        if class_id in self.box_positions:
+            box, text_class, text_fields, text_methods = self.box_positions[class_id]["box"]
 
             # Move the box and all associated texts to the new position
             box_width = self.canvas.coords(box)[2] - self.canvas.coords(box)[0]
@@ -884,7 +869,7 @@ class GUI(ui_interface.UI):
                 self.canvas.coords(text_method, x + box_width / 2, text_y)
 
             # Update the stored position
-            self.box_positions[class_name]["position"] = (x, y)
+            self.box_positions[class_id]["position"] = (x, y)
 
     # -------------- DIAGNOSTIC FUNCTIONS START ----------------------------------------------------------------
 
@@ -893,11 +878,11 @@ class GUI(ui_interface.UI):
         return filename
     
     def uiChooseSaveLocation(self) -> str:
-        filename = tk.filedialog.asksaveasfilename(title="Select a File", filetypes=[("JSON files", "*.JSON")])
+        filename = tk.filedialog.asksaveasfilename(title="Select a File", filetypes=DIAGRAM_FILETYPES)
         return filename
 
     def uiChooseLoadLocation(self) -> str:
-        filename = tk.filedialog.askopenfilename(title="Select a File", filetypes=[("JSON files", "*.JSON")])
+        filename = tk.filedialog.askopenfilename(title="Select a File", filetypes=DIAGRAM_FILETYPES)
         return filename
 
     def uiFeedback(self, text: str):
@@ -909,7 +894,14 @@ class GUI(ui_interface.UI):
             tk.messagebox.showerror("Error", text)
     
     def uiRun(self):
+        self.root.after(AUTOSAVE_POLL_MS, self.autosaveTick)
         self.root.mainloop()
+
+    # Lets the controller autosave about once a second. It only writes once
+    # the autosave interval has passed, see EditorController.autosave
+    def autosaveTick(self):
+        self.controller.autosave()
+        self.root.after(AUTOSAVE_POLL_MS, self.autosaveTick)
     
     def uiQuery(self, prompt: str) -> str:
         return tk.simpledialog.askstring("Input", prompt)
@@ -33,23 +33,48 @@ class UI:
     def updateAccess(self):
         pass
     
-    def addClassBox(self, name: str):
+    # Called by the controller with the editor it works on. The GUI subscribes
+    # to the editor's change events here and redraws from them
+    def attachEditor(self, editor: Editor):
         pass
 
-    def deleteClassBox(self, name: str):
+    def uiChooseCanvasLocation(self) -> str:
         pass
 
-    def renameClassBox(self, name: str, rename: str):
-        pass
+    # Where the view drew the classes that have no position, by class id
+    def defaultPositions(self) -> dict:
+        return {}
 
-    def drawRelationshipLine(self, class1: str, class2: str, typename: str):
-        pass
+# Stands in for a UI while the controller runs a transaction
+# Per-item feedback is dropped, errors are kept to be reported once, and
+# graying out buttons waits until the transaction ends. Anything else goes
+# straight to the real UI, so this does not inherit the empty methods of UI,
+# and is not an instance of the real UI's class, see EditorController.inCLI
+class DeferredUI:
+    def __init__(self, ui: UI):
+        self.ui = ui
+        self.errors = []
+        self.access_changed = False
 
-    def deleteRelationshipLine(self, class1: str, class2: str):
-        pass
-    
-    def updateAttributesBox(self, class1: str):
-        pass
+    def __getattr__(self, name):
+        return getattr(self.ui, name)
 
-    def uiChooseCanvasLocation(self) -> str:
+    def uiFeedback(self, text: str):
         pass
+
+    def uiError(self, text: str):
+        self.errors.append(text)
+
+    def updateAccess(self):
+        self.access_changed = True
+
+    def defaultPositions(self) -> dict:
+        return self.ui.defaultPositions()
+
+    # Passes what was held back on to the real UI
+    def finish(self):
+        if self.errors:
+            more = len(self.errors) - 1
+            self.ui.uiError(self.errors[0] + (f' (and {more} more errors)' if more else ''))
+        if self.access_changed:
+            self.ui.updateAccess()